@@ -4,6 +4,7 @@ from datetime import datetime, timedelta
 from database.database_config import get_analytics_db
 from database.analytics_model import Analytics
 from environment.config import ANALYTICS_COLLECTION_NAME
+from utils.tracing import STAGES
 
 async def create_analytics_record(analytics: Analytics) -> dict:
     """Create a new analytics record"""
@@ -83,6 +84,18 @@ async def count_analytics_records(
     
     return await collection.count_documents(query)
 
+def round_ms(value):
+    return round(value, 2) if value is not None else None
+
+def stage_averages(group: dict) -> dict:
+    """Stages that have timings in the group, e.g. {"db": 3.1, "encode": 0.4}"""
+    averages = {}
+    for stage in STAGES:
+        value = group.get(f"avg_{stage}_time")
+        if value is not None:
+            averages[stage] = round(value, 2)
+    return averages
+
 async def get_analytics_summary(
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
@@ -112,6 +125,7 @@ async def get_analytics_summary(
                 "total_requests": {"$sum": 1},
                 "total_bandwidth": {"$sum": "$total_bandwidth"},
                 "avg_response_time": {"$avg": "$response_time_ms"},
+                **{f"avg_{stage}_time": {"$avg": f"${stage}_time_ms"} for stage in STAGES},
                 "requests_by_method": {
                     "$push": "$method"
                 },
@@ -134,11 +148,33 @@ async def get_analytics_summary(
             "average_response_time_ms": None,
             "requests_by_method": {},
             "requests_by_status": {},
-            "requests_by_endpoint": {}
+            "requests_by_endpoint": {},
+            "average_stage_time_ms": {},
+            "latency_by_endpoint": {}
         }
     
     data = result[0]
     
+    # Average time per stage and endpoint, records from before stage timing have no stage fields
+    endpoint_pipeline = [
+        {"$match": match_query},
+        {
+            "$group": {
+                "_id": "$path",
+                "requests": {"$sum": 1},
+                "avg_response_time": {"$avg": "$response_time_ms"},
+                **{f"avg_{stage}_time": {"$avg": f"${stage}_time_ms"} for stage in STAGES}
+            }
+        }
+    ]
+    latency_by_endpoint = {}
+    async for endpoint in collection.aggregate(endpoint_pipeline):
+        latency_by_endpoint[endpoint["_id"]] = {
+            "requests": endpoint["requests"],
+            "average_response_time_ms": round_ms(endpoint.get("avg_response_time")),
+            "average_stage_time_ms": stage_averages(endpoint)
+        }
+    
     # Count occurrences
     method_counts = {}
     for method in data.get("requests_by_method", []):
@@ -158,7 +194,9 @@ async def get_analytics_summary(
         "average_response_time_ms": data.get("avg_response_time"),
         "requests_by_method": method_counts,
         "requests_by_status": status_counts,
-        "requests_by_endpoint": endpoint_counts
+        "requests_by_endpoint": endpoint_counts,
+        "average_stage_time_ms": stage_averages(data),
+        "latency_by_endpoint": latency_by_endpoint
     }
 
 async def get_bandwidth_stats(
@@ -7,5 +7,8 @@ EXCLUDE_PATHS = [
     "/api/analytics",
     "/static",
     "/page",
-    "/cleanup"
+    "/cleanup",
+    "/api/shimeji/events",
+    "/api/shimeji/files",
+    "/api/profiles"
 ]
\ No newline at end of file
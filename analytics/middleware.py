@@ -7,11 +7,14 @@ from database.analytics_model import Analytics
 import analytics.crud as analytics_db
 import asyncio
 from analytics.excluded_paths import EXCLUDE_PATHS
+from utils.tracing import collect_spans, collect_stages, server_timing, STAGES
 
 class AnalyticsMiddleware(BaseHTTPMiddleware):
     """
     Middleware to track API requests and bandwidth usage.
     Records request count, request/response sizes, and response times.
+    Time spent in MongoDB, the worker pools and response encoding is collected
+    per request, stored on the record and sent in the Server-Timing header.
     """
     
     def __init__(self, app: ASGIApp, exclude_paths: list = None):
@@ -19,6 +22,22 @@ class AnalyticsMiddleware(BaseHTTPMiddleware):
         # Paths to exclude from analytics (e.g., health checks, docs)
         self.exclude_paths = exclude_paths or EXCLUDE_PATHS
     
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await super().__call__(scope, receive, send)
+        
+        # Count the request body as the endpoint reads it, chunked uploads are never buffered here
+        received = {"bytes": 0}
+        
+        async def counting_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                received["bytes"] += len(message.get("body", b""))
+            return message
+        
+        scope["analytics.received"] = received
+        await super().__call__(scope, counting_receive, send)
+    
     async def dispatch(self, request: Request, call_next: Callable) -> Response:
         # Skip analytics for excluded paths
         if any(request.url.path.startswith(path) for path in self.exclude_paths):
@@ -36,29 +55,22 @@ class AnalyticsMiddleware(BaseHTTPMiddleware):
         # Get user agent
         user_agent = request.headers.get("user-agent")
         
-        # Calculate request size
-        request_size = 0
+        # Calculate request size, without content-length it is counted once the endpoint has read the body
+        request_size = None
         if "content-length" in request.headers:
             try:
                 request_size = int(request.headers["content-length"])
             except ValueError:
                 pass
-        else:
-            # If no content-length, read body to calculate size
-            # Note: This will consume the body, so we need to store it
-            body_bytes = await request.body()
-            request_size = len(body_bytes)
-            
-            # Recreate request with body for downstream processing
-            async def receive():
-                return {"type": "http.request", "body": body_bytes}
-            request._receive = receive
         
-        # Process request
-        response = await call_next(request)
+        # Process request, the endpoint's tasks share the span list and stage totals
+        with collect_spans() as spans, collect_stages() as stages:
+            response = await call_next(request)
+        stages.finish_encode()
         
         # Calculate response time
         response_time = (time.time() - start_time) * 1000  # Convert to milliseconds
+        response.headers["Server-Timing"] = server_timing(stages, spans, response_time)
         
         # Calculate response size
         response_size = 0
@@ -68,41 +80,49 @@ class AnalyticsMiddleware(BaseHTTPMiddleware):
             except ValueError:
                 pass
         
-        # If no content-length header, we need to read the response body
-        if response_size == 0:
-            response_body = b""
-            async for chunk in response.body_iterator:
-                response_body += chunk
-            response_size = len(response_body)
+        def record(response_size: int):
+            request_bytes = request_size
+            if request_bytes is None:
+                request_bytes = request.scope["analytics.received"]["bytes"]
+            
+            # Calculate total bandwidth
+            total_bandwidth = request_bytes + response_size
             
-            # Recreate response with body so it can be returned
-            from starlette.responses import Response as StarletteResponse
-            response = StarletteResponse(
-                content=response_body,
+            # Create analytics record
+            analytics_record = Analytics(
+                method=request.method,
+                path=request.url.path,
                 status_code=response.status_code,
-                headers=dict(response.headers),
-                media_type=response.media_type
+                request_size=request_bytes,
+                response_size=response_size,
+                total_bandwidth=total_bandwidth,
+                client_ip=client_ip,
+                user_agent=user_agent,
+                response_time_ms=round(response_time, 2),
+                **{f"{stage}_time_ms": ms for stage, ms in stages.rounded().items() if stage in STAGES}
             )
+            
+            # Store analytics asynchronously (don't block response)
+            # Use asyncio.create_task to run in background
+            asyncio.create_task(analytics_db.create_analytics_record(analytics_record))
         
-        # Calculate total bandwidth
-        total_bandwidth = request_size + response_size
-        
-        # Create analytics record
-        analytics_record = Analytics(
-            method=request.method,
-            path=request.url.path,
-            status_code=response.status_code,
-            request_size=request_size,
-            response_size=response_size,
-            total_bandwidth=total_bandwidth,
-            client_ip=client_ip,
-            user_agent=user_agent,
-            response_time_ms=round(response_time, 2)
-        )
+        # If no content-length header, count the body while it streams to the client
+        # instead of buffering it, streamed downloads stay constant memory
+        if response_size == 0:
+            body_iterator = response.body_iterator
+            
+            async def counting_iterator():
+                streamed_size = 0
+                try:
+                    async for chunk in body_iterator:
+                        streamed_size += len(chunk)
+                        yield chunk
+                finally:
+                    record(streamed_size)
+            
+            response.body_iterator = counting_iterator()
+            return response
         
-        # Store analytics asynchronously (don't block response)
-        # Use asyncio.create_task to run in background
-        asyncio.create_task(analytics_db.create_analytics_record(analytics_record))
+        record(response_size)
         
         return response
-
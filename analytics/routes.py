@@ -3,8 +3,9 @@ from typing import List, Optional
 from datetime import datetime, timedelta
 from database.analytics_model import AnalyticsSummary
 import analytics.crud as analytics_db
+from utils.timed_route import TimedRoute
 
-router = APIRouter(prefix="/api/analytics", tags=["analytics"])
+router = APIRouter(prefix="/api/analytics", tags=["analytics"], route_class=TimedRoute)
 
 @router.get("/", response_model=dict)
 async def get_analytics(
@@ -0,0 +1,127 @@
+"""
+Peak memory and time of frame decoding: the previous bytes + BytesIO + PIL path
+(read_image + convert_to_cv2Image, and encode_frame) against the decode from an mmap
+of the file. The "decode" stage only decodes, "ingest" also encodes the WebP outputs,
+where the libwebp encoder's own working memory dominates the peak.
+Each variant runs in a fresh subprocess so peak RSS is measured per variant.
+
+Usage: python benchmarks/decode_bench.py [--size 2048] [--repeat 5]
+"""
+import argparse
+import json
+import mmap
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def make_frame(path, side):
+    import numpy as np
+    from PIL import Image
+
+    # a transparent sprite: opaque noisy figure on a clear background
+    rng = np.random.default_rng(0)
+    pixels = np.zeros((side, side, 4), dtype=np.uint8)
+    inner = slice(side // 8, side - side // 8)
+    pixels[inner, inner, :3] = rng.integers(0, 255, (side - 2 * (side // 8),) * 2 + (3,), dtype=np.uint8)
+    pixels[inner, inner, 3] = 255
+    Image.fromarray(pixels, "RGBA").save(path)
+
+def previous_encode_frame(content):
+    from PIL import Image, ImageOps
+    from environment.config import IMAGE_RENDITIONS, IMAGE_RENDITION_QUALITY
+    from utils.preprocess_image import encode_webp, has_alpha
+
+    with Image.open(BytesIO(content)) as image:
+        image = ImageOps.exif_transpose(image)
+        image = image.convert("RGBA" if has_alpha(image) else "RGB")
+
+    outputs = [encode_webp("original", image, lossless=True, quality=100, exact=True)]
+    for label, max_side in IMAGE_RENDITIONS.items():
+        if max(image.size) <= max_side:
+            continue
+        rendition = image.copy()
+        rendition.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+        outputs.append(encode_webp(label, rendition, quality=IMAGE_RENDITION_QUALITY))
+    return outputs
+
+def previous_decode(content):
+    import cv2
+    import numpy as np
+    from PIL import Image, ImageOps
+
+    image = Image.open(BytesIO(content))
+    image = ImageOps.exif_transpose(image)
+    image = image.convert("RGBA")
+    return cv2.cvtColor(np.array(image), cv2.COLOR_RGBA2BGRA)
+
+def run_variant(variant, stage, path, repeat):
+    from utils.preprocess_image import encode_frame, decode_array
+
+    previous = previous_decode if stage == "decode" else previous_encode_frame
+    current = decode_array if stage == "decode" else encode_frame
+
+    # load the codecs once on a small frame so their setup is not counted
+    with tempfile.TemporaryDirectory() as folder:
+        warmup = os.path.join(folder, "warmup.png")
+        make_frame(warmup, 64)
+        with open(warmup, "rb") as f:
+            content = f.read()
+        previous(content)
+        current(memoryview(content))
+
+    baseline_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    start = time.perf_counter()
+    for _ in range(repeat):
+        if variant == "previous":
+            with open(path, "rb") as f:
+                previous(f.read())
+        else:
+            with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                view = memoryview(mapped)
+                current(view)
+                view.release()
+    elapsed = time.perf_counter() - start
+
+    # ru_maxrss is in kilobytes on Linux
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({
+        "variant": variant,
+        "stage": stage,
+        "seconds_per_frame": round(elapsed / repeat, 3),
+        "peak_rss_mb": round(peak_mb, 1),
+        "peak_above_imports_mb": round(peak_mb - baseline_mb, 1),
+    }))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=2048)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--variant", choices=["previous", "zero_copy"])
+    parser.add_argument("--stage", choices=["decode", "ingest"])
+    parser.add_argument("--frame")
+    args = parser.parse_args()
+
+    if args.variant:
+        run_variant(args.variant, args.stage, args.frame, args.repeat)
+        return
+
+    with tempfile.TemporaryDirectory() as folder:
+        frame = os.path.join(folder, "frame.png")
+        make_frame(frame, args.size)
+        for stage in ("decode", "ingest"):
+            for variant in ("previous", "zero_copy"):
+                subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--variant", variant, "--stage", stage,
+                     "--frame", frame, "--repeat", str(args.repeat)],
+                    cwd=ROOT, check=True,
+                )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Import-time budget of main:app. Imports the app in fresh interpreters with
+python -X importtime and reports the median time and the top-level packages
+that cost the most.
+
+Fails with status 1 when
+  - a module that must load lazily (cv2, numpy, PIL, pillow_heif) is imported
+    with the app, which is machine independent and safe to run in CI
+  - the median import time exceeds --budget-ms
+  - a baseline exists and the median grew by more than --tolerance.
+    Baselines are machine specific, keep one per host like load_bench.py
+
+Usage: python benchmarks/import_budget.py [--runs 7] [--budget-ms 1500]
+           [--baseline benchmarks/import_baseline.json] [--save-baseline]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# loaded by the image worker pool on first use, never by importing the app
+LAZY_MODULES = ("cv2", "numpy", "PIL", "pillow_heif")
+
+def import_once(work_dir):
+    """Returns the cumulative import time of main in microseconds and the self time per module"""
+    # importing main creates the static and templates folders, keep them out of the repo
+    env = {**os.environ, "PYTHONPATH": ROOT}
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=work_dir, env=env, capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"Importing main failed:\n{completed.stderr[-2000:]}")
+
+    total = None
+    modules = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = int(self_us)
+        if name.rstrip() == " main":
+            total = int(cumulative_us)
+    if total is None:
+        raise RuntimeError("main is missing from the -X importtime output")
+    return total, modules
+
+def by_package(modules):
+    packages = Counter()
+    for name, self_us in modules.items():
+        packages[name.split(".")[0]] += self_us
+    return packages
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--budget-ms", type=float, help="fail when the median import time exceeds this")
+    parser.add_argument("--top", type=int, default=15, help="packages listed by import time")
+    parser.add_argument("--baseline", default=os.path.join(ROOT, "benchmarks", "import_baseline.json"))
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    totals = []
+    packages = Counter()
+    with tempfile.TemporaryDirectory() as work_dir:
+        # the first run fills the bytecode cache and is not counted
+        import_once(work_dir)
+        for _ in range(args.runs):
+            total, modules = import_once(work_dir)
+            totals.append(total)
+            packages.update(by_package(modules))
+
+    median_ms = round(statistics.median(totals) / 1000, 1)
+    print(f"{'package':<24}{'self ms':>10}")
+    for package, self_us in packages.most_common(args.top):
+        print(f"{package:<24}{self_us / args.runs / 1000:>10.1f}")
+    print(f"import main: median {median_ms} ms over {args.runs} runs, min {min(totals) / 1000:.1f} max {max(totals) / 1000:.1f}")
+
+    failures = []
+    eager = [module for module in LAZY_MODULES if module in packages]
+    if eager:
+        failures.append(f"loaded with the app: {', '.join(eager)}")
+    if args.budget_ms and median_ms > args.budget_ms:
+        failures.append(f"median {median_ms} ms exceeds the budget of {args.budget_ms} ms")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump({"python": sys.version.split()[0], "median_ms": median_ms}, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline["python"] != sys.version.split()[0]:
+            print("Baseline was recorded with a different Python, not comparing")
+        elif median_ms > baseline["median_ms"] * (1 + args.tolerance):
+            failures.append(f"median {baseline['median_ms']} -> {median_ms} ms")
+
+    for failure in failures:
+        print(f"REGRESSION {failure}")
+    if failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
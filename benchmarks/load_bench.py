@@ -0,0 +1,428 @@
+"""
+End-to-end load test of main:app. A server subprocess seeds a catalog of
+categories, assets with many frames and analytics records. It then serves the
+app with uvicorn against a local mongod or the in-memory mongomock-motor
+stand-in. Each scenario runs on its own, drives one endpoint at its
+concurrency, and reports throughput and p50/p90/p99 latency.
+
+With --save-baseline the results are stored as the baseline. Later runs are
+compared against it and exit with status 1 when a scenario loses more than
+--tolerance of its throughput or gains as much p99 latency. Baselines are
+machine specific, keep one per benchmark host.
+Needs the pinned packages of requirements-bench.txt.
+
+Usage: python benchmarks/load_bench.py [--mongo mongodb://localhost:27017]
+           [--categories 300] [--assets 3000] [--frames 48] [--scenarios get_assets,view]
+           [--baseline benchmarks/load_baseline.json] [--save-baseline] [--output results.json]
+"""
+import argparse
+import asyncio
+import hashlib
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# name: (method, concurrency, requests), add_assets encodes every frame so it runs fewer and narrower
+SCENARIOS = {
+    "get_categories": ("GET", 32, 2000),
+    "get_assets": ("GET", 32, 1000),
+    "view": ("PUT", 32, 2000),
+    "add_assets": ("POST", 4, 40),
+    "analytics_list": ("GET", 16, 500),
+    "analytics_summary": ("GET", 8, 100),
+    "analytics_bandwidth": ("GET", 8, 100),
+}
+WARMUP_REQUESTS = 10
+READY_TIMEOUT_SECONDS = 600
+
+#============================================================================
+# Server process
+#============================================================================
+
+def use_mongo_stand_in():
+    """One shared mongomock-motor client, the lifespan's connect_to_mongo gets the seeded one"""
+    import mongomock.collection
+    from mongomock_motor import AsyncMongoMockClient
+    from database import database_config
+
+    # mongomock does not know the sort argument pymongo 4.16 passes to bulk updates,
+    # requirements-bench.txt pins both, recheck this when upgrading either
+    add_update = mongomock.collection.BulkOperationBuilder.add_update
+    def add_update_without_sort(self, *args, sort=None, **kwargs):
+        return add_update(self, *args, **kwargs)
+    mongomock.collection.BulkOperationBuilder.add_update = add_update_without_sort
+
+    client = AsyncMongoMockClient()
+    database_config.create_client = lambda: client
+
+def frame_entry(rng, index):
+    from environment import config
+    from utils.blob_store import blob_url
+
+    def blob():
+        sha256 = hashlib.sha256(rng.randbytes(16)).hexdigest()
+        return sha256, blob_url(f"{sha256}.{config.IMAGE_FORMAT}")
+
+    sha256, url = blob()
+    renditions = {}
+    for label, side in config.IMAGE_RENDITIONS.items():
+        _, rendition_url = blob()
+        renditions[label] = {"url": rendition_url, "size": rng.randint(2000, 8000), "width": side, "height": side}
+    return {
+        "name": f"shime{index + 1}",
+        "url": url,
+        "sha256": sha256,
+        "size": rng.randint(8000, 40000),
+        "width": 512,
+        "height": 512,
+        "format": config.IMAGE_FORMAT,
+        "phash": rng.randbytes(8).hex(),
+        "dhash": rng.randbytes(8).hex(),
+        "renditions": renditions
+    }
+
+async def seed(categories, assets, frames, analytics_records):
+    from datetime import datetime, timedelta
+    from environment import config
+    from database.database_config import db, create_client, get_assets_db, get_analytics_db
+    from database.assets_model import Category, Asset
+    from database.analytics_model import Analytics
+    from database.revisions import stamp_new_documents
+
+    db.client = create_client()
+    await db.client.drop_database(config.ASSETS_DATABASE_NAME)
+    await db.client.drop_database(config.ANALYTICS_DATABASE_NAME)
+    assets_db = get_assets_db()
+    rng = random.Random(0)
+
+    documents = [Category(name=f"Category {i}", is_enabled=True).model_dump() for i in range(categories)]
+    await stamp_new_documents(documents)
+    result = await assets_db[config.CATEGORIES_COLLECTION_NAME].insert_many(documents)
+    category_ids = [str(category_id) for category_id in result.inserted_ids]
+
+    asset_ids = []
+    for start in range(0, assets, 250):
+        documents = []
+        for i in range(start, min(start + 250, assets)):
+            entries = [frame_entry(rng, index) for index in range(frames)]
+            documents.append(Asset(
+                category_id=category_ids[i % categories],
+                name=f"Character {i}",
+                thumbnail_url=entries[0]["renditions"].get("small", entries[0])["url"],
+                is_enabled=True,
+                views=rng.randint(0, 100000),
+                blobs=[entry["sha256"] for entry in entries],
+                moreFields={
+                    "actionFile": entries[0]["url"].replace(f".{config.IMAGE_FORMAT}", ".xml"),
+                    "behaviorFile": entries[1 % frames]["url"].replace(f".{config.IMAGE_FORMAT}", ".xml"),
+                    "assets": entries,
+                    "atlas": None,
+                    "compiledConfig": None
+                }
+            ).model_dump())
+        await stamp_new_documents(documents)
+        result = await assets_db[config.ASSETS_COLLECTION_NAME].insert_many(documents)
+        asset_ids.extend(str(asset_id) for asset_id in result.inserted_ids)
+
+    paths = ["/api/shimeji/get_categories", "/api/shimeji/get_assets", "/api/shimeji/updateAsset", "/api/shimeji/add_assets"]
+    now = datetime.utcnow()
+    for start in range(0, analytics_records, 5000):
+        records = []
+        for _ in range(start, min(start + 5000, analytics_records)):
+            request_size, response_size = rng.randint(0, 2000), rng.randint(200, 500000)
+            records.append(Analytics(
+                timestamp=now - timedelta(seconds=rng.randint(0, 7 * 24 * 3600)),
+                method=rng.choice(["GET", "GET", "GET", "PUT", "POST"]),
+                path=rng.choice(paths),
+                status_code=rng.choice([200] * 18 + [404, 500]),
+                request_size=request_size,
+                response_size=response_size,
+                total_bandwidth=request_size + response_size,
+                client_ip=f"10.0.{rng.randint(0, 255)}.{rng.randint(1, 254)}",
+                user_agent="load-bench",
+                response_time_ms=round(rng.expovariate(1 / 40), 2)
+            ).model_dump(exclude={"id"}))
+        await get_analytics_db()[config.ANALYTICS_COLLECTION_NAME].insert_many(records)
+
+    return {"category_ids": category_ids, "asset_ids": asset_ids}
+
+def serve(args):
+    from environment import config
+
+    # set before anything imports database_config, which copies these names.
+    # The _bench databases keep a shared mongod's real catalog untouched
+    config.ASSETS_DATABASE_NAME = f"{config.ASSETS_DATABASE_NAME}_bench"
+    config.ANALYTICS_DATABASE_NAME = f"{config.ANALYTICS_DATABASE_NAME}_bench"
+    if args.mongo != "memory":
+        config.MONGODB_URL = args.mongo
+    else:
+        use_mongo_stand_in()
+
+    import uvicorn
+
+    started = time.perf_counter()
+    manifest = asyncio.run(seed(args.categories, args.assets, args.frames, args.analytics_records))
+    print(f"Seeded {args.categories} categories, {args.assets} assets and {args.analytics_records} analytics records in {time.perf_counter() - started:.1f}s", flush=True)
+    with open(args.manifest, "w") as f:
+        json.dump(manifest, f)
+
+    import main
+    uvicorn.run(main.app, host="127.0.0.1", port=args.port, log_level="warning", access_log=False)
+
+#============================================================================
+# Load driver
+#============================================================================
+
+def make_pack(seed_value, frames):
+    """add_assets form fields and files, frames differ per pack so nothing is deduplicated"""
+    import numpy as np
+    from PIL import Image
+
+    rng = np.random.default_rng(seed_value)
+    files = []
+    for index in range(frames):
+        pixels = np.zeros((128, 128, 4), dtype=np.uint8)
+        pixels[16:112, 16:112] = rng.integers(0, 255, (96, 96, 4), dtype=np.uint8)
+        pixels[16:112, 16:112, 3] = 255
+        buffer = io.BytesIO()
+        Image.fromarray(pixels, "RGBA").save(buffer, "PNG")
+        files.append(("images", (f"shime{index + 1}.png", buffer.getvalue(), "image/png")))
+    poses = "".join(f'<Pose Image="/shime{index + 1}.png" ImageAnchor="64,128" Velocity="0,0" Duration="6"/>' for index in range(frames))
+    actions = f'<?xml version="1.0"?><Mascot xmlns="http://www.group-finity.com/Mascot"><ActionList><Action Name="Walk" Type="Move"><Animation>{poses}</Animation></Action></ActionList></Mascot>'
+    behaviors = '<?xml version="1.0"?><Mascot xmlns="http://www.group-finity.com/Mascot"><BehaviorList><Behavior Name="Walk" Frequency="100"/></BehaviorList></Mascot>'
+    files += [
+        ("thumbnail", ("thumb.png", files[0][1][1], "image/png")),
+        ("actionFile", ("actions.xml", actions.encode(), "text/xml")),
+        ("behaviorFile", ("behaviors.xml", behaviors.encode(), "text/xml"))
+    ]
+    return files
+
+def request_factory(name, manifest, args):
+    rng = random.Random(name)
+    category_ids, asset_ids = manifest["category_ids"], manifest["asset_ids"]
+    if name == "get_categories":
+        return lambda: {"url": "/api/shimeji/get_categories"}
+    if name == "get_assets":
+        return lambda: {"url": "/api/shimeji/get_assets", "params": {"category_id": rng.choice(category_ids)}}
+    if name == "view":
+        return lambda: {"url": "/api/shimeji/updateAsset", "params": {"frame_id": rng.choice(asset_ids), "requiredFunction": "view"}}
+    if name == "add_assets":
+        packs = [make_pack(seed_value, args.pack_frames) for seed_value in range(SCENARIOS[name][1])]
+        counter = iter(range(10 ** 9))
+        def add_assets():
+            i = next(counter)
+            return {
+                "url": "/api/shimeji/add_assets",
+                "data": {"categoryId": category_ids[0], "categoryName": "Category 0", "characterName": f"Bench {i}"},
+                "files": packs[i % len(packs)]
+            }
+        return add_assets
+    if name == "analytics_list":
+        return lambda: {"url": "/api/analytics/", "params": {"limit": 100, "skip": rng.randint(0, 1000)}}
+    if name == "analytics_summary":
+        return lambda: {"url": "/api/analytics/summary", "params": {"days": 7}}
+    if name == "analytics_bandwidth":
+        return lambda: {"url": "/api/analytics/bandwidth", "params": {"days": 7}}
+    raise ValueError(f"Unknown scenario {name}")
+
+def percentile(sorted_values, fraction):
+    # nearest rank
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+async def run_scenario(client, name, method, concurrency, requests, make_request):
+    async def send():
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, **make_request())
+            ok = response.status_code < 400
+        except Exception:
+            ok = False
+        return time.perf_counter() - started, ok
+
+    for _ in range(min(WARMUP_REQUESTS, requests)):
+        await send()
+
+    latencies = []
+    errors = 0
+    remaining = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            latency, ok = await send()
+            latencies.append(latency)
+            if not ok:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    milliseconds = lambda value: round(value * 1000, 2)
+    return {
+        "scenario": name,
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(requests / elapsed, 2),
+        "p50_ms": milliseconds(percentile(latencies, 0.50)),
+        "p90_ms": milliseconds(percentile(latencies, 0.90)),
+        "p99_ms": milliseconds(percentile(latencies, 0.99)),
+        "max_ms": milliseconds(latencies[-1])
+    }
+
+async def drive(args, manifest):
+    import httpx
+
+    results = []
+    limits = httpx.Limits(max_connections=max(SCENARIOS[name][1] for name in args.scenarios))
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", timeout=120, limits=limits) as client:
+        for name in args.scenarios:
+            method, concurrency, requests = SCENARIOS[name]
+            concurrency = args.concurrency or concurrency
+            requests = max(1, int(requests * args.scale))
+            result = await run_scenario(client, name, method, concurrency, requests, request_factory(name, manifest, args))
+            print(json.dumps(result), flush=True)
+            results.append(result)
+    return results
+
+def wait_until_ready(server, port):
+    import httpx
+
+    deadline = time.time() + READY_TIMEOUT_SECONDS
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited with status {server.returncode}")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health/ready", timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError("Server did not become ready")
+
+def compare(results, baseline, tolerance):
+    """Scenarios whose throughput dropped or p99 latency grew by more than tolerance"""
+    previous = {result["scenario"]: result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        before = previous.get(result["scenario"])
+        if not before:
+            continue
+        if result["throughput_rps"] < before["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{result['scenario']}: throughput {before['throughput_rps']} -> {result['throughput_rps']} req/s")
+        if result["p99_ms"] > before["p99_ms"] * (1 + tolerance):
+            regressions.append(f"{result['scenario']}: p99 {before['p99_ms']} -> {result['p99_ms']} ms")
+        if result["errors"] > before["errors"]:
+            regressions.append(f"{result['scenario']}: errors {before['errors']} -> {result['errors']}")
+    return regressions
+
+def print_table(results):
+    print(f"{'scenario':<20}{'conc':>6}{'reqs':>7}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}")
+    for r in results:
+        print(f"{r['scenario']:<20}{r['concurrency']:>6}{r['requests']:>7}{r['errors']:>8}{r['throughput_rps']:>10}{r['p50_ms']:>10}{r['p90_ms']:>10}{r['p99_ms']:>10}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mongo", default="memory", help="mongodb:// URL of a local mongod, or memory for the in-memory stand-in")
+    parser.add_argument("--categories", type=int, default=300)
+    parser.add_argument("--assets", type=int, default=3000)
+    parser.add_argument("--frames", type=int, default=48, help="frames per seeded asset")
+    parser.add_argument("--pack-frames", type=int, default=40, help="frames per add_assets upload")
+    parser.add_argument("--analytics-records", type=int, default=50000)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, help="override the concurrency of every scenario")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplies the request count of every scenario")
+    parser.add_argument("--port", type=int, default=9105)
+    parser.add_argument("--baseline", default=os.path.join(ROOT, "benchmarks", "load_baseline.json"))
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    parser.add_argument("--output")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--manifest", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios {', '.join(sorted(unknown))}")
+
+    if args.serve:
+        serve(args)
+        return
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        manifest_path = os.path.join(work_dir, "manifest.json")
+        command = [
+            sys.executable, os.path.abspath(__file__), "--serve",
+            "--manifest", manifest_path,
+            "--mongo", args.mongo,
+            "--port", str(args.port),
+            "--categories", str(args.categories),
+            "--assets", str(args.assets),
+            "--frames", str(args.frames),
+            "--analytics-records", str(args.analytics_records)
+        ]
+        # the server writes static files and spools into its own scratch directory
+        env = {**os.environ, "PYTHONPATH": ROOT}
+        server = subprocess.Popen(command, cwd=work_dir, env=env)
+        try:
+            wait_until_ready(server, args.port)
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+            results = asyncio.run(drive(args, manifest))
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+
+    report = {
+        "profile": {
+            "mongo": "memory" if args.mongo == "memory" else "mongod",
+            "categories": args.categories,
+            "assets": args.assets,
+            "frames": args.frames,
+            "pack_frames": args.pack_frames,
+            "analytics_records": args.analytics_records,
+            "scale": args.scale,
+            "concurrency": args.concurrency
+        },
+        "results": results
+    }
+    print_table(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline["profile"] != report["profile"]:
+            print("Baseline was recorded with a different profile, not comparing")
+            return
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.baseline}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Compare the original thumbnail path (full decode + LANCZOS + PIL encode) with the
+batch engine in utils/thumbnails.py on synthetic large JPEG and RGBA PNG images.
+Each variant runs in a fresh subprocess so peak RSS is measured per variant.
+
+Usage: python benchmarks/thumbnail_bench.py [--count 16] [--size 3000x2000]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def make_images(folder, count, width, height):
+    import numpy as np
+    from PIL import Image
+
+    rng = np.random.default_rng(0)
+    paths = []
+    for i in range(count):
+        gradient = np.linspace(0, 255, width, dtype=np.uint8)
+        base = np.tile(gradient, (height, 1))
+        noise = rng.integers(0, 32, (height, width), dtype=np.uint8)
+        rgb = np.stack([base, base[::-1] + noise, noise * 4], axis=2)
+        if i % 2 == 0:
+            path = os.path.join(folder, f"image_{i}.jpg")
+            Image.fromarray(rgb, "RGB").save(path, quality=90)
+        else:
+            alpha = np.full((height, width, 1), 255, dtype=np.uint8)
+            alpha[: height // 4] = 0
+            path = os.path.join(folder, f"image_{i}.png")
+            Image.fromarray(np.concatenate([rgb, alpha], axis=2), "RGBA").save(path)
+        paths.append(path)
+    return paths
+
+def run_variant(variant, paths, out_dir):
+    from environment import config
+
+    start = time.perf_counter()
+    if variant == "original":
+        from utils.preprocess_image import create_thumbnail
+        for i, path in enumerate(paths):
+            create_thumbnail(path, os.path.join(out_dir, f"original_{i}.webp"))
+    else:
+        from utils.thumbnails import create_thumbnail_batch
+        jobs = [(path, [(os.path.join(out_dir, f"engine_{i}.webp"), config.THUMBNAIL_SCALE)]) for i, path in enumerate(paths)]
+        for i in range(0, len(jobs), config.THUMBNAIL_BATCH_SIZE):
+            for result in create_thumbnail_batch(jobs[i:i + config.THUMBNAIL_BATCH_SIZE]):
+                if isinstance(result, Exception):
+                    raise result
+    elapsed = time.perf_counter() - start
+
+    # ru_maxrss is in kilobytes on Linux
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({
+        "variant": variant,
+        "images": len(paths),
+        "seconds": round(elapsed, 3),
+        "images_per_second": round(len(paths) / elapsed, 2),
+        "peak_rss_mb": round(peak_rss_mb, 1),
+    }))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=16)
+    parser.add_argument("--size", default="3000x2000")
+    parser.add_argument("--variant", choices=["original", "engine"])
+    parser.add_argument("--images-dir")
+    args = parser.parse_args()
+
+    if args.variant:
+        paths = sorted(os.path.join(args.images_dir, name) for name in os.listdir(args.images_dir))
+        with tempfile.TemporaryDirectory() as out_dir:
+            run_variant(args.variant, paths, out_dir)
+        return
+
+    width, height = (int(v) for v in args.size.split("x"))
+    with tempfile.TemporaryDirectory() as images_dir:
+        make_images(images_dir, args.count, width, height)
+        for variant in ("original", "engine"):
+            subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--variant", variant, "--images-dir", images_dir],
+                cwd=ROOT, check=True,
+            )
+
+if __name__ == "__main__":
+    main()
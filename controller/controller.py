@@ -1,18 +1,44 @@
 import os
+import asyncio
 from bson import ObjectId
 from datetime import datetime
 
-from utils.preprocess_image import create_thumbnail
+from utils.thumbnails import create_thumbnail_batches
+from utils.animation import transcode_gif_async
 
 #loading database functions
 from database.database_config import get_assets_db
 from database.assets_model import Category, Asset
 
-from utils.functions import create_target_Assets_folders, save_files_by_folder,save_single_file_by_folder
+from utils.functions import create_target_Assets_folders, save_files_by_folder, remove_saved_files, validate_upload_sizes, fingerprinted_name
+from utils.phash import hash_stored_image
+from utils.duplicates import find_near_duplicates
+from utils.ingest import ingest_frames, build_character_atlas, parse_pack_configs, compile_pack_configs
+from utils.shimeji_config import parse_stored_config, ConfigError
+from utils.tracing import span
+from utils.blob_store import store_blob, store_blob_data, store_blobs, add_blob_refs, release_blob_refs, key_from_url, blob_path, collect_garbage
+from storage.backends import storage
+from storage.urls import file_url, storage_key_from_url
 
 from environment import config
 
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
 from fastapi import HTTPException
+from fastapi.responses import FileResponse, StreamingResponse
+from urllib.parse import quote
+
+from database.counters import download_counter
+from database.revisions import catalog_write, revision_stamp, stamp_new_documents, changes_since, current_revision
+from events.bus import publish_change
+from inits.executors import io_pool, image_pool
+from starlette.datastructures import UploadFile
+from utils.upload_sessions import (
+    create_session, get_session, receive_chunk, verify_session, part_path, remove_session,
+    claim_finalize, release_finalize, complete_finalize
+)
+from utils.bundle import bundle_entries, bundle_version, cached_bundle_path, missing_files, iter_zip, build_cached_bundle
 
 CREATE_THUMBNAILS = False
 
@@ -24,55 +50,161 @@ async def add_categories(
     try:
         db = get_assets_db()
         collection = db[config.CATEGORIES_COLLECTION_NAME]
+
+        results = []
+        category_models = []
+        # (category name, storage keys, whether this request created the files) per item sent to insert
+        stored_items = []
         
         if has_images:
             # Images Recieved
             print("Images Recieved")
-            await save_files_by_folder(config.SHIMEJI_CATEGORIES_ORIGINAL_DIR, images)
-            for image in images:
+            # file names carry the content hash so the urls never change meaning
+            with span("save_files"):
+                saved = await save_files_by_folder(config.SHIMEJI_CATEGORIES_ORIGINAL_DIR, images, fingerprint=True)
+
+            # create all thumbnails in batches in the image worker pool
+            thumbnail_jobs = []
+            thumbnail_paths = []
+            for image, saved_file in zip(images, saved["files"]):
+                thumbnailpath = os.path.join(
+                    config.SHIMEJI_CATEGORIES_THUMBNAIL_DIR,
+                    fingerprinted_name(image.filename, saved_file["sha256"], f".{config.IMAGE_FORMAT}")
+                )
+                thumbnail_paths.append(thumbnailpath)
+                thumbnail_jobs.append((saved_file["path"], [(thumbnailpath, config.THUMBNAIL_SCALE)]))
+            with span("thumbnails"):
+                thumbnail_results = await create_thumbnail_batches(thumbnail_jobs, config.THUMBNAIL_BATCH_SIZE)
+
+            for image, saved_file, thumbnailpath, thumbnail_result in zip(images, saved["files"], thumbnail_paths, thumbnail_results):
                 filename = image.filename
                 category_name = filename.split(".")[0]
-                filepath = os.path.join(config.SHIMEJI_CATEGORIES_ORIGINAL_DIR, filename)
-                thumbnailpath = os.path.join(config.SHIMEJI_CATEGORIES_THUMBNAIL_DIR, filename)
-
-                #create thumbnail and make url
-                create_thumbnail(filepath, thumbnailpath)
-                image_url = f"{config.IMAGE_URL_PREFIX}/{filepath}"
-                thumbnail_url = f"{config.IMAGE_URL_PREFIX}/{thumbnailpath}"
-
-                #create folder for assets
-                create_target_Assets_folders(category_name)
-                
-                category_model = Category(
+                if isinstance(thumbnail_result, Exception):
+                    # nothing reached storage yet, drop the files this item created
+                    await remove_saved_files([
+                        saved_file,
+                        {"path": thumbnailpath, "created": saved_file["created"]}
+                    ])
+                    results.append({
+                        "name": category_name,
+                        "status": "failed",
+                        "error": f"Failed to create thumbnail: {thumbnail_result}"
+                    })
+                    continue
+
+                #hand the files to storage and make urls
+                image_key = saved_file["path"].replace(os.sep, "/")
+                thumbnail_key = thumbnailpath.replace(os.sep, "/")
+                with span("store"):
+                    await asyncio.gather(
+                        storage.put_file(saved_file["path"], image_key),
+                        storage.put_file(thumbnailpath, thumbnail_key)
+                    )
+                image_url = file_url(image_key)
+                thumbnail_url = file_url(thumbnail_key)
+                # the thumbnail name follows the original's content hash, both are new or both existed
+                stored_items.append((category_name, [image_key, thumbnail_key], saved_file["created"]))
+
+                category_models.append(Category(
                     name= category_name,
                     image_url= image_url,
                     thumbnail_url= thumbnail_url
-                )
-
-                await collection.insert_one(category_model.model_dump())
-            return {
-                "message": f"{len(images)} Categories Created using images"
-            }
+                ))
         else:
             # Categories Recieved
             print("Categories Recieved")
             for category in categories:
-                category_model = Category(name=category)
+                category_models.append(Category(name=category))
 
-                #create categories name folders
-                create_target_Assets_folders(category)
+        with span("insert"):
+            inserted = await insert_categories(collection, category_models)
+        results.extend(inserted)
+        await remove_uninserted_files(inserted, stored_items)
 
-                await collection.insert_one(category_model.model_dump())
-            return {
-                "message": f"{len(categories)} Categories Created"
-            }
+        #create categories name folders for the created categories
+        for result in results:
+            if result["status"] == "created":
+                create_target_Assets_folders(result["name"])
 
+        created = sum(1 for result in results if result["status"] == "created")
+        total = len(images) if has_images else len(categories)
+        return {
+            "message": f"{created} of {total} Categories Created{' using images' if has_images else ''}",
+            "results": results
+        }
+
+    except HTTPException:
+        raise
     except Exception as e:
         print(e)
         raise HTTPException (
             status_code=500,
             detail=f"Failed to add categories: {e}"
         )
+
+async def remove_uninserted_files(results, stored_items):
+    """Delete the stored files of categories that were not inserted, such as duplicate names.
+    Files that existed before the request or that an inserted category uses are kept"""
+    inserted_names = {result["name"] for result in results if result["status"] == "created"}
+    in_use = set()
+    unused = set()
+    seen = set()
+    for name, keys, created in stored_items:
+        # of several items with one name only the first can have been inserted
+        if name in inserted_names and name not in seen:
+            in_use.update(keys)
+        elif created:
+            unused.update(keys)
+        seen.add(name)
+    await asyncio.gather(*[storage.delete(key) for key in unused - in_use])
+
+async def insert_categories(collection, category_models):
+    """Insert categories with one insert_many and report the outcome of every item.
+    Duplicate names are rejected by the unique index on name"""
+    results = []
+    documents = []
+    seen = set()
+    for category_model in category_models:
+        if category_model.name in seen:
+            results.append({
+                "name": category_model.name,
+                "status": "failed",
+                "error": "Duplicate category name in request"
+            })
+            continue
+        seen.add(category_model.name)
+        documents.append(category_model.model_dump())
+
+    if not documents:
+        return results
+
+    failed = {}
+    async with catalog_write():
+        await stamp_new_documents(documents)
+        try:
+            await collection.insert_many(documents, ordered=False)
+        except BulkWriteError as bwe:
+            for error in bwe.details.get("writeErrors", []):
+                if error.get("code") == 11000:
+                    failed[error["index"]] = "Category already exists"
+                else:
+                    failed[error["index"]] = error.get("errmsg", "Insert failed")
+
+    for index, document in enumerate(documents):
+        if index in failed:
+            results.append({
+                "name": document["name"],
+                "status": "failed",
+                "error": failed[index]
+            })
+        else:
+            results.append({
+                "name": document["name"],
+                "status": "created",
+                "_id": str(document["_id"])
+            })
+            await publish_change("category", document["_id"], document["rev"], "insert")
+    return results
     
 async def get_all_categories(
 ):
@@ -108,7 +240,8 @@ async def add_assets(
     images, 
     thumbnail,
     actionFile,
-    behaviorFile
+    behaviorFile,
+    asset_id=None
 ):
     try:
         print("In Assets Function")
@@ -116,50 +249,72 @@ async def add_assets(
         collection = db[config.ASSETS_COLLECTION_NAME]
 
         image_url = None
-        thumbnail_url = None
-        file_url = None
-
-        # Category Folder to store assets and files
-        character_folder = f"{config.SHIMEJI_ASSETS_ORIGINAL_DIR}/{categoryName.replace(" ","_").lower()}/{characterName}"
-        os.makedirs(character_folder, exist_ok=True)
-        # thumbnails folder
-        thumbnails_folder = f"{config.SHIMEJI_ASSETS_THUMBNAIL_DIR}/{categoryName.replace(" ","_").lower()}/{characterName}"
-        os.makedirs(thumbnails_folder, exist_ok=True)
-
-        file_url = f"{config.IMAGE_URL_PREFIX}/{character_folder}"
-        thumbnail_url = f"{config.IMAGE_URL_PREFIX}/{thumbnails_folder}/{thumbnail.filename}"
-
-        # saving files and images
-        await save_files_by_folder(character_folder, images)
-        await save_single_file_by_folder(character_folder, actionFile)
-        await save_single_file_by_folder(character_folder, behaviorFile)
-        # save thumbnail 
-        await save_single_file_by_folder(thumbnails_folder, thumbnail)
-
-        assets = []
-        for image in images:
-            assets.append({
-                "name": image.filename.rsplit(".", 1)[0],
-                "url": f"{file_url}/{image.filename}"
-            })
 
-        asset_model = Asset(
-            category_id = categoryId,
-            name= characterName,
-            image_url= image_url,
-            thumbnail_url= thumbnail_url,
-            moreFields = {
-                "actionFile": f"{file_url}/{actionFile.filename}",
-                "behaviorFile": f"{file_url}/{behaviorFile.filename}",
-                "assets" : assets
-            }
-        )
+        # frames become lossless webp originals plus renditions, files and thumbnail
+        # are stored as uploaded, everything goes to the content addressed blob store
+        # blobs stored before a failure have no references and are collected by the GC
+        validate_upload_sizes([*images, actionFile, behaviorFile, thumbnail])
+        # malformed action or behavior XML fails the upload before anything is stored
+        with span("parse_config"):
+            parsed_configs = await parse_pack_configs(actionFile, behaviorFile)
+        with span("store_files"):
+            (assets, frame_keys), file_blobs = await asyncio.gather(
+                ingest_frames(images),
+                store_blobs([actionFile, behaviorFile, thumbnail])
+            )
+        # one packed sprite sheet per character so clients load all frames at once,
+        # and the XML compiled to JSON with frame references resolved to their URLs
+        with span("derived"):
+            (atlas, atlas_keys), (compiled_config, config_keys) = await asyncio.gather(
+                build_character_atlas(assets),
+                compile_pack_configs(parsed_configs, assets)
+            )
+        blob_keys = [*frame_keys, *[blob["key"] for blob in file_blobs], *atlas_keys, *config_keys]
+        with span("blob_refs"):
+            await add_blob_refs(blob_keys)
+
+        try:
+            action_blob, behavior_blob, thumbnail_blob = file_blobs
+
+            asset_model = Asset(
+                category_id = categoryId,
+                name= characterName,
+                image_url= image_url,
+                thumbnail_url= thumbnail_blob["url"],
+                blobs= blob_keys,
+                moreFields = {
+                    "actionFile": action_blob["url"],
+                    "behaviorFile": behavior_blob["url"],
+                    "assets" : assets,
+                    "atlas": atlas,
+                    "compiledConfig": compiled_config
+                }
+            )
 
-        await collection.insert_one(asset_model.model_dump())
+            document = asset_model.model_dump()
+            if asset_id is not None:
+                # queued ingests insert under the job id, a retried job finds its asset already written
+                document["_id"] = asset_id
+            with span("insert"):
+                try:
+                    async with catalog_write():
+                        await stamp_new_documents([document])
+                        await collection.insert_one(document)
+                    await publish_change("asset", document["_id"], document["rev"], "insert")
+                except DuplicateKeyError:
+                    if asset_id is None:
+                        raise
+                    await release_blob_refs(blob_keys)
+        except BaseException:
+            # no document was written, give the references back for the GC
+            await release_blob_refs(blob_keys)
+            raise
 
         return {
             "message": "Asset Saved"
         }
+    except HTTPException:
+        raise
     except Exception as e:
         print("ERROR: ", e)
         raise HTTPException(
@@ -168,6 +323,75 @@ async def add_assets(
         )
 
 
+async def create_upload_session(session):
+    try:
+        return await create_session(session)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to create upload session: {e}"
+        )
+
+async def get_upload_session(upload_id):
+    return await get_session(upload_id)
+
+async def put_upload_chunk(upload_id, file_id, offset, stream, chunk_sha256):
+    try:
+        return await receive_chunk(upload_id, file_id, offset, stream, chunk_sha256)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to store chunk: {e}"
+        )
+
+async def finalize_upload_session(upload_id):
+    """Verify a completed upload session and ingest it through add_assets.
+    Only one finalize runs per session, repeated calls return the stored result"""
+    session = await claim_finalize(upload_id)
+    if session["state"] == "finalized":
+        return session["result"]
+
+    uploads = {"images": []}
+    opened = []
+    try:
+        manifest = await get_session(upload_id)
+        await verify_session(manifest)
+
+        # the received parts are handed to add_assets as regular uploads
+        for file in manifest["files"]:
+            f = await io_pool.run(open, part_path(upload_id, file["file_id"]), "rb")
+            opened.append(f)
+            upload = UploadFile(f, size=file["size"], filename=file["filename"])
+            if file["field"] == "images":
+                uploads["images"].append(upload)
+            else:
+                uploads[file["field"]] = upload
+
+        result = await add_assets(
+            manifest["categoryId"],
+            manifest["categoryName"],
+            manifest["characterName"],
+            uploads["images"],
+            uploads["thumbnail"],
+            uploads["actionFile"],
+            uploads["behaviorFile"],
+            asset_id=session["asset_id"]
+        )
+    except BaseException:
+        await release_finalize(upload_id)
+        raise
+    finally:
+        for f in opened:
+            await io_pool.run(f.close)
+
+    await complete_finalize(upload_id, result)
+    await io_pool.run(remove_session, upload_id)
+    return result
+
 async def get_assets(
     category_id
 ):
@@ -180,6 +404,7 @@ async def get_assets(
             "_id":1,
             "name": 1,
             "thumbnail_url": 1,
+            "thumbnail_fallback_url": 1,
             "is_premium": 1,
             "moreFields": 1
         }
@@ -201,6 +426,67 @@ async def get_assets(
             detail=f"Failed to retrieve assets: {e}"
         )
 
+async def get_asset_bundle(asset_id, range_header):
+    try:
+        db = get_assets_db()
+        collection = db[config.ASSETS_COLLECTION_NAME]
+
+        asset = await collection.find_one({"_id": ObjectId(asset_id)}, {"name": 1, "moreFields": 1})
+        if not asset:
+            raise HTTPException(
+                status_code=404,
+                detail="Asset not found"
+            )
+
+        entries = bundle_entries(asset)
+        if not entries:
+            raise HTTPException(
+                status_code=404,
+                detail="Asset has no files"
+            )
+        missing = await io_pool.run(missing_files, entries)
+        if missing:
+            raise HTTPException(
+                status_code=500,
+                detail=f"{len(missing)} files of the asset are missing"
+            )
+
+        # resumed downloads are not counted again
+        if not range_header or range_header.replace(" ", "").startswith("bytes=0-"):
+            download_counter.increment(asset_id)
+
+        version = bundle_version(entries)
+        filename = f"{asset.get('name') or asset_id}.zip"
+        headers = {"ETag": f'"{version}"'}
+
+        # range requests are served from the prebuilt bundle, built once per asset version
+        cached_path = cached_bundle_path(asset_id, version)
+        if range_header or await io_pool.run(os.path.exists, cached_path):
+            cached_path = await io_pool.run(build_cached_bundle, asset_id, version, entries)
+            return FileResponse(
+                cached_path,
+                media_type="application/zip",
+                filename=filename,
+                headers=headers
+            )
+
+        return StreamingResponse(
+            iter_zip(entries),
+            media_type="application/zip",
+            headers={
+                **headers,
+                "Content-Disposition": f"attachment; filename*=utf-8''{quote(filename)}"
+            }
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to build bundle: {e}"
+        )
+
 async def updateAsset(frame_id, requiredFunction):
     try:
         db = get_assets_db()
@@ -230,10 +516,21 @@ async def updateAsset(frame_id, requiredFunction):
         else:
             raise ValueError("No function defined / Wrong function name")
 
-        result = await collection.update_one(condition, updateSet)
+        # view counts are statistics, only catalog changes get a new revision
+        stamp = None
+        if "$set" in updateSet:
+            async with catalog_write():
+                stamp = await revision_stamp()
+                updateSet["$set"].update(stamp)
+                result = await collection.update_one(condition, updateSet)
+        else:
+            # no revision is reserved, the counter update stays out of the lease protocol
+            result = await collection.update_one(condition, updateSet)
 
         if result.matched_count == 0:
             return {"error": "Asset not found"}
+        if stamp is not None:
+            await publish_change("asset", frame_id, stamp["rev"], "update")
         
         return {"message": message}
 
@@ -272,19 +569,29 @@ async def addValueInMoreFields(
             update_fields[f"moreFields.{key}"] = value
 
         # Update the asset
-        result = await collection.update_one(
-            {"_id": ObjectId(asset_id)},
-            {
-                "$set": update_fields,
-                "$currentDate": {"updated_at": True}
-            }
-        )
+        async with catalog_write():
+            stamp = await revision_stamp()
+            result = await collection.update_one(
+                {"_id": ObjectId(asset_id)},
+                {
+                    "$set": {**update_fields, **stamp},
+                    "$currentDate": {"updated_at": True}
+                }
+            )
 
         if result.matched_count == 0:
             raise HTTPException(
                 status_code=404,
                 detail="Asset not found"
             )
+        await publish_change("asset", asset_id, stamp["rev"], "update")
+
+        # frames changed, the packed atlas has to follow
+        if "assets" in body:
+            await regenerate_atlas(collection, asset_id)
+        # compiled configs resolve frame URLs, they follow both the frames and the XML files
+        if {"assets", "actionFile", "behaviorFile"} & body.keys():
+            await regenerate_compiled_config(collection, asset_id)
 
         return {
             "message": f"Successfully added/updated {len(body)} field(s) in moreFields",
@@ -299,6 +606,67 @@ async def addValueInMoreFields(
             detail=f"Failed to update moreFields: {e}"
         )
 
+async def replace_derived_blobs(collection, asset, field, value, new_keys, old_keys):
+    """Set a derived moreFields value and move the asset's blob references from old_keys to new_keys"""
+    await add_blob_refs(new_keys)
+
+    blob_keys = list(asset.get("blobs", []))
+    released = []
+    for key in old_keys:
+        if key and key in blob_keys:
+            blob_keys.remove(key)
+            released.append(key)
+    blob_keys.extend(new_keys)
+
+    async with catalog_write():
+        stamp = await revision_stamp()
+        await collection.update_one(
+            {"_id": asset["_id"]},
+            {
+                "$set": {
+                    f"moreFields.{field}": value,
+                    "blobs": blob_keys,
+                    "updated_at": datetime.utcnow(),
+                    **stamp
+                }
+            }
+        )
+    await release_blob_refs(released)
+    await publish_change("asset", asset["_id"], stamp["rev"], "update")
+
+async def regenerate_atlas(collection, asset_id):
+    asset = await collection.find_one({"_id": ObjectId(asset_id)}, {"moreFields": 1, "blobs": 1})
+    if not asset:
+        return None
+
+    more_fields = asset.get("moreFields") or {}
+    atlas, atlas_keys = await build_character_atlas(more_fields.get("assets") or [])
+
+    old_atlas = more_fields.get("atlas") or {}
+    old_keys = [key_from_url(old_atlas.get("url")), key_from_url(old_atlas.get("map_url"))]
+    await replace_derived_blobs(collection, asset, "atlas", atlas, atlas_keys, old_keys)
+    return atlas
+
+async def regenerate_compiled_config(collection, asset_id):
+    asset = await collection.find_one({"_id": ObjectId(asset_id)}, {"moreFields": 1, "blobs": 1})
+    if not asset:
+        return None
+
+    more_fields = asset.get("moreFields") or {}
+    compiled, compiled_keys = None, []
+    keys = [(storage_key_from_url(more_fields.get(field)), kind) for field, kind in (("actionFile", "actions"), ("behaviorFile", "behaviors"))]
+    if all(key for key, _ in keys):
+        try:
+            parsed_configs = await asyncio.gather(*[io_pool.run(parse_stored_config, key, kind) for key, kind in keys])
+            compiled, compiled_keys = await compile_pack_configs(parsed_configs, more_fields.get("assets") or [])
+        except (ConfigError, OSError) as e:
+            print(f"Could not compile config of {asset_id}: {e}")
+
+    old_compiled = more_fields.get("compiledConfig") or {}
+    old_keys = [key_from_url((old_compiled.get(kind) or {}).get("url")) for kind in ("actions", "behaviors")]
+    await replace_derived_blobs(collection, asset, "compiledConfig", compiled, compiled_keys, old_keys)
+    return compiled
+
 async def update_thumbnail(asset_id, thumbnail):
     try:
         db = get_assets_db()
@@ -320,40 +688,69 @@ async def update_thumbnail(asset_id, thumbnail):
                 detail="Asset not found"
             )
 
-        # Extract category and asset name from existing thumbnail_url or use asset name
-        category_name = asset.get("name", "unknown").replace(" ", "_").lower()
-        
-        # Create thumbnail directory path
-        thumbnails_folder = f"{config.SHIMEJI_ASSETS_THUMBNAIL_DIR}/{category_name}"
-        os.makedirs(thumbnails_folder, exist_ok=True)
-
-        # Save the new thumbnail
-        await save_single_file_by_folder(thumbnails_folder, thumbnail)
-        
-        # Generate the new thumbnail URL
-        thumbnail_url = f"{config.IMAGE_URL_PREFIX}/{thumbnails_folder}/{thumbnail.filename}"
-
-        # Update the asset with new thumbnail URL
-        result = await collection.update_one(
-            {"_id": ObjectId(asset_id)},
-            {
-                "$set": {
-                    "thumbnail_url": thumbnail_url,
-                    "updated_at": datetime.utcnow()
+        # the GIF is kept as fallback, it is streamed into the blob store and hashed on the way
+        validate_upload_sizes([thumbnail])
+        with span("store"):
+            gif_blob = await store_blob(thumbnail)
+        # Transcode to animated WebP off the event loop, an invalid GIF is left unreferenced for the GC
+        try:
+            with span("transcode"):
+                animated = await transcode_gif_async(blob_path(gif_blob["key"]))
+        except Exception as e:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Invalid GIF thumbnail: {e}"
+            )
+        webp_blob = await store_blob_data(animated["data"], animated["sha256"], ".webp")
+        new_keys = [webp_blob["key"], gif_blob["key"]]
+        await add_blob_refs(new_keys)
+
+        # swap the old thumbnail references for the new ones
+        blob_keys = list(asset.get("blobs", []))
+        old_keys = []
+        for url in (asset.get("thumbnail_url"), asset.get("thumbnail_fallback_url")):
+            old_key = key_from_url(url)
+            if old_key in blob_keys:
+                blob_keys.remove(old_key)
+                old_keys.append(old_key)
+        blob_keys.extend(new_keys)
+
+        # Update the asset with new thumbnail URLs
+        async with catalog_write():
+            stamp = await revision_stamp()
+            result = await collection.update_one(
+                {"_id": ObjectId(asset_id)},
+                {
+                    "$set": {
+                        "thumbnail_url": webp_blob["url"],
+                        "thumbnail_fallback_url": gif_blob["url"],
+                        "blobs": blob_keys,
+                        "updated_at": datetime.utcnow(),
+                        **stamp
+                    }
                 }
-            }
-        )
+            )
 
         if result.matched_count == 0:
+            await release_blob_refs(new_keys)
             raise HTTPException(
                 status_code=404,
                 detail="Asset not found"
             )
+        await publish_change("asset", asset_id, stamp["rev"], "update")
+
+        if old_keys:
+            await release_blob_refs(old_keys)
 
         return {
             "message": "Thumbnail updated successfully",
-            "thumbnail_url": thumbnail_url,
-            "file_type": "gif"
+            "thumbnail_url": webp_blob["url"],
+            "thumbnail_fallback_url": gif_blob["url"],
+            "file_type": "webp",
+            "frames": animated["frames"],
+            "source_frames": animated["source_frames"],
+            "size": webp_blob["size"],
+            "fallback_size": gif_blob["size"]
         }
 
     except HTTPException:
@@ -363,4 +760,133 @@ async def update_thumbnail(asset_id, thumbnail):
         raise HTTPException(
             status_code=500,
             detail=f"Failed to update thumbnail: {e}"
-        )
\ No newline at end of file
+        )
+
+async def cleanup_blobs(grace_seconds):
+    try:
+        result = await collect_garbage(grace_seconds)
+        return {
+            "message": f"Removed {result['removed_blobs']} unreferenced blobs and {result['removed_orphans']} orphan files",
+            **result
+        }
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to clean up blobs: {e}"
+        )
+
+async def backfill_frame_hashes(collection, frames):
+    """
+    Hash frames ingested before perceptual hashes existed and persist the result.
+    At most DUPLICATE_BACKFILL_LIMIT frames per call, returns how many are left
+    """
+    missing = [frame for frame in frames if not frame.get("phash") and storage_key_from_url(frame["url"])]
+    batch = missing[:config.DUPLICATE_BACKFILL_LIMIT]
+    if not batch:
+        return 0
+
+    # a few image workers at a time, uploads keep the rest of the pool
+    slots = asyncio.Semaphore(config.DUPLICATE_BACKFILL_CONCURRENCY)
+    async def hash_frame(frame):
+        async with slots:
+            return await image_pool.run(hash_stored_image, storage_key_from_url(frame["url"]))
+
+    results = await asyncio.gather(*[hash_frame(frame) for frame in batch], return_exceptions=True)
+
+    # hashes only feed duplicate detection, clients never sync on them, so the
+    # write takes no catalog revision and publishes no change event
+    updates = []
+    for frame, hashes in zip(batch, results):
+        if isinstance(hashes, Exception):
+            print(f"Could not hash frame {frame['url']}: {hashes}")
+            continue
+        frame.update(hashes)
+        prefix = f"moreFields.assets.{frame['index']}"
+        updates.append(UpdateOne(
+            {"_id": ObjectId(frame["asset_id"]), f"{prefix}.url": frame["url"]},
+            {"$set": {f"{prefix}.phash": hashes["phash"], f"{prefix}.dhash": hashes["dhash"]}}
+        ))
+    if updates:
+        await collection.bulk_write(updates, ordered=False)
+    return len(missing) - len(updates)
+
+async def find_duplicates(max_distance=None):
+    if max_distance is None:
+        max_distance = config.DUPLICATE_MAX_DISTANCE
+    try:
+        db = get_assets_db()
+        collection = db[config.ASSETS_COLLECTION_NAME]
+
+        assets = await collection.find({}, {"name": 1, "moreFields.assets": 1}).to_list(length=None)
+        frames = []
+        for asset in assets:
+            for index, entry in enumerate(asset.get("moreFields", {}).get("assets") or []):
+                if not isinstance(entry, dict) or not entry.get("url"):
+                    continue
+                frames.append({
+                    "asset_id": str(asset["_id"]),
+                    "asset_name": asset.get("name"),
+                    "index": index,
+                    "name": entry.get("name"),
+                    "url": entry["url"],
+                    "sha256": entry.get("sha256") or entry["url"],
+                    "size": entry.get("size"),
+                    "phash": entry.get("phash"),
+                    "dhash": entry.get("dhash")
+                })
+
+        with span("backfill"):
+            unhashed = await backfill_frame_hashes(collection, frames)
+        frames = [frame for frame in frames if frame.get("phash")]
+
+        with span("match"):
+            report = await image_pool.run(
+                find_near_duplicates, frames, max_distance, config.DUPLICATE_CHARACTER_MIN_SHARED
+            )
+        return {
+            "message": f"Found {len(report['groups'])} near duplicate frame groups",
+            "max_distance": max_distance,
+            # frames without hashes are left out, later calls hash them
+            "unhashed_frames": unhashed,
+            **report
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"ERROR: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to find duplicates: {e}"
+        )
+
+async def get_changes(since, limit=None):
+    try:
+        changes, cursor, has_more = await changes_since(since, limit or config.CHANGES_PAGE_SIZE)
+
+        updated = {}
+        inserted = {}
+        for key in ("categories", "assets"):
+            inserted[key] = []
+            updated[key] = []
+            for document in changes[key]:
+                document["_id"] = str(document["_id"])
+                if document.get("created_rev", 0) > since:
+                    inserted[key].append(document)
+                else:
+                    updated[key].append(document)
+
+        return {
+            "since": since,
+            "revision": cursor,
+            "latest_revision": await current_revision(),
+            "has_more": has_more,
+            "inserted": inserted,
+            "updated": updated,
+            "deleted": changes["deleted"]
+        }
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to fetch changes: {e}"
+        )
@@ -16,6 +16,10 @@ class Analytics(BaseModel):
     client_ip: Optional[str] = Field(None, description="Analytics client IP address")
     user_agent: Optional[str] = Field(None, description="Analytics user agent")
     response_time_ms: Optional[float] = Field(None, description="Analytics response time in milliseconds")
+    db_time_ms: Optional[float] = Field(None, description="Time spent in MongoDB commands in milliseconds")
+    io_time_ms: Optional[float] = Field(None, description="Time spent on the file I/O pool in milliseconds")
+    image_time_ms: Optional[float] = Field(None, description="Time spent on the image pool in milliseconds")
+    encode_time_ms: Optional[float] = Field(None, description="Time spent serializing the response in milliseconds")
 
     @field_serializer('id')
     def serialize_id(self, value: ObjectId, _info):
@@ -34,4 +38,6 @@ class AnalyticsSummary(BaseModel):
     requests_by_method: dict = Field(default_factory=dict, description="Requests grouped by HTTP method")
     requests_by_status: dict = Field(default_factory=dict, description="Requests grouped by status code")
     requests_by_endpoint: dict = Field(default_factory=dict, description="Requests grouped by endpoint")
+    average_stage_time_ms: dict = Field(default_factory=dict, description="Average time per stage (db, io, image, encode)")
+    latency_by_endpoint: dict = Field(default_factory=dict, description="Request count, response time and stage times per endpoint")
 
@@ -2,7 +2,7 @@ from pydantic import BaseModel, Field, field_serializer
 from typing import Optional
 from datetime import datetime
 from bson import ObjectId
-from typing import Dict, Any
+from typing import Dict, Any, List, Literal
 
 # Analytics Models
 class Category(BaseModel):
@@ -25,6 +25,7 @@ class Asset(BaseModel):
     description: Optional[str] = Field(None, description="Asset description")
     image_url: Optional[str] = Field(default=None, description="Asset image URL")
     thumbnail_url: Optional[str] = Field(default=None, description="Asset thumbnail URL")
+    thumbnail_fallback_url: Optional[str] = Field(default=None, description="GIF rendition of an animated thumbnail")
     is_enabled: bool = Field(default=False, description="Asset is enabled")
     is_premium: bool = Field(default=False, description="Asset is premium")
     sequence: int = Field(default=0, description="Asset sequence")
@@ -32,10 +33,26 @@ class Asset(BaseModel):
     downloads: int = Field(default=0, description="Asset downloads")
     created_at: datetime = Field(default_factory=datetime.utcnow, description="Creation timestamp")
     updated_at: datetime = Field(default_factory=datetime.utcnow, description="Last update timestamp")
+    blobs: List[str] = Field(default_factory=list, description="Content addressed blob keys referenced by the asset")
     moreFields: Dict[str, Any] = Field(
         default_factory=lambda: {
             "actionFile": None,
             "behaviorFile": None,
-            "assets": []
+            "assets": [],
+            "atlas": None,
+            "compiledConfig": None
         }
     )
+
+# Resumable Upload Models
+class UploadFileSpec(BaseModel):
+    field: Literal["images", "thumbnail", "actionFile", "behaviorFile"] = Field(..., description="add_assets field the file belongs to")
+    filename: str = Field(..., description="Original file name")
+    size: int = Field(..., ge=0, description="File size in bytes")
+    sha256: Optional[str] = Field(None, pattern="^[0-9a-f]{64}$", description="SHA-256 of the whole file, verified on finalize")
+
+class UploadSessionRequest(BaseModel):
+    categoryId: str = Field(..., description="Category ID")
+    categoryName: str = Field(..., description="Category name")
+    characterName: str = Field(..., description="Character name")
+    files: List[UploadFileSpec] = Field(..., description="Files of the asset pack")
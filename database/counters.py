@@ -0,0 +1,54 @@
+import asyncio
+from collections import Counter
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from environment import config
+from database.database_config import get_assets_db
+
+class CounterBuffer:
+    """
+    Buffers $inc updates in memory and writes them with one bulk_write per interval,
+    so hot counters cost a dict update per request instead of a round trip.
+    """
+
+    def __init__(self, collection_name: str, field: str):
+        self.collection_name = collection_name
+        self.field = field
+        self.pending = Counter()
+        self.task = None
+
+    def increment(self, doc_id: str, amount: int = 1):
+        self.pending[doc_id] += amount
+
+    async def flush(self):
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, Counter()
+        collection = get_assets_db()[self.collection_name]
+        try:
+            await collection.bulk_write([
+                UpdateOne({"_id": ObjectId(doc_id)}, {"$inc": {self.field: amount}})
+                for doc_id, amount in pending.items()
+            ], ordered=False)
+        except Exception as e:
+            # keep the counts for the next flush
+            self.pending.update(pending)
+            print(f"Failed to flush {self.field} counters: {e}")
+
+    async def run(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            await self.flush()
+
+    def start(self, interval: float = None):
+        if self.task is None:
+            self.task = asyncio.create_task(self.run(interval or config.COUNTER_FLUSH_SECONDS))
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        await self.flush()
+
+download_counter = CounterBuffer(config.ASSETS_COLLECTION_NAME, "downloads")
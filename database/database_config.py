@@ -1,40 +1,196 @@
 import os
+import asyncio
 from dotenv import load_dotenv
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING
+from pymongo.errors import ConnectionFailure, OperationFailure
+from pymongo.monitoring import ConnectionPoolListener, CommandListener
+from environment import config
 from environment.config import MONGODB_URL, ANALYTICS_DATABASE_NAME, ASSETS_DATABASE_NAME
+from utils.tracing import add_stage_time
 
 load_dotenv()
 
+class PoolStatsListener(ConnectionPoolListener):
+    """Keeps live connection pool counters for the readiness endpoint"""
+
+    def __init__(self):
+        self.created = 0
+        self.closed = 0
+        self.checked_out = 0
+        self.checkout_failed = 0
+        self.pools_cleared = 0
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self.pools_cleared += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self.created += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self.closed += 1
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self.checkout_failed += 1
+
+    def connection_checked_out(self, event):
+        self.checked_out += 1
+
+    def connection_checked_in(self, event):
+        self.checked_out -= 1
+
+    def stats(self):
+        return {
+            "open_connections": self.created - self.closed,
+            "in_use_connections": self.checked_out,
+            "total_created": self.created,
+            "total_closed": self.closed,
+            "checkout_failed": self.checkout_failed,
+            "pools_cleared": self.pools_cleared,
+            "max_pool_size": config.MONGODB_MAX_POOL_SIZE,
+            "min_pool_size": config.MONGODB_MIN_POOL_SIZE
+        }
+
+class CommandTimingListener(CommandListener):
+    """
+    Adds each command's duration to the db stage of the request that sent it.
+    Motor runs commands on its executor with a copy of the caller's context
+    """
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        add_stage_time("db", event.duration_micros / 1_000_000)
+
+    def failed(self, event):
+        add_stage_time("db", event.duration_micros / 1_000_000)
+
 class MongoDB:
     client: AsyncIOMotorClient = None
+    pool_stats: PoolStatsListener = PoolStatsListener()
+    command_timing: CommandTimingListener = CommandTimingListener()
+    ready: bool = False
 
 db = MongoDB()
 
+def create_client():
+    """Create a Motor client with the configured connection pool"""
+    return AsyncIOMotorClient(
+        MONGODB_URL,
+        maxPoolSize=config.MONGODB_MAX_POOL_SIZE,
+        minPoolSize=config.MONGODB_MIN_POOL_SIZE,
+        maxIdleTimeMS=config.MONGODB_MAX_IDLE_TIME_MS,
+        connectTimeoutMS=config.MONGODB_CONNECT_TIMEOUT_MS,
+        serverSelectionTimeoutMS=config.MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+        socketTimeoutMS=config.MONGODB_SOCKET_TIMEOUT_MS,
+        waitQueueTimeoutMS=config.MONGODB_WAIT_QUEUE_TIMEOUT_MS,
+        compressors=config.MONGODB_COMPRESSORS,
+        event_listeners=[db.pool_stats, db.command_timing]
+    )
+
 async def connect_to_mongo():
     """Create database connection"""
     try:
-        db.client = AsyncIOMotorClient(MONGODB_URL)
+        db.client = create_client()
         # Test the connection
         await db.client.admin.command('ping')
         print(f"Connected to MongoDB at {MONGODB_URL}")
         print(f"Using database: {ANALYTICS_DATABASE_NAME}")
+        await create_indexes()
+        await warmup()
+        db.ready = True
     except ConnectionFailure as e:
         print(f"Failed to connect to MongoDB: {e}")
         raise
 
+async def create_indexes():
+    """Create the indexes used by the API queries"""
+    assets_db = get_assets_db()
+    try:
+        await assets_db[config.CATEGORIES_COLLECTION_NAME].create_index("name", unique=True)
+    except OperationFailure as e:
+        # existing duplicate names prevent the index, duplicates are still filtered per request
+        print(f"Could not create unique index on category name: {e}")
+    await assets_db[config.ASSETS_COLLECTION_NAME].create_index([("category_id", ASCENDING)])
+    await assets_db[config.CATEGORIES_COLLECTION_NAME].create_index([("rev", ASCENDING)])
+    await assets_db[config.ASSETS_COLLECTION_NAME].create_index([("rev", ASCENDING)])
+    await assets_db[config.TOMBSTONES_COLLECTION_NAME].create_index([("rev", ASCENDING)])
+    await assets_db[config.REVISION_LEASES_COLLECTION_NAME].create_index([("floor", ASCENDING)])
+    # leases of writers that died are dropped once expired
+    await assets_db[config.REVISION_LEASES_COLLECTION_NAME].create_index([("expires_at", ASCENDING)], expireAfterSeconds=0)
+    await assets_db[config.TOMBSTONES_COLLECTION_NAME].create_index([("collection", ASCENDING), ("doc_id", ASCENDING)], unique=True)
+    await assets_db[config.BLOBS_COLLECTION_NAME].create_index([("refs", ASCENDING), ("updated_at", ASCENDING)])
+    await assets_db[config.JOBS_COLLECTION_NAME].create_index([("status", ASCENDING), ("created_at", ASCENDING)])
+    await assets_db[config.JOBS_COLLECTION_NAME].create_index([("status", ASCENDING), ("lease_until", ASCENDING)])
+    await get_analytics_db()[config.ANALYTICS_COLLECTION_NAME].create_index([("timestamp", ASCENDING)])
+    # finalized sessions keep their result for repeated finalize calls until the session TTL
+    await assets_db[config.UPLOAD_SESSIONS_COLLECTION_NAME].create_index(
+        [("created_at", ASCENDING)], expireAfterSeconds=config.UPLOAD_SESSION_TTL_SECONDS
+    )
+
+async def warmup():
+    """
+    Touch the hot indexes with bounded queries so the first requests do not pay
+    for cold pages. Every worker runs this at startup, so it never scans a collection
+    """
+    assets_db = get_assets_db()
+    limit = config.MONGODB_WARMUP_DOCS_PER_INDEX
+    hot_indexes = [
+        (assets_db[config.CATEGORIES_COLLECTION_NAME], "name"),
+        (assets_db[config.CATEGORIES_COLLECTION_NAME], "rev"),
+        (assets_db[config.ASSETS_COLLECTION_NAME], "category_id"),
+        (assets_db[config.ASSETS_COLLECTION_NAME], "rev")
+    ]
+    # run side by side, the queries also check out the first pool connections
+    await asyncio.gather(*[
+        collection.find({}, {"_id": 1, field: 1}).sort(field, ASCENDING).limit(limit).to_list(length=limit)
+        for collection, field in hot_indexes
+    ])
+
 async def close_mongo_connection():
     """Close database connection"""
+    db.ready = False
     if db.client:
+        # in-flight requests are finished by the server before shutdown, closing drains the pool
         db.client.close()
+        db.client = None
+        print("MongoDB connection closed")
+
+async def check_readiness():
+    """Ping the database and return pool statistics"""
+    if db.client is None:
+        return {"ready": False, "pool": db.pool_stats.stats()}
+    try:
+        await db.client.admin.command('ping')
+        ready = db.ready
+    except ConnectionFailure:
+        ready = False
+    return {"ready": ready, "pool": db.pool_stats.stats()}
 
 # Existing Analytics DB Getter
 def get_analytics_db():
     if db.client is None:
-        db.client = AsyncIOMotorClient(MONGODB_URL)
+        db.client = create_client()
     return db.client[ANALYTICS_DATABASE_NAME]
 
 # New Assets DB Getter
 def get_assets_db():
     if db.client is None:
-        db.client = AsyncIOMotorClient(MONGODB_URL)
-    return db.client[ASSETS_DATABASE_NAME]
\ No newline at end of file
+        db.client = create_client()
+    return db.client[ASSETS_DATABASE_NAME]
@@ -1,14 +1,30 @@
 from fastapi import FastAPI
 from contextlib import asynccontextmanager
 from database.database_config import connect_to_mongo, close_mongo_connection
+from database.counters import download_counter
+from database.revisions import stamp_unrevisioned
+from inits.executors import shutdown_executors
+from jobs.worker import job_worker
+from events.hub import event_hub
+from events.bus import event_bus
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     #Startup
     await connect_to_mongo()
+    await stamp_unrevisioned()
+    download_counter.start()
+    job_worker.start()
+    event_hub.start()
+    event_bus.start()
     yield
 
     #Shutdown
+    await event_bus.stop()
+    await event_hub.stop()
+    await job_worker.stop()
+    await download_counter.stop()
     await close_mongo_connection()
+    shutdown_executors()
 
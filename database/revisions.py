@@ -0,0 +1,145 @@
+from datetime import datetime, timedelta
+from contextlib import asynccontextmanager
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+
+from environment import config
+from database.database_config import get_assets_db
+from events.bus import publish_change
+
+#============================================================================
+# Catalog revisions
+# Every write to categories and assets stamps the document with a fresh value
+# of one global counter ("rev") and the time it was reserved ("rev_at").
+# Clients sync with the largest rev they have seen. A writer may finish after
+# a writer holding a higher rev, so every write holds a lease from before it
+# reserves its revisions until its documents are written. The lease floor is
+# the counter value it saw plus one, no lower than any rev the writer reserves.
+# The changes feed only serves revisions below the lowest live floor, the
+# committed watermark, so a rev can no longer appear below a cursor that was
+# already handed out. A writer that stops without releasing its lease holds
+# the watermark back for CATALOG_WRITE_TIMEOUT_SECONDS at most.
+#============================================================================
+
+CATALOG_COLLECTIONS = {
+    "categories": config.CATEGORIES_COLLECTION_NAME,
+    "assets": config.ASSETS_COLLECTION_NAME
+}
+# kind named in change events
+CATALOG_KINDS = {"categories": "category", "assets": "asset"}
+
+def leases_collection():
+    return get_assets_db()[config.REVISION_LEASES_COLLECTION_NAME]
+
+@asynccontextmanager
+async def catalog_write():
+    """Hold a write lease around reserving revisions and writing the stamped documents"""
+    lease = {
+        "_id": ObjectId(),
+        # read before the lease is inserted, the revisions reserved under it can only be higher
+        "floor": await current_revision() + 1,
+        "expires_at": datetime.utcnow() + timedelta(seconds=config.CATALOG_WRITE_TIMEOUT_SECONDS)
+    }
+    await leases_collection().insert_one(lease)
+    try:
+        yield
+    finally:
+        await leases_collection().delete_one({"_id": lease["_id"]})
+
+async def committed_revision():
+    """Largest revision at or below which every reserved revision is written"""
+    # the counter is read first: a rev at or below it was reserved under a lease inserted before this read
+    latest = await current_revision()
+    oldest = await leases_collection().find(
+        {"expires_at": {"$gt": datetime.utcnow()}}, {"floor": 1}
+    ).sort("floor", 1).limit(1).to_list(length=1)
+    return min(latest, oldest[0]["floor"] - 1) if oldest else latest
+
+async def reserve_revisions(count=1):
+    """Reserve `count` consecutive revisions, returns the first one"""
+    counter = await get_assets_db()[config.REVISIONS_COLLECTION_NAME].find_one_and_update(
+        {"_id": "catalog"},
+        {"$inc": {"value": count}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return counter["value"] - count + 1
+
+async def revision_stamp():
+    """Fields to $set on any catalog write, call it inside catalog_write"""
+    return {"rev": await reserve_revisions(), "rev_at": datetime.utcnow()}
+
+async def stamp_new_documents(documents):
+    """Stamp documents about to be inserted inside catalog_write, created_rev tells inserts from updates"""
+    first = await reserve_revisions(len(documents))
+    now = datetime.utcnow()
+    for offset, document in enumerate(documents):
+        document.update({"rev": first + offset, "created_rev": first + offset, "rev_at": now})
+
+async def current_revision():
+    counter = await get_assets_db()[config.REVISIONS_COLLECTION_NAME].find_one({"_id": "catalog"})
+    return counter["value"] if counter else 0
+
+async def record_deletions(collection_key, doc_ids):
+    """Leave tombstones for deleted catalog documents so syncing clients drop them"""
+    if not doc_ids:
+        return
+    async with catalog_write():
+        first = await reserve_revisions(len(doc_ids))
+        now = datetime.utcnow()
+        await get_assets_db()[config.TOMBSTONES_COLLECTION_NAME].bulk_write([
+            UpdateOne(
+                {"collection": collection_key, "doc_id": str(doc_id)},
+                {"$set": {"rev": first + offset, "rev_at": now}},
+                upsert=True
+            )
+            for offset, doc_id in enumerate(doc_ids)
+        ], ordered=False)
+    for offset, doc_id in enumerate(doc_ids):
+        await publish_change(CATALOG_KINDS[collection_key], doc_id, first + offset, "delete")
+
+async def stamp_unrevisioned():
+    """Give documents written before revisions existed a revision, so a full sync returns them"""
+    db = get_assets_db()
+    for collection_name in CATALOG_COLLECTIONS.values():
+        collection = db[collection_name]
+        missing = await collection.find({"rev": {"$exists": False}}, {"_id": 1}).to_list(length=None)
+        if not missing:
+            continue
+        async with catalog_write():
+            first = await reserve_revisions(len(missing))
+            now = datetime.utcnow()
+            await collection.bulk_write([
+                UpdateOne(
+                    {"_id": document["_id"], "rev": {"$exists": False}},
+                    {"$set": {"rev": first + offset, "created_rev": first + offset, "rev_at": now}}
+                )
+                for offset, document in enumerate(missing)
+            ], ordered=False)
+        print(f"Stamped {len(missing)} {collection_name} documents with catalog revisions")
+
+async def changes_since(since, limit):
+    """
+    Documents and tombstones with a committed revision above `since`, at most `limit`
+    per kind. Returns the changes and the cursor for the next call
+    """
+    db = get_assets_db()
+    committed = await committed_revision()
+    settled = {"rev": {"$gt": since, "$lte": committed}}
+
+    sources = {key: db[name] for key, name in CATALOG_COLLECTIONS.items()}
+    sources["deleted"] = db[config.TOMBSTONES_COLLECTION_NAME]
+    results = {}
+    for key, collection in sources.items():
+        projection = {"blobs": 0} if key != "deleted" else {"_id": 0}
+        results[key] = await collection.find(settled, projection).sort("rev", 1).limit(limit).to_list(length=None)
+
+    # a truncated kind stops the cursor at its last revision, later changes of the other kinds wait for the next page
+    truncated = [documents[-1]["rev"] for documents in results.values() if len(documents) == limit]
+    if truncated:
+        cursor = min(truncated)
+        results = {key: [document for document in documents if document["rev"] <= cursor] for key, documents in results.items()}
+    else:
+        # every revision up to the watermark is written, the next call starts there even when nothing changed
+        cursor = max(since, committed)
+    return results, cursor, bool(truncated)
@@ -0,0 +1,25 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from database.database_config import check_readiness
+from inits.executors import executors_stats
+
+router = APIRouter(prefix="/health", tags=["health"])
+
+@router.get("", response_model=dict)
+async def liveness():
+    """Process is up"""
+    return {"status": "ok"}
+
+@router.get("/ready", response_model=dict)
+async def readiness():
+    """Database reachable and warmed up, with connection pool statistics"""
+    result = await check_readiness()
+    return JSONResponse(
+        status_code=200 if result["ready"] else 503,
+        content={"status": "ready" if result["ready"] else "not ready", **result}
+    )
+
+@router.get("/workers", response_model=dict)
+async def workers():
+    """Worker pool queue wait and run time metrics"""
+    return {"pools": executors_stats()}
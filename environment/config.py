@@ -2,6 +2,18 @@
 SYSTEM_IP = "172.16.0.94"
 SYSTEM_PORT = 9005
 
+#PRODUCTION SERVER (serve.py), the HOST, PORT and WEB_CONCURRENCY environment variables override these
+SERVER_HOST = "0.0.0.0"
+SERVER_PORT = SYSTEM_PORT
+#0 means one worker process per CPU core
+SERVER_WORKERS = 0
+#a worker is replaced after this many requests plus a random jitter, bounds slow leaks
+SERVER_MAX_REQUESTS = 10000
+SERVER_MAX_REQUESTS_JITTER = 1000
+#seconds a stopping worker gets to finish in-flight requests and run the shutdown lifespan
+SERVER_GRACEFUL_TIMEOUT = 30
+SERVER_KEEPALIVE_SECONDS = 5
+
 #PROJECT INFORMATION
 APPNAME = "shimeji"
 TITLE = "SHIMEJI ASSETS"
@@ -16,6 +28,23 @@ ANALYTICS_COLLECTION_NAME = f"analytics_{APPNAME}"
 ASSETS_DATABASE_NAME = f"{APPNAME}_assets_db"
 CATEGORIES_COLLECTION_NAME = f"category"
 ASSETS_COLLECTION_NAME = f"assets"
+BLOBS_COLLECTION_NAME = f"blobs"
+JOBS_COLLECTION_NAME = f"jobs"
+REVISIONS_COLLECTION_NAME = f"revisions"
+UPLOAD_SESSIONS_COLLECTION_NAME = f"upload_sessions"
+REVISION_LEASES_COLLECTION_NAME = f"revision_leases"
+TOMBSTONES_COLLECTION_NAME = f"tombstones"
+#MONGODB CONNECTION POOL
+MONGODB_MAX_POOL_SIZE = 100
+MONGODB_MIN_POOL_SIZE = 10
+MONGODB_MAX_IDLE_TIME_MS = 60000
+MONGODB_CONNECT_TIMEOUT_MS = 5000
+MONGODB_SERVER_SELECTION_TIMEOUT_MS = 5000
+MONGODB_SOCKET_TIMEOUT_MS = 30000
+MONGODB_WAIT_QUEUE_TIMEOUT_MS = 10000
+MONGODB_COMPRESSORS = "zlib"
+#documents read per hot index by the startup warmup of each worker
+MONGODB_WARMUP_DOCS_PER_INDEX = 100
 
 #DIRECTORIES
 TEMPLATES_DIR = "templates"
@@ -29,8 +58,145 @@ SHIMEJI_CATEGORIES_DIR = f"{STATIC_DIR}/Categories"
 SHIMEJI_CATEGORIES_ORIGINAL_DIR = f"{STATIC_DIR}/Categories/Original"
 SHIMEJI_CATEGORIES_THUMBNAIL_DIR = f"{STATIC_DIR}/Categories/Thumbnail"
 
+#UPLOAD LIMITS
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+MAX_UPLOAD_FILE_SIZE = 50 * 1024 * 1024
+MAX_UPLOAD_REQUEST_SIZE = 500 * 1024 * 1024
+#files of one request saved at the same time
+UPLOAD_PARALLELISM = 8
+#frames of one request decoded and encoded at the same time
+INGEST_PARALLELISM = 8
+#resumable upload sessions, kept outside the static folder
+UPLOAD_SESSIONS_DIR = "uploads"
+UPLOAD_SESSION_TTL_SECONDS = 24 * 60 * 60
+MAX_UPLOAD_SESSION_SIZE = 2 * 1024 * 1024 * 1024
+#a chunk writer or finalize that stopped without releasing its claim is taken over after this
+UPLOAD_WRITER_TIMEOUT_SECONDS = 300
+UPLOAD_FINALIZE_TIMEOUT_SECONDS = 600
+
+#WORKER POOLS
+#"process" for a process pool, "thread" to keep image work in threads
+IMAGE_WORKER_KIND = "process"
+#0 means one worker per CPU core
+IMAGE_WORKERS = 0
+IMAGE_WORKER_QUEUE_SIZE = 64
+#callers waiting for a full pool, beyond this they get a 503
+#one pack upload waits with all of its frames, keep room for the largest packs
+IMAGE_WORKER_MAX_WAITING = 1024
+#uploads copied into shared memory for the image workers at the same time, 0 means one per image worker.
+#each holds a whole compressed frame, give /dev/shm (docker --shm-size) room for this many MAX_UPLOAD_FILE_SIZE files
+IMAGE_UPLOAD_BUFFERS = 0
+IO_WORKERS = 10
+IO_WORKER_QUEUE_SIZE = 256
+IO_WORKER_MAX_WAITING = 4096
+
+#CONTENT ADDRESSED STORAGE
+SHIMEJI_BLOBS_DIR = f"{STATIC_DIR}/Blobs"
+SHIMEJI_BLOBS_TEMP_DIR = f"{STATIC_DIR}/Blobs/tmp"
+#unreferenced blobs younger than this are kept, uploads in progress may still claim them
+BLOB_GC_GRACE_SECONDS = 3600
+
+#FILE STORAGE
+#"local" keeps files in the working directory, "s3" puts them in an S3 compatible bucket
+STORAGE_BACKEND = "local"
+#"direct" stores public URLs, "presigned" stores URLs of the files route which redirects to a presigned URL
+STORAGE_URL_MODE = "direct"
+#base of direct URLs, point it at a CDN or a public bucket to stop serving files from the API host
+STORAGE_PUBLIC_URL = f"http://{SYSTEM_IP}:{SYSTEM_PORT}"
+#S3 compatible storage, MinIO for example, needs boto3. Credentials come from the AWS environment variables
+S3_ENDPOINT_URL = None
+S3_BUCKET = "shimeji-assets"
+S3_REGION = "us-east-1"
+S3_MULTIPART_THRESHOLD = 8 * 1024 * 1024
+S3_MULTIPART_CHUNK_SIZE = 8 * 1024 * 1024
+#parts of one multipart upload sent at the same time
+S3_MULTIPART_CONCURRENCY = 4
+S3_PRESIGNED_URL_SECONDS = 3600
+
+#INGEST JOBS
+#uploads of queued jobs are spooled here until a worker ingests them
+INGEST_JOBS_DIR = "spool/jobs"
+JOB_WORKER_CONCURRENCY = 2
+JOB_POLL_INTERVAL_SECONDS = 2
+#a running job whose lease expires is picked up again by another worker
+JOB_LEASE_SECONDS = 300
+JOB_MAX_ATTEMPTS = 3
+
+#CHARACTER BUNDLES
+BUNDLE_CACHE_DIR = "cache/bundles"
+BUNDLE_CHUNK_SIZE = 256 * 1024
+#buffered download counters are written to mongo at this interval
+COUNTER_FLUSH_SECONDS = 5
+
+#CATALOG SYNC
+#a catalog write that stopped without releasing its lease stops holding back the changes feed after this
+CATALOG_WRITE_TIMEOUT_SECONDS = 60
+#documents per kind returned by one changes call
+CHANGES_PAGE_SIZE = 500
+
+#CATALOG EVENTS
+#undelivered notifications kept per SSE connection before it is told to resync
+EVENTS_CLIENT_BUFFER_SIZE = 64
+EVENTS_HEARTBEAT_SECONDS = 15
+EVENTS_MAX_CONNECTIONS = 10000
+#reconnect delay suggested to EventSource clients
+EVENTS_RETRY_MS = 5000
+#file the workers of one host share as their pub/sub channel
+EVENTS_BUS_PATH = "spool/events.log"
+EVENTS_BUS_POLL_SECONDS = 0.25
+EVENTS_BUS_MAX_BYTES = 1024 * 1024
+
+#REQUEST PROFILING
+#share of requests profiled at random, 0 profiles only requests carrying the token
+PROFILE_SAMPLE_RATE = 0.0
+#requests whose PROFILE_HEADER matches the PROFILE_TOKEN environment variable are profiled,
+#the same header unlocks the profiles endpoints. Without the variable both are disabled
+PROFILE_HEADER = "x-profile-token"
+PROFILE_TOKEN_ENV = "PROFILE_TOKEN"
+PROFILE_INTERVAL_MS = 5
+#sampling of a request stops after this long, streams would otherwise be profiled forever
+PROFILE_MAX_SECONDS = 30
+#finished profiles kept in memory per worker
+PROFILE_BUFFER_SIZE = 50
+PROFILE_ROUTE = "/api/profiles"
+
+#DUPLICATE DETECTION
+#frames whose 64 bit perceptual hashes differ in at most this many bits are near duplicates
+DUPLICATE_MAX_DISTANCE = 6
+#two characters are reported when this share of the smaller one's frames has a near duplicate in the other
+DUPLICATE_CHARACTER_MIN_SHARED = 0.8
+#frames stored before perceptual hashes existed are hashed by the duplicates call, this many per call
+#and on at most this many image workers at once, the rest of the pool stays free for uploads
+DUPLICATE_BACKFILL_LIMIT = 500
+DUPLICATE_BACKFILL_CONCURRENCY = 2
+
+#STATIC SERVING
+#hex digits of the content hash embedded in fingerprinted file names
+FINGERPRINT_LENGTH = 12
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+#in-memory LRU of small hot files such as thumbnails
+STATIC_HOT_CACHE_BYTES = 64 * 1024 * 1024
+STATIC_HOT_CACHE_MAX_FILE_SIZE = 512 * 1024
+
 #FILE FORMATS
 IMAGE_FORMAT = "webp"
+#downscaled renditions made for every frame, label: longest side in px
+IMAGE_RENDITIONS = {"medium": 256, "small": 128}
+IMAGE_RENDITION_QUALITY = 80
+#webp encoder effort 0 (fast) - 6 (smallest)
+IMAGE_WEBP_METHOD = 4
+#thumbnails, fraction of the original size, webp quality and images per worker task
+THUMBNAIL_SCALE = 1 / 3
+THUMBNAIL_QUALITY = 70
+THUMBNAIL_BATCH_SIZE = 8
+#sprite atlas per character, transparent gap between frames and largest side in px
+ATLAS_PADDING = 2
+ATLAS_MAX_SIDE = 16383
+#animated gif thumbnails transcoded to webp, frames shorter than the minimum play at the
+#browser default like they do in gif viewers
+ANIMATED_WEBP_QUALITY = 80
+GIF_MIN_FRAME_DURATION_MS = 20
+GIF_DEFAULT_FRAME_DURATION_MS = 100
 TEMPLATE_FORMAT = "html"
 
 #IMAGE PREFIX
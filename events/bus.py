@@ -0,0 +1,121 @@
+import os
+import json
+import socket
+import asyncio
+
+from environment import config
+from events.hub import event_hub
+from inits.executors import io_pool
+
+#============================================================================
+# Local event bus
+# A stand-in for a Redis style pub/sub channel between the workers of one
+# host. Events are appended as single JSON lines to a shared file, and each
+# worker tails it and dispatches the events of the other workers to its own
+# hub. Small appends in "a" mode are atomic on local filesystems. A writer
+# that finds the file above EVENTS_BUS_MAX_BYTES renames it aside. Tailers
+# finish the renamed file before they reopen the path.
+#============================================================================
+
+def process_name():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+class LocalBus:
+    def __init__(self, path: str, poll_seconds: float, max_bytes: int):
+        self.path = path
+        self.poll_seconds = poll_seconds
+        self.max_bytes = max_bytes
+        self.origin = process_name()
+        self.file = None
+        self.pending = b""
+        self.task = None
+
+    def append(self, event: dict):
+        line = json.dumps({**event, "origin": self.origin}, separators=(",", ":")).encode("utf-8") + b"\n"
+        with open(self.path, "ab") as f:
+            f.write(line)
+            size = f.tell()
+        if size > self.max_bytes:
+            try:
+                os.replace(self.path, f"{self.path}.1")
+            except FileNotFoundError:
+                # another worker rotated it first
+                pass
+
+    def open_tail(self, from_start: bool):
+        open(self.path, "ab").close()
+        self.file = open(self.path, "rb")
+        if not from_start:
+            self.file.seek(0, os.SEEK_END)
+        self.pending = b""
+
+    def read_new(self) -> list:
+        """Return the events appended since the last call, follows rotation of the file"""
+        if self.file is None:
+            # a worker that starts later does not replay older events
+            self.open_tail(from_start=False)
+
+        data = self.file.read()
+        try:
+            rotated = os.stat(self.path).st_ino != os.fstat(self.file.fileno()).st_ino
+        except FileNotFoundError:
+            rotated = True
+        if rotated:
+            # drain what was appended before the rename, then follow the new file
+            data += self.file.read()
+            self.file.close()
+            self.open_tail(from_start=True)
+
+        lines = (self.pending + data).split(b"\n")
+        self.pending = lines.pop()
+        events = []
+        for line in lines:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue
+            if event.pop("origin", None) != self.origin:
+                events.append(event)
+        return events
+
+    async def tail(self):
+        while True:
+            try:
+                for event in await io_pool.run(self.read_new):
+                    event_hub.dispatch(event)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Event bus read failed: {e}")
+            await asyncio.sleep(self.poll_seconds)
+
+    def start(self):
+        # workers forked from a preloading master inherit its pid from import time
+        self.origin = process_name()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.task = asyncio.create_task(self.tail())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+event_bus = LocalBus(
+    config.EVENTS_BUS_PATH,
+    config.EVENTS_BUS_POLL_SECONDS,
+    config.EVENTS_BUS_MAX_BYTES
+)
+
+async def publish_change(kind: str, doc_id, rev: int, op: str):
+    """Notify subscribers of every worker that a catalog document changed at `rev`"""
+    event = {"type": "change", "kind": kind, "id": str(doc_id), "rev": rev, "op": op}
+    event_hub.dispatch(event)
+    try:
+        await io_pool.run(event_bus.append, event)
+    except Exception as e:
+        # the write already committed, other workers' clients catch up through /changes
+        print(f"Event bus publish failed: {e}")
@@ -0,0 +1,110 @@
+import json
+import asyncio
+from collections import deque
+
+from environment import config
+
+#============================================================================
+# Catalog event hub
+# Fans change notifications out to the SSE connections of this worker. Every
+# connection owns a small bounded buffer. A client too slow to drain it gets a
+# single "resync" event in place of the backlog, and catches up through
+# /changes from the last revision it was sent. The resync keeps that revision
+# as its id, so a reconnecting EventSource still names what it really saw.
+# One shared ticker queues the heartbeats, so idle connections cost a buffer
+# and a waiting coroutine each, with no timer per connection.
+#============================================================================
+
+HEARTBEAT = ": heartbeat\n\n"
+
+def format_event(event: dict) -> str:
+    # without an id line the client keeps its Last-Event-ID
+    event_id = f"id: {event['rev']}\n" if event.get("rev") is not None else ""
+    return f"{event_id}event: {event['type']}\ndata: {json.dumps(event, separators=(',', ':'))}\n\n"
+
+class Subscription:
+    def __init__(self, size: int):
+        self.size = size
+        # (message, rev) pairs, heartbeats have no rev
+        self.messages = deque()
+        self.ready = asyncio.Event()
+        self.dropped = 0
+        # rev of the last event handed to the client, None before the first one
+        self.sent_rev = None
+
+    def push(self, message: str, droppable: bool = False, rev: int = None):
+        if len(self.messages) >= self.size:
+            if droppable:
+                return
+            # the client fell behind, replace the backlog with one resync hint
+            self.dropped += len(self.messages)
+            self.messages.clear()
+            rev = self.sent_rev
+            message = format_event({"type": "resync", "rev": rev, "reason": "buffer_overflow"})
+        self.messages.append((message, rev))
+        self.ready.set()
+
+    async def next(self) -> str:
+        while not self.messages:
+            self.ready.clear()
+            await self.ready.wait()
+        message, rev = self.messages.popleft()
+        if rev is not None:
+            self.sent_rev = rev
+        return message
+
+class EventHub:
+    def __init__(self, buffer_size: int, heartbeat_seconds: float, max_connections: int):
+        self.buffer_size = buffer_size
+        self.heartbeat_seconds = heartbeat_seconds
+        self.max_connections = max_connections
+        self.subscriptions = set()
+        self.published = 0
+        self.task = None
+
+    def full(self) -> bool:
+        return len(self.subscriptions) >= self.max_connections
+
+    def subscribe(self):
+        subscription = Subscription(self.buffer_size)
+        self.subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self.subscriptions.discard(subscription)
+
+    def dispatch(self, event: dict):
+        """Deliver an event to every connection of this worker"""
+        self.published += 1
+        message = format_event(event)
+        for subscription in self.subscriptions:
+            subscription.push(message, rev=event["rev"])
+
+    async def heartbeat(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_seconds)
+            for subscription in self.subscriptions:
+                subscription.push(HEARTBEAT, droppable=True)
+
+    def start(self):
+        self.task = asyncio.create_task(self.heartbeat())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    def stats(self):
+        return {
+            "connections": len(self.subscriptions),
+            "max_connections": self.max_connections,
+            "published": self.published,
+            "dropped": sum(subscription.dropped for subscription in self.subscriptions)
+        }
+
+event_hub = EventHub(
+    config.EVENTS_CLIENT_BUFFER_SIZE,
+    config.EVENTS_HEARTBEAT_SECONDS,
+    config.EVENTS_MAX_CONNECTIONS
+)
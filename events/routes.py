@@ -0,0 +1,51 @@
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+from environment import config
+from events.hub import event_hub, format_event
+from database.revisions import current_revision
+
+router = APIRouter(prefix="/api/shimeji/events", tags=["events"])
+
+@router.get("")
+async def catalog_events(request: Request):
+    """Server-Sent Events stream of catalog changes, each event carries the document id and revision"""
+    if event_hub.full():
+        raise HTTPException(
+            status_code=503,
+            detail="Too many event stream connections",
+            headers={"Retry-After": str(config.EVENTS_RETRY_MS // 1000)}
+        )
+
+    # a reconnecting client names the last revision it saw, tell it to catch up if it missed any
+    last_event_id = request.headers.get("last-event-id")
+    resync_from = None
+    if last_event_id and last_event_id.isdigit():
+        latest = await current_revision()
+        if latest > int(last_event_id):
+            resync_from = int(last_event_id)
+
+    async def stream():
+        # subscribe when the stream starts, a generator that never runs never unsubscribes
+        subscription = event_hub.subscribe()
+        try:
+            yield f"retry: {config.EVENTS_RETRY_MS}\n\n"
+            if resync_from is not None:
+                yield format_event({"type": "resync", "rev": resync_from, "reason": "reconnect"})
+            while True:
+                yield await subscription.next()
+        finally:
+            event_hub.unsubscribe(subscription)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+@router.get("/stats", response_model=dict)
+async def event_stats():
+    return event_hub.stats()
@@ -0,0 +1,171 @@
+import os
+import time
+import asyncio
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from environment import config
+from utils.tracing import add_stage_time
+
+
+def timed_call(func, args):
+    """Runs inside the worker and reports when the task actually started and finished"""
+    started_at = time.time()
+    result = func(*args)
+    return result, started_at, time.time()
+
+
+def init_image_worker():
+    # Pillow and pillow_heif load with the first image task, not with the app
+    import pillow_heif
+    pillow_heif.register_heif_opener()
+
+
+class WorkerPool:
+    """
+    Executor with a bounded queue and timing metrics.
+    At most max_workers tasks run and max_queue wait in the executor, further
+    callers wait for a free slot so the work backs up instead of piling into memory.
+    Once max_waiting callers wait, new ones are rejected with a 503.
+    """
+
+    def __init__(self, name: str, kind: str, max_workers: int, max_queue: int, max_waiting: int, initializer=None):
+        self.name = name
+        self.kind = kind
+        self.initializer = initializer
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.max_waiting = max_waiting
+        self.executor = None
+        self.slots = None
+        self.waiting = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.queue_wait_total = 0.0
+        self.queue_wait_max = 0.0
+        self.run_time_total = 0.0
+        self.run_time_max = 0.0
+
+    def get_executor(self):
+        # created on first use so importing the app never forks or spawns
+        if self.executor is None:
+            if self.kind == "process":
+                self.executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=self.initializer
+                )
+            else:
+                self.executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix=self.name,
+                    initializer=self.initializer
+                )
+        return self.executor
+
+    async def run(self, func, *args):
+        if self.slots is None:
+            self.slots = asyncio.Semaphore(self.max_workers + self.max_queue)
+
+        if self.slots.locked() and self.waiting >= self.max_waiting:
+            self.rejected += 1
+            # imported here, image workers load this module and never reject
+            from fastapi import HTTPException
+            raise HTTPException(
+                status_code=503,
+                detail=f"The {self.name} worker pool is full, retry shortly",
+                headers={"Retry-After": "1"}
+            )
+
+        submitted_at = time.time()
+        self.waiting += 1
+        try:
+            await self.slots.acquire()
+        finally:
+            self.waiting -= 1
+
+        self.running += 1
+        try:
+            loop = asyncio.get_running_loop()
+            result, started_at, finished_at = await loop.run_in_executor(
+                self.get_executor(), timed_call, func, args
+            )
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.running -= 1
+            self.slots.release()
+            # the request waited for the pool as long as the slot, the queue and the work took
+            add_stage_time(self.name, time.time() - submitted_at)
+
+        queue_wait = max(started_at - submitted_at, 0.0)
+        run_time = finished_at - started_at
+        self.completed += 1
+        self.queue_wait_total += queue_wait
+        self.queue_wait_max = max(self.queue_wait_max, queue_wait)
+        self.run_time_total += run_time
+        self.run_time_max = max(self.run_time_max, run_time)
+        return result
+
+    def stats(self):
+        return {
+            "name": self.name,
+            "kind": self.kind,
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "max_waiting": self.max_waiting,
+            "waiting_for_slot": self.waiting,
+            "in_flight": self.running,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "avg_queue_wait_ms": round(self.queue_wait_total / self.completed * 1000, 2) if self.completed else None,
+            "max_queue_wait_ms": round(self.queue_wait_max * 1000, 2),
+            "avg_run_time_ms": round(self.run_time_total / self.completed * 1000, 2) if self.completed else None,
+            "max_run_time_ms": round(self.run_time_max * 1000, 2)
+        }
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+        self.slots = None
+
+
+#============================================================================
+#CPU bound image work (decode, resize, encode)
+image_pool = WorkerPool(
+    "image",
+    config.IMAGE_WORKER_KIND,
+    config.IMAGE_WORKERS or os.cpu_count() or 1,
+    config.IMAGE_WORKER_QUEUE_SIZE,
+    config.IMAGE_WORKER_MAX_WAITING,
+    init_image_worker
+)
+
+#Blocking file I/O
+io_pool = WorkerPool(
+    "io",
+    "thread",
+    config.IO_WORKERS,
+    config.IO_WORKER_QUEUE_SIZE,
+    config.IO_WORKER_MAX_WAITING
+)
+
+def executors_stats():
+    return [image_pool.stats(), io_pool.stats()]
+
+def shutdown_executors():
+    image_pool.shutdown()
+    io_pool.shutdown()
+
+def forget_executors():
+    # a forked child has none of the parent's pool threads or processes, start fresh on first use
+    for pool in (image_pool, io_pool):
+        pool.executor = None
+        pool.slots = None
+
+os.register_at_fork(after_in_child=forget_executors)
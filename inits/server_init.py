@@ -1,18 +1,21 @@
 import os
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 
-#Thread pool for creating threads
-from concurrent.futures import ThreadPoolExecutor
-
-#importing python dependencies
-import pillow_heif
-
 #import Environment variables
 from environment import config, messages
 
+#static files with cache headers and hot file cache
+from inits.static_files import CachedStaticFiles
+
+#on demand request profiles
+from profiling.middleware import ProfilingMiddleware
+
+#import database lifecycle
+from database.index import lifespan
+
 #============================================================================
 
 #INITIALIZE THE FASTAPI APP
@@ -20,7 +23,8 @@ app = FastAPI(
     title=config.TITLE,
     description=config.DESCRIPTION,
     version=config.VERSION,
-    author=config.AUTHOR
+    author=config.AUTHOR,
+    lifespan=lifespan
 )
 
 #Create and mount templates folder
@@ -35,10 +39,15 @@ app.mount(
 os.makedirs(config.STATIC_DIR, exist_ok=True)
 app.mount(
     f"/{config.STATIC_DIR}",
-    StaticFiles(directory=config.STATIC_DIR),
+    CachedStaticFiles(directory=config.STATIC_DIR),
     name=config.STATIC_DIR
 )
 
+#============================================================================
+#profile sampled requests, added first so it is the innermost middleware
+#and the endpoint runs in the task it profiles
+app.add_middleware(ProfilingMiddleware)
+
 #============================================================================
 #configure CORS middleware
 app.add_middleware(
@@ -50,11 +59,15 @@ app.add_middleware(
 )
 
 #============================================================================
-#configure Thread Pool Executor
-thread_pool = ThreadPoolExecutor(max_workers=10)
-
-#============================================================================
-#configure Pillow-HEIF plugin
-pillow_heif.register_heif_opener()
+#reject oversized uploads from Content-Length before the body is parsed
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > config.MAX_UPLOAD_REQUEST_SIZE:
+        return JSONResponse(
+            status_code=413,
+            content={"status": "error", "message": f"Upload exceeds {config.MAX_UPLOAD_REQUEST_SIZE} bytes"}
+        )
+    return await call_next(request)
 
 #============================================================================
\ No newline at end of file
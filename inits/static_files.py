@@ -0,0 +1,112 @@
+import os
+import re
+import asyncio
+import hashlib
+import mimetypes
+import threading
+from collections import OrderedDict
+from email.utils import formatdate
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import StaticFiles, NotModifiedResponse
+
+from environment import config
+from inits.executors import io_pool
+
+FINGERPRINT_PATTERN = re.compile(rf"-[0-9a-f]{{{config.FINGERPRINT_LENGTH}}}\.[^./]+$")
+
+def is_fingerprinted(full_path):
+    # blob names are the full sha256, uploads saved with fingerprint carry a hash suffix
+    path = os.path.relpath(full_path).replace(os.sep, "/")
+    return path.startswith(f"{config.SHIMEJI_BLOBS_DIR}/") or bool(FINGERPRINT_PATTERN.search(path))
+
+def cache_headers(full_path, stat_result):
+    # files are only ever replaced by atomic rename, inode, mtime and size change with the content
+    etag_base = f"{stat_result.st_ino}-{stat_result.st_mtime_ns}-{stat_result.st_size}"
+    headers = {
+        "etag": f'"{hashlib.md5(etag_base.encode(), usedforsecurity=False).hexdigest()}"',
+        "last-modified": formatdate(stat_result.st_mtime, usegmt=True)
+    }
+    if is_fingerprinted(full_path):
+        headers["cache-control"] = config.IMMUTABLE_CACHE_CONTROL
+    else:
+        headers["cache-control"] = "no-cache"
+    return headers
+
+class CachedStaticFiles(StaticFiles):
+    """
+    StaticFiles with long lived caching for fingerprinted files, strong ETags
+    for everything else and an in-memory LRU of small hot files.
+    Cache misses are served from disk and load the file into the LRU in the background,
+    once per path however many misses arrive while it loads.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.hot_files = OrderedDict()
+        self.hot_bytes = 0
+        self.lock = threading.Lock()
+        # paths being loaded and their tasks, only touched on the event loop
+        self.loading = set()
+        self.load_tasks = set()
+
+    def file_version(self, stat_result):
+        return (stat_result.st_ino, stat_result.st_mtime_ns, stat_result.st_size)
+
+    def get_hot(self, full_path, stat_result):
+        with self.lock:
+            entry = self.hot_files.get(full_path)
+            if entry is None:
+                return None
+            version, data = entry
+            if version != self.file_version(stat_result):
+                self.hot_bytes -= len(data)
+                del self.hot_files[full_path]
+                return None
+            self.hot_files.move_to_end(full_path)
+            return data
+
+    def load_hot(self, full_path, stat_result):
+        with open(full_path, "rb") as f:
+            data = f.read()
+        if len(data) != stat_result.st_size:
+            return
+        with self.lock:
+            old = self.hot_files.pop(full_path, None)
+            if old is not None:
+                self.hot_bytes -= len(old[1])
+            self.hot_files[full_path] = (self.file_version(stat_result), data)
+            self.hot_bytes += len(data)
+            while self.hot_bytes > config.STATIC_HOT_CACHE_BYTES and self.hot_files:
+                _, (_, evicted) = self.hot_files.popitem(last=False)
+                self.hot_bytes -= len(evicted)
+
+    async def fill_hot(self, full_path, stat_result):
+        try:
+            await io_pool.run(self.load_hot, full_path, stat_result)
+        except Exception as e:
+            print(f"Failed to cache static file {full_path}: {e}")
+        finally:
+            self.loading.discard(full_path)
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        request_headers = Headers(scope=scope)
+        headers = cache_headers(full_path, stat_result)
+
+        if self.is_not_modified(headers, request_headers):
+            return NotModifiedResponse(headers)
+
+        if "range" not in request_headers:
+            data = self.get_hot(full_path, stat_result)
+            if data is not None:
+                media_type = mimetypes.guess_type(str(full_path))[0] or "text/plain"
+                return Response(data, status_code=status_code, headers=headers, media_type=media_type)
+
+            if stat_result.st_size <= config.STATIC_HOT_CACHE_MAX_FILE_SIZE and full_path not in self.loading:
+                self.loading.add(full_path)
+                task = asyncio.create_task(self.fill_hot(full_path, stat_result))
+                self.load_tasks.add(task)
+                task.add_done_callback(self.load_tasks.discard)
+
+        return FileResponse(full_path, status_code=status_code, headers=headers, stat_result=stat_result)
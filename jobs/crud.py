@@ -0,0 +1,105 @@
+from typing import Optional
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo import ReturnDocument
+from database.database_config import get_assets_db
+from environment import config
+
+def jobs_collection():
+    return get_assets_db()[config.JOBS_COLLECTION_NAME]
+
+async def enqueue_job(job_id: ObjectId, job_type: str, payload: dict) -> dict:
+    """Insert a queued job"""
+    now = datetime.utcnow()
+    job = {
+        "_id": job_id,
+        "type": job_type,
+        "status": "queued",
+        "payload": payload,
+        "attempts": 0,
+        "max_attempts": config.JOB_MAX_ATTEMPTS,
+        "lease_until": None,
+        "worker": None,
+        "stages": [],
+        "result": None,
+        "error": None,
+        "created_at": now,
+        "updated_at": now
+    }
+    await jobs_collection().insert_one(job)
+    return job
+
+async def claim_job(worker_id: str) -> Optional[dict]:
+    """Atomically take the oldest queued job, or a running job whose worker stopped renewing its lease"""
+    now = datetime.utcnow()
+    return await jobs_collection().find_one_and_update(
+        {
+            "$or": [
+                {"status": "queued"},
+                {"status": "running", "lease_until": {"$lt": now}}
+            ]
+        },
+        {
+            "$set": {
+                "status": "running",
+                "worker": worker_id,
+                "lease_until": now + timedelta(seconds=config.JOB_LEASE_SECONDS),
+                "updated_at": now
+            },
+            "$inc": {"attempts": 1}
+        },
+        sort=[("created_at", 1)],
+        return_document=ReturnDocument.AFTER
+    )
+
+async def renew_lease(job_id: ObjectId, worker_id: str) -> bool:
+    """Extend the lease, False when the job is no longer running under this worker"""
+    now = datetime.utcnow()
+    result = await jobs_collection().update_one(
+        {"_id": job_id, "worker": worker_id, "status": "running"},
+        {"$set": {"lease_until": now + timedelta(seconds=config.JOB_LEASE_SECONDS), "updated_at": now}}
+    )
+    return result.matched_count == 1
+
+async def complete_job(job_id: ObjectId, worker_id: str, result: dict, stages: list) -> bool:
+    """Returns whether this worker still owned the job"""
+    update = await jobs_collection().update_one(
+        {"_id": job_id, "worker": worker_id, "status": "running"},
+        {
+            "$set": {
+                "status": "done",
+                "result": result,
+                "error": None,
+                "lease_until": None,
+                "updated_at": datetime.utcnow()
+            },
+            "$push": {"stages": {"$each": stages}}
+        }
+    )
+    return update.matched_count == 1
+
+async def fail_job(job_id: ObjectId, worker_id: str, error: str, stages: list, retry: bool) -> Optional[str]:
+    """Queue the job again while attempts are left and the error is retryable, otherwise mark it failed.
+    Returns the new status, None when this worker no longer owned the job"""
+    job = await jobs_collection().find_one({"_id": job_id}, {"attempts": 1, "max_attempts": 1})
+    retry = retry and job is not None and job["attempts"] < job["max_attempts"]
+    status = "queued" if retry else "failed"
+    update = await jobs_collection().update_one(
+        {"_id": job_id, "worker": worker_id, "status": "running"},
+        {
+            "$set": {
+                "status": status,
+                "error": error,
+                "lease_until": None,
+                "updated_at": datetime.utcnow()
+            },
+            "$push": {"stages": {"$each": stages}}
+        }
+    )
+    return status if update.matched_count == 1 else None
+
+async def get_job(job_id: str) -> Optional[dict]:
+    job = await jobs_collection().find_one({"_id": ObjectId(job_id)}, {"payload": 0})
+    if job:
+        job["_id"] = str(job["_id"])
+    return job
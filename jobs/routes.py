@@ -0,0 +1,89 @@
+from fastapi import APIRouter, HTTPException, Request, UploadFile, File, Form
+from fastapi.responses import JSONResponse
+from bson import ObjectId
+import jobs.crud as jobs_db
+from jobs.spool import spool_uploads, remove_spool
+from jobs.worker import job_worker
+from utils.timed_route import TimedRoute
+
+router = APIRouter(prefix="/api/shimeji/jobs", tags=["jobs"], route_class=TimedRoute)
+
+async def submit_job(job_type: str, uploads: list, payload: dict) -> JSONResponse:
+    job_id = ObjectId()
+    try:
+        payload["files"] = await spool_uploads(job_id, uploads)
+        await jobs_db.enqueue_job(job_id, job_type, payload)
+    except HTTPException:
+        await remove_spool(job_id)
+        raise
+    except Exception as e:
+        await remove_spool(job_id)
+        raise HTTPException(status_code=500, detail=f"Failed to queue job: {str(e)}")
+
+    job_worker.notify()
+    return JSONResponse(
+        status_code=202,
+        content={
+            "message": "Job queued",
+            "job_id": str(job_id),
+            "status_url": f"{router.prefix}/{job_id}"
+        }
+    )
+
+@router.post("/add_assets", status_code=202, response_model=dict)
+async def add_assets(
+    request: Request,
+    categoryId: str = Form(...),
+    categoryName: str = Form(...),
+    characterName: str = Form(...),
+    images: list[UploadFile] = File(...),
+    thumbnail: UploadFile = File(...),
+    actionFile: UploadFile = File(...),
+    behaviorFile: UploadFile = File(...)
+):
+    """Queue an add_assets ingest, returns the job ID"""
+    if not images or images[0].filename == "" or not characterName:
+        return JSONResponse(
+            status_code=400,
+            content={"status": "error", "message": "Missing Body Params"}
+        )
+    uploads = [("images", image) for image in images]
+    uploads += [("thumbnail", thumbnail), ("actionFile", actionFile), ("behaviorFile", behaviorFile)]
+    return await submit_job("add_assets", uploads, {
+        "categoryId": categoryId,
+        "categoryName": categoryName,
+        "characterName": characterName
+    })
+
+@router.post("/add_categories", status_code=202, response_model=dict)
+async def add_categories(
+    request: Request,
+    categories: list[str] = Form(default=[]),
+    images: list[UploadFile] = File(default=[])
+):
+    """Queue an add_categories ingest, returns the job ID"""
+    images = [image for image in images if image.filename]
+    categories = [category for category in categories if category]
+    if not categories and not images:
+        return JSONResponse(
+            status_code=400,
+            content={"status": "error", "message": "Enter at least one field: categories or images"}
+        )
+    return await submit_job(
+        "add_categories",
+        [("images", image) for image in images],
+        {"categories": categories}
+    )
+
+@router.get("/{job_id}", response_model=dict)
+async def get_job(job_id: str):
+    """Job status with per-stage timings"""
+    if not ObjectId.is_valid(job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+    job = await jobs_db.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {
+        "message": "Job retrieved successfully",
+        "data": job
+    }
@@ -0,0 +1,53 @@
+import os
+import shutil
+from starlette.datastructures import UploadFile
+
+from environment import config
+from inits.executors import io_pool
+from utils.functions import stream_to_temp, validate_upload_sizes
+
+def job_dir(job_id) -> str:
+    return os.path.join(config.INGEST_JOBS_DIR, str(job_id))
+
+async def spool_uploads(job_id, uploads: list) -> list:
+    """Stream (field, UploadFile) pairs into the job folder, returns the payload file list"""
+    validate_upload_sizes([upload for _, upload in uploads])
+    directory = job_dir(job_id)
+    await io_pool.run(os.makedirs, directory, 0o777, True)
+    files = []
+    for index, (field, upload) in enumerate(uploads):
+        path = os.path.join(directory, f"{index}.part")
+        size, sha256 = await stream_to_temp(upload, path)
+        files.append({
+            "field": field,
+            "filename": upload.filename,
+            "size": size,
+            "sha256": sha256,
+            "path": path
+        })
+    return files
+
+async def open_spooled(files: list) -> tuple:
+    """Open spooled files as UploadFile objects, returns uploads grouped by field and the open handles"""
+    uploads = {"images": []}
+    opened = []
+    try:
+        for file in files:
+            f = await io_pool.run(open, file["path"], "rb")
+            opened.append(f)
+            upload = UploadFile(f, size=file["size"], filename=file["filename"])
+            if file["field"] == "images":
+                uploads["images"].append(upload)
+            else:
+                uploads[file["field"]] = upload
+    except BaseException:
+        await close_spooled(opened)
+        raise
+    return uploads, opened
+
+async def close_spooled(opened: list) -> None:
+    for f in opened:
+        await io_pool.run(f.close)
+
+async def remove_spool(job_id) -> None:
+    await io_pool.run(shutil.rmtree, job_dir(job_id), True)
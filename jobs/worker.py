@@ -0,0 +1,146 @@
+import os
+import socket
+import asyncio
+from fastapi import HTTPException
+
+from environment import config
+import jobs.crud as jobs_db
+from jobs.spool import open_spooled, close_spooled, remove_spool
+from controller import controller
+from utils.tracing import collect_spans
+
+async def run_add_assets(job: dict) -> dict:
+    payload = job["payload"]
+    uploads, opened = await open_spooled(payload["files"])
+    try:
+        # the job id becomes the asset id, a retried job cannot insert a second asset
+        return await controller.add_assets(
+            payload["categoryId"],
+            payload["categoryName"],
+            payload["characterName"],
+            uploads["images"],
+            uploads["thumbnail"],
+            uploads["actionFile"],
+            uploads["behaviorFile"],
+            asset_id=job["_id"]
+        )
+    finally:
+        await close_spooled(opened)
+
+async def run_add_categories(job: dict) -> dict:
+    payload = job["payload"]
+    uploads, opened = await open_spooled(payload["files"])
+    try:
+        # categories have a unique name, a retry reports already created ones as existing
+        return await controller.add_categories(
+            payload["categories"],
+            uploads["images"],
+            len(uploads["images"]) > 0
+        )
+    finally:
+        await close_spooled(opened)
+
+JOB_HANDLERS = {
+    "add_assets": run_add_assets,
+    "add_categories": run_add_categories
+}
+
+class JobWorker:
+    """
+    Runs queued ingest jobs with a fixed number of concurrent tasks.
+    Jobs are claimed with a lease that is renewed while they run, if the process
+    dies the lease expires and another worker retries the job.
+    """
+
+    def __init__(self, concurrency: int):
+        self.concurrency = concurrency
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}"
+        self.tasks = []
+        self.wakeup = None
+
+    def start(self):
+        # workers forked from a preloading master inherit its pid from import time
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}"
+        self.wakeup = asyncio.Event()
+        self.tasks = [asyncio.create_task(self.run()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    def notify(self):
+        # new job queued in this process, skip the poll delay
+        if self.wakeup is not None:
+            self.wakeup.set()
+
+    async def run(self):
+        while True:
+            try:
+                job = await jobs_db.claim_job(self.worker_id)
+            except Exception as e:
+                print(f"Failed to claim job: {e}")
+                job = None
+
+            if job is None:
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), config.JOB_POLL_INTERVAL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self.process(job)
+
+    async def keep_lease(self, job_id, handler):
+        """Renew the lease until cancelled, stop the handler and return True once it is lost"""
+        while True:
+            await asyncio.sleep(config.JOB_LEASE_SECONDS / 3)
+            try:
+                owned = await jobs_db.renew_lease(job_id, self.worker_id)
+            except Exception as e:
+                # the lease is still valid for a while, try again on the next tick
+                print(f"Failed to renew lease of job {job_id}: {e}")
+                continue
+            if not owned:
+                print(f"Lost the lease of job {job_id}, stopping it")
+                handler.cancel()
+                return True
+
+    async def process(self, job: dict):
+        with collect_spans() as spans:
+            handler = asyncio.create_task(JOB_HANDLERS[job["type"]](job))
+            lease = asyncio.create_task(self.keep_lease(job["_id"], handler))
+            try:
+                result = await handler
+                error, retry = None, False
+            except asyncio.CancelledError:
+                if not (lease.done() and not lease.cancelled() and lease.result()):
+                    raise
+                # another worker runs the job now and owns its spool
+                return
+            except HTTPException as e:
+                # client errors will fail the same way again
+                result, error, retry = None, str(e.detail), e.status_code >= 500
+            except Exception as e:
+                result, error, retry = None, str(e), True
+            finally:
+                lease.cancel()
+
+        for stage in spans:
+            stage["attempt"] = job["attempts"]
+
+        # the spool is only removed while this worker owns the job, a worker that
+        # took over after a lost lease may still be reading it
+        if error is None:
+            if await jobs_db.complete_job(job["_id"], self.worker_id, result, spans):
+                await remove_spool(job["_id"])
+            else:
+                print(f"Job {job['_id']} finished after its lease was lost, result dropped")
+        else:
+            print(f"Job {job['_id']} failed: {error}")
+            if await jobs_db.fail_job(job["_id"], self.worker_id, error, spans, retry) == "failed":
+                await remove_spool(job["_id"])
+
+job_worker = JobWorker(config.JOB_WORKER_CONCURRENCY)
@@ -4,6 +4,11 @@ from analytics.excluded_paths import EXCLUDE_PATHS
 from analytics.middleware import AnalyticsMiddleware
 from routes import router as shimeji_router
 from analytics.routes import router as analytics_router
+from database.routes import router as health_router
+from jobs.routes import router as jobs_router
+from events.routes import router as events_router
+from storage.routes import router as storage_router
+from profiling.routes import router as profiling_router
 
 #Server Initialization
 from inits.server_init import app
@@ -17,6 +22,11 @@ app.add_middleware(
 #Add routers
 app.include_router(shimeji_router)
 app.include_router(analytics_router)
+app.include_router(health_router)
+app.include_router(jobs_router)
+app.include_router(events_router)
+app.include_router(storage_router)
+app.include_router(profiling_router)
 
 #============================================================================
 #Create Assets Folder
@@ -32,4 +42,10 @@ os.makedirs(config.SHIMEJI_CATEGORIES_DIR, exist_ok=True)
 #Create Categories/Original Folder
 os.makedirs(config.SHIMEJI_CATEGORIES_ORIGINAL_DIR, exist_ok=True)
 #Create Categories/Thumbnail Folder
-os.makedirs(config.SHIMEJI_CATEGORIES_THUMBNAIL_DIR, exist_ok=True)
\ No newline at end of file
+os.makedirs(config.SHIMEJI_CATEGORIES_THUMBNAIL_DIR, exist_ok=True)
+
+
+#Create Blobs Folder
+os.makedirs(config.SHIMEJI_BLOBS_DIR, exist_ok=True)
+#Create Blobs/tmp Folder
+os.makedirs(config.SHIMEJI_BLOBS_TEMP_DIR, exist_ok=True)
\ No newline at end of file
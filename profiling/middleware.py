@@ -0,0 +1,52 @@
+import os
+import hmac
+import random
+
+from environment import config
+from profiling.sampler import profiler, current_profile
+
+def authorized(token: str) -> bool:
+    expected = os.environ.get(config.PROFILE_TOKEN_ENV)
+    return bool(expected and token) and hmac.compare_digest(token.encode(), expected.encode())
+
+class ProfilingMiddleware:
+    """
+    Profiles a PROFILE_SAMPLE_RATE share of requests, and every request whose
+    PROFILE_HEADER carries the profile token. The id of a recorded profile is
+    returned in the X-Profile-Id response header.
+    Plain ASGI so the endpoint runs in the task that is profiled
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        reason = None
+        for name, value in scope["headers"]:
+            if name == config.PROFILE_HEADER.encode() and authorized(value.decode("latin-1")):
+                reason = "header"
+                break
+        if reason is None and config.PROFILE_SAMPLE_RATE and random.random() < config.PROFILE_SAMPLE_RATE:
+            reason = "sampled"
+        if reason is None or scope["path"].startswith(config.PROFILE_ROUTE):
+            return await self.app(scope, receive, send)
+
+        profile = profiler.start(scope["method"], scope["path"], reason)
+        token = current_profile.set(profile)
+        status_code = 500
+
+        async def send_with_id(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message = {**message, "headers": [*message.get("headers", []), (b"x-profile-id", profile.id.encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            current_profile.reset(token)
+            profiler.finish(profile, status_code)
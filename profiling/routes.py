@@ -0,0 +1,43 @@
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Header, Query
+from fastapi.responses import PlainTextResponse
+
+from environment import config
+from profiling.middleware import authorized
+from profiling.sampler import profiler
+
+router = APIRouter(prefix=config.PROFILE_ROUTE, tags=["profiles"])
+
+def require_token(token):
+    if not authorized(token or ""):
+        raise HTTPException(
+            status_code=403,
+            detail=f"Profiles need a valid {config.PROFILE_HEADER} header"
+        )
+
+@router.get("", response_model=dict)
+async def list_profiles(
+    x_profile_token: Optional[str] = Header(None, alias=config.PROFILE_HEADER)
+):
+    """Recorded profiles, newest first"""
+    require_token(x_profile_token)
+    return {"profiles": profiler.list()}
+
+@router.get("/{profile_id}")
+async def download_profile(
+    profile_id: str,
+    kind: str = Query("wall", pattern="^(wall|cpu)$", description="wall: all samples, cpu: samples running on the event loop"),
+    x_profile_token: Optional[str] = Header(None, alias=config.PROFILE_HEADER)
+):
+    """Folded stacks for flamegraph.pl, speedscope or inferno"""
+    require_token(x_profile_token)
+    profile = profiler.get(profile_id)
+    if not profile:
+        raise HTTPException(
+            status_code=404,
+            detail="Profile not found"
+        )
+    return PlainTextResponse(
+        profile.folded(kind),
+        headers={"Content-Disposition": f'attachment; filename="{profile_id}-{kind}.folded"'}
+    )
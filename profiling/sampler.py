@@ -0,0 +1,218 @@
+import os
+import sys
+import time
+import uuid
+import asyncio
+import threading
+from collections import Counter, deque
+from contextvars import ContextVar
+from datetime import datetime
+
+from environment import config
+
+#============================================================================
+# Request profiler
+# A sampling thread visits the tasks of every profiled request at a fixed
+# interval. A task whose coroutine is running is on the CPU, and its stack
+# is read from the event loop thread. A suspended task's stack is rebuilt
+# from its chain of awaiting coroutines, so time spent waiting on Motor or
+# on an executor shows up where it was awaited. Executor waits end in a
+# frame that names the pool and the function, e.g. "<io pool: write_chunk>".
+# Tasks a request starts, such as gather children, inherit its context and
+# are tracked through the loop's task factory. Finished profiles are kept in
+# a ring buffer.
+#============================================================================
+
+# profile of the request running in this context, None when it is not profiled
+current_profile = ContextVar("current_profile", default=None)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def frame_label(code):
+    """Function and file, the first line keeps all samples of a function together"""
+    path = code.co_filename
+    if path.startswith(ROOT):
+        path = os.path.relpath(path, ROOT)
+    elif "site-packages" in path:
+        path = path.split("site-packages" + os.sep, 1)[1]
+    else:
+        path = os.path.basename(path)
+    # ";" separates frames in the folded format
+    return f"{code.co_qualname} ({path}:{code.co_firstlineno})".replace(";", ",")
+
+def executor_label(frame):
+    # WorkerPool.run awaiting run_in_executor, name the pool and the function it runs
+    if frame.f_code.co_qualname != "WorkerPool.run":
+        return None
+    local_vars = frame.f_locals
+    pool, func = local_vars.get("self"), local_vars.get("func")
+    name = getattr(func, "__qualname__", None) or getattr(type(func), "__qualname__", "?")
+    return f"<{getattr(pool, 'name', '?')} pool: {name}>"
+
+def running_stack(thread_frame, root_frame):
+    """Frames of the loop thread from the task's coroutine down, None if the task is not among them"""
+    frames = []
+    frame = thread_frame
+    while frame is not None:
+        frames.append(frame)
+        if frame is root_frame:
+            return [frame_label(f.f_code) for f in reversed(frames)]
+        frame = frame.f_back
+    return None
+
+def awaiting_stack(coro):
+    labels = []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        labels.append(frame_label(frame.f_code))
+        executor = executor_label(frame)
+        if executor:
+            labels.append(executor)
+            return labels
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    if coro is not None:
+        labels.append(f"<await {type(coro).__name__}>")
+    return labels
+
+class Profile:
+    def __init__(self, method: str, path: str, reason: str, interval: float):
+        self.id = uuid.uuid4().hex[:16]
+        self.method = method
+        self.path = path
+        self.reason = reason
+        self.interval = interval
+        self.thread_id = threading.get_ident()
+        self.started_at = datetime.utcnow()
+        self.start = time.perf_counter()
+        self.duration_ms = None
+        self.status_code = None
+        self.tasks = set()
+        self.task_count = 0
+        self.wall = Counter()
+        self.cpu = Counter()
+        self.samples = 0
+
+    def sample(self, thread_frame):
+        self.samples += 1
+        for task in list(self.tasks):
+            if task.done():
+                continue
+            coro = task.get_coro()
+            if getattr(coro, "cr_running", False):
+                stack = running_stack(thread_frame, coro.cr_frame)
+                if stack is None:
+                    continue
+                self.cpu[";".join(stack)] += 1
+            else:
+                stack = awaiting_stack(coro)
+                if not stack:
+                    continue
+            self.wall[";".join(stack)] += 1
+
+    def folded(self, kind: str) -> str:
+        """Brendan Gregg's folded stacks, one "frame;frame;frame count" line per stack"""
+        counts = self.cpu if kind == "cpu" else self.wall
+        return "".join(f"{stack} {count}\n" for stack, count in counts.most_common())
+
+    def summary(self):
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "reason": self.reason,
+            "status_code": self.status_code,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": self.duration_ms,
+            "interval_ms": self.interval * 1000,
+            "samples": self.samples,
+            "tasks": self.task_count or len(self.tasks),
+            # each CPU sample stands for one interval on the event loop thread
+            "cpu_ms": round(sum(self.cpu.values()) * self.interval * 1000, 2)
+        }
+
+class Profiler:
+    def __init__(self, interval: float, max_seconds: float, buffer_size: int):
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.active = []
+        self.finished = deque(maxlen=buffer_size)
+        self.lock = threading.Lock()
+        self.thread = None
+        self.factory_loops = set()
+
+    def install_task_factory(self, loop):
+        if loop in self.factory_loops:
+            return
+        previous = loop.get_task_factory()
+
+        def task_factory(loop, coro, **kwargs):
+            if previous is not None:
+                task = previous(loop, coro, **kwargs)
+            else:
+                task = asyncio.Task(coro, loop=loop, **kwargs)
+            profile = current_profile.get()
+            if profile is not None:
+                profile.tasks.add(task)
+            return task
+
+        loop.set_task_factory(task_factory)
+        self.factory_loops.add(loop)
+
+    def start(self, method: str, path: str, reason: str) -> Profile:
+        """Profile the current task and the tasks it starts until finish is called"""
+        self.install_task_factory(asyncio.get_running_loop())
+        profile = Profile(method, path, reason, self.interval)
+        profile.tasks.add(asyncio.current_task())
+        with self.lock:
+            self.active.append(profile)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="request-profiler", daemon=True)
+                self.thread.start()
+        return profile
+
+    def finish(self, profile: Profile, status_code: int):
+        profile.duration_ms = round((time.perf_counter() - profile.start) * 1000, 2)
+        profile.status_code = status_code
+        with self.lock:
+            if profile in self.active:
+                self.active.remove(profile)
+        # the ring buffer keeps the samples, not the finished tasks
+        profile.task_count = len(profile.tasks)
+        profile.tasks = set()
+        self.finished.append(profile)
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            with self.lock:
+                # long streams stop being sampled, their profile is still stored when they end
+                now = time.perf_counter()
+                self.active = [profile for profile in self.active if now - profile.start < self.max_seconds]
+                active = list(self.active)
+                if not active:
+                    self.thread = None
+                    return
+            frames = sys._current_frames()
+            for profile in active:
+                try:
+                    profile.sample(frames.get(profile.thread_id))
+                except RuntimeError:
+                    # the task set changed while it was copied, skip this tick
+                    pass
+
+    def get(self, profile_id: str):
+        for profile in self.finished:
+            if profile.id == profile_id:
+                return profile
+        return None
+
+    def list(self):
+        return [profile.summary() for profile in reversed(self.finished)]
+
+profiler = Profiler(
+    config.PROFILE_INTERVAL_MS / 1000,
+    config.PROFILE_MAX_SECONDS,
+    config.PROFILE_BUFFER_SIZE
+)
@@ -1,10 +1,12 @@
-from fastapi import APIRouter, Request, UploadFile, File, Form
+from fastapi import APIRouter, Request, UploadFile, File, Form, Query
 from fastapi import HTTPException
 from fastapi.responses import JSONResponse
 
 from controller import controller
+from database.assets_model import UploadSessionRequest
+from utils.timed_route import TimedRoute
 
-router = APIRouter(prefix="/api/shimeji", tags=["shimeji"])
+router = APIRouter(prefix="/api/shimeji", tags=["shimeji"], route_class=TimedRoute)
 
 @router.get("/", response_model=dict)
 async def read_root():
@@ -42,6 +44,14 @@ async def get_categories():
     result = await controller.get_all_categories()
     return result
 
+@router.get("/changes", response_model=dict)
+async def get_changes(
+    since: int = Query(0, ge=0, description="Catalog revision the client is synced to, 0 for a full sync"),
+    limit: int = Query(None, ge=1, le=5000, description="Documents per kind in one page")
+):
+    result = await controller.get_changes(since, limit)
+    return result
+
 @router.post("/add_assets", response_model=dict)
 async def add_assets(
     request: Request,
@@ -71,6 +81,51 @@ async def add_assets(
 
     return result
 
+@router.post("/uploads", response_model=dict)
+async def create_upload_session(
+    session: UploadSessionRequest
+):
+    # resumable alternative to add_assets for large packs
+    result = await controller.create_upload_session(session)
+    return result
+
+@router.get("/uploads/{upload_id}", response_model=dict)
+async def get_upload_session(
+    upload_id: str
+):
+    # received bytes per file, clients resume each file from there
+    result = await controller.get_upload_session(upload_id)
+    return result
+
+@router.put("/uploads/{upload_id}/files/{file_id}", response_model=dict)
+async def put_upload_chunk(
+    request: Request,
+    upload_id: str,
+    file_id: str,
+    offset: int = Query(..., ge=0, description="Byte offset of this chunk in the file")
+):
+    if "content-length" not in request.headers:
+        raise HTTPException(
+            status_code=411,
+            detail="Content-Length is required"
+        )
+    # body is streamed straight to disk without multipart parsing
+    result = await controller.put_upload_chunk(
+        upload_id,
+        file_id,
+        offset,
+        request.stream(),
+        request.headers.get("x-chunk-sha256")
+    )
+    return result
+
+@router.post("/uploads/{upload_id}/finalize", response_model=dict)
+async def finalize_upload_session(
+    upload_id: str
+):
+    result = await controller.finalize_upload_session(upload_id)
+    return result
+
 @router.get("/get_assets", response_model=dict)
 async def get_assets(
     request: Request
@@ -81,6 +136,14 @@ async def get_assets(
     result = await controller.get_assets(category_id)
     return result
 
+@router.get("/assets/{asset_id}/bundle")
+async def get_asset_bundle(
+    request: Request,
+    asset_id: str
+):
+    # ZIP of all frames with actions.xml and behaviors.xml, supports Range for resume
+    return await controller.get_asset_bundle(asset_id, request.headers.get("range"))
+
 @router.put("/updateAsset", response_model=dict)
 async def updateAsset(
     request: Request
@@ -139,3 +202,17 @@ async def update_thumbnail(
     
     result = await controller.update_thumbnail(asset_id, thumbnail)
     return result
+
+@router.get("/duplicates", response_model=dict)
+async def find_duplicates(
+    max_distance: int = Query(None, ge=0, le=32, description="Largest Hamming distance between the perceptual hashes of two frames")
+):
+    result = await controller.find_duplicates(max_distance)
+    return result
+
+@router.delete("/cleanup_blobs", response_model=dict)
+async def cleanup_blobs(
+    grace_seconds: int = Query(None, ge=0, description="Keep unreferenced blobs younger than this many seconds")
+):
+    result = await controller.cleanup_blobs(grace_seconds)
+    return result
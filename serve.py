@@ -0,0 +1,79 @@
+import os
+
+from gunicorn.app.base import BaseApplication
+from uvicorn_worker import UvicornWorker
+
+from environment import config
+from inits.executors import image_pool
+
+#============================================================================
+# Production entry point, run.py stays the single process reloading dev server.
+#   python serve.py
+# A gunicorn master forks uvicorn workers running on uvloop and httptools.
+# The app is imported once in the master, so import errors stop the deploy
+# before a worker starts and workers share the imported modules copy-on-write.
+# A worker is replaced after SERVER_MAX_REQUESTS (plus jitter) requests.
+#
+# Signals to the master
+#   HUP        replace the workers gracefully, the preloaded code is kept,
+#              restart the master to deploy new code
+#   TERM       stop gracefully, workers finish in-flight requests and run the
+#              shutdown lifespan within SERVER_GRACEFUL_TIMEOUT
+#   INT, QUIT  stop immediately
+#   TTIN, TTOU add or remove a worker
+#
+# Per-process state, created in each worker after the fork and never shared
+#   - Motor client and connection pool, MongoDB sees up to
+#     workers * MONGODB_MAX_POOL_SIZE connections
+#   - image and io pools, started on first use and reset in forked children.
+#     With IMAGE_WORKERS = 0 the cores are split between the workers
+#   - the hot static file LRU, buffered download counters, SSE subscriptions,
+#     request profiles and the S3 client
+#   - job worker tasks and the event bus tail, named after the worker pid
+# Catalog events reach the other workers of the host through EVENTS_BUS_PATH,
+# everything else that has to be shared lives in MongoDB.
+#============================================================================
+
+class Worker(UvicornWorker):
+    CONFIG_KWARGS = {"loop": "uvloop", "http": "httptools"}
+
+class Server(BaseApplication):
+    def __init__(self, options: dict):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        from main import app
+        return app
+
+def env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+def server_options() -> dict:
+    host = os.environ.get("HOST") or config.SERVER_HOST
+    port = env_int("PORT", config.SERVER_PORT)
+    workers = env_int("WEB_CONCURRENCY", config.SERVER_WORKERS) or os.cpu_count() or 1
+    return {
+        "bind": f"{host}:{port}",
+        "workers": workers,
+        "worker_class": Worker,
+        "preload_app": True,
+        "max_requests": config.SERVER_MAX_REQUESTS,
+        "max_requests_jitter": config.SERVER_MAX_REQUESTS_JITTER,
+        "graceful_timeout": config.SERVER_GRACEFUL_TIMEOUT,
+        "keepalive": config.SERVER_KEEPALIVE_SECONDS,
+        "accesslog": "-"
+    }
+
+if __name__ == "__main__":
+    options = server_options()
+    if not config.IMAGE_WORKERS:
+        # one image process per core in every worker would oversubscribe the host
+        image_pool.max_workers = max((os.cpu_count() or 1) // options["workers"], 1)
+    print(f"Serving on {options['bind']} with {options['workers']} workers")
+    Server(options).run()
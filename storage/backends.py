@@ -0,0 +1,236 @@
+import os
+import uuid
+import mimetypes
+from io import BytesIO
+
+from environment import config
+from inits.executors import io_pool
+from inits.static_files import is_fingerprinted
+from utils.functions import remove_file
+
+#============================================================================
+# Storage backends
+# Stored files are addressed by a key, the path relative to the working
+# directory the local backend has always used, e.g.
+# "static/Blobs/ab/cd/<sha256>.webp". Moving to object storage is then a copy
+# of the static folder. Backends implement the blocking "_sync" primitives.
+# The async methods run them in the I/O pool. Code that already runs in a
+# worker, such as atlas packing or bundle streaming, calls the primitives
+# directly.
+#============================================================================
+
+class Storage:
+    async def put_file(self, source_path, key):
+        """Move a finished local file into storage, returns False when the key already existed"""
+        return await io_pool.run(self.put_file_sync, source_path, key)
+
+    async def put_bytes(self, data, key):
+        return await io_pool.run(self.put_bytes_sync, data, key)
+
+    async def exists(self, key):
+        return await io_pool.run(self.exists_sync, key)
+
+    async def delete(self, key):
+        await io_pool.run(self.delete_sync, key)
+
+    async def delete_if_older(self, key, cutoff_ts):
+        """Delete a file not modified since cutoff_ts, returns False when it was kept"""
+        return await io_pool.run(self.delete_if_older_sync, key, cutoff_ts)
+
+    async def read(self, key):
+        return await io_pool.run(self.read_sync, key)
+
+    async def list(self, prefix):
+        """{key: modification timestamp} of every file under prefix"""
+        return await io_pool.run(self.list_sync, prefix)
+
+    def read_sync(self, key):
+        with self.open_sync(key) as f:
+            return f.read()
+
+    def presigned_url(self, key):
+        return None
+
+class LocalStorage(Storage):
+    def __init__(self, root: str):
+        self.root = root
+
+    def path(self, key):
+        return os.path.join(self.root, key)
+
+    def claim_existing(self, path):
+        # refresh the mtime so the orphan sweep does not take a file that is being claimed
+        if not os.path.exists(path):
+            return False
+        os.utime(path)
+        return True
+
+    def put_file_sync(self, source_path, key):
+        final_path = self.path(key)
+        if os.path.abspath(source_path) == os.path.abspath(final_path):
+            return True
+        # identical content is already stored, drop the new copy
+        if self.claim_existing(final_path):
+            remove_file(source_path)
+            return False
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        os.replace(source_path, final_path)
+        return True
+
+    def put_bytes_sync(self, data, key):
+        final_path = self.path(key)
+        if self.claim_existing(final_path):
+            return False
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        temp_path = os.path.join(os.path.dirname(final_path), f".{uuid.uuid4().hex}.part")
+        try:
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, final_path)
+        except BaseException:
+            remove_file(temp_path)
+            raise
+        return True
+
+    def exists_sync(self, key):
+        return os.path.isfile(self.path(key))
+
+    def delete_sync(self, key):
+        remove_file(self.path(key))
+
+    def delete_if_older_sync(self, key, cutoff_ts):
+        try:
+            if os.path.getmtime(self.path(key)) >= cutoff_ts:
+                return False
+        except FileNotFoundError:
+            return False
+        remove_file(self.path(key))
+        return True
+
+    def open_sync(self, key):
+        return open(self.path(key), "rb")
+
+    def list_sync(self, prefix):
+        files = {}
+        for root, dirs, names in os.walk(self.path(prefix)):
+            for name in names:
+                path = os.path.join(root, name)
+                files[os.path.relpath(path, self.root).replace(os.sep, "/")] = os.path.getmtime(path)
+        return files
+
+class S3Storage(Storage):
+    """
+    S3 compatible object storage (AWS, MinIO, R2). Files above
+    S3_MULTIPART_THRESHOLD are sent as a multipart upload with
+    S3_MULTIPART_CONCURRENCY parts in flight. Credentials come from the usual
+    AWS environment variables or .env file
+    """
+
+    def __init__(self, bucket: str, endpoint_url: str, region: str):
+        self.bucket = bucket
+        self.endpoint_url = endpoint_url
+        self.region = region
+        self.client = None
+        self.transfer_config = None
+
+    def get_client(self):
+        # created on first use, every worker process builds its own client
+        if self.client is None:
+            import boto3
+            from boto3.s3.transfer import TransferConfig
+            self.client = boto3.client("s3", endpoint_url=self.endpoint_url, region_name=self.region)
+            self.transfer_config = TransferConfig(
+                multipart_threshold=config.S3_MULTIPART_THRESHOLD,
+                multipart_chunksize=config.S3_MULTIPART_CHUNK_SIZE,
+                max_concurrency=config.S3_MULTIPART_CONCURRENCY
+            )
+        return self.client
+
+    def upload_args(self, key):
+        return {
+            "ContentType": mimetypes.guess_type(key)[0] or "application/octet-stream",
+            "CacheControl": config.IMMUTABLE_CACHE_CONTROL if is_fingerprinted(key) else "no-cache"
+        }
+
+    def claim_existing(self, key):
+        if not self.exists_sync(key):
+            return False
+        # copying an object onto itself refreshes LastModified for the orphan sweep
+        self.get_client().copy_object(
+            Bucket=self.bucket,
+            Key=key,
+            CopySource={"Bucket": self.bucket, "Key": key},
+            MetadataDirective="REPLACE",
+            **self.upload_args(key)
+        )
+        return True
+
+    def put_file_sync(self, source_path, key):
+        created = not self.claim_existing(key)
+        if created:
+            client = self.get_client()
+            client.upload_file(source_path, self.bucket, key, ExtraArgs=self.upload_args(key), Config=self.transfer_config)
+        remove_file(source_path)
+        return created
+
+    def put_bytes_sync(self, data, key):
+        if self.claim_existing(key):
+            return False
+        client = self.get_client()
+        client.upload_fileobj(BytesIO(data), self.bucket, key, ExtraArgs=self.upload_args(key), Config=self.transfer_config)
+        return True
+
+    def exists_sync(self, key):
+        from botocore.exceptions import ClientError
+        try:
+            self.get_client().head_object(Bucket=self.bucket, Key=key)
+            return True
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def delete_sync(self, key):
+        self.get_client().delete_object(Bucket=self.bucket, Key=key)
+
+    def delete_if_older_sync(self, key, cutoff_ts):
+        from botocore.exceptions import ClientError
+        try:
+            modified = self.get_client().head_object(Bucket=self.bucket, Key=key)["LastModified"]
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+        if modified.timestamp() >= cutoff_ts:
+            return False
+        self.delete_sync(key)
+        return True
+
+    def open_sync(self, key):
+        # streaming body, read in chunks without holding the object in memory
+        return self.get_client().get_object(Bucket=self.bucket, Key=key)["Body"]
+
+    def list_sync(self, prefix):
+        files = {}
+        paginator = self.get_client().get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=f"{prefix.rstrip('/')}/"):
+            for item in page.get("Contents", []):
+                files[item["Key"]] = item["LastModified"].timestamp()
+        return files
+
+    def presigned_url(self, key):
+        return self.get_client().generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": key},
+            ExpiresIn=config.S3_PRESIGNED_URL_SECONDS
+        )
+
+def create_storage():
+    if config.STORAGE_BACKEND == "s3":
+        return S3Storage(config.S3_BUCKET, config.S3_ENDPOINT_URL, config.S3_REGION)
+    if config.STORAGE_BACKEND == "local":
+        # the static mount serves the working directory
+        return LocalStorage(".")
+    raise ValueError(f"Unknown storage backend {config.STORAGE_BACKEND}")
+
+storage = create_storage()
@@ -0,0 +1,20 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import RedirectResponse
+
+from environment import config
+from inits.executors import io_pool
+from storage.urls import FILES_ROUTE, redirect_url
+
+router = APIRouter(prefix=FILES_ROUTE, tags=["files"])
+
+@router.get("/{key:path}")
+async def get_file(key: str):
+    """Redirect to the stored file, the API process never serves its bytes"""
+    # only catalog files are published
+    if not key.startswith(f"{config.STATIC_DIR}/") or ".." in key.split("/"):
+        raise HTTPException(
+            status_code=404,
+            detail="File not found"
+        )
+    url = await io_pool.run(redirect_url, key)
+    return RedirectResponse(url, status_code=307)
@@ -0,0 +1,42 @@
+from urllib.parse import urlsplit, quote, unquote
+
+from environment import config
+from storage.backends import storage
+
+#============================================================================
+# File URLs
+# "direct" stores STORAGE_PUBLIC_URL/<key>, the local static mount, a CDN in
+# front of it or a public bucket. "presigned" stores a URL of the files route,
+# which redirects to a short lived presigned URL of the bucket. Either way the
+# bytes never go through the API process. URLs of any known base still map
+# back to their key, so documents written before a base change keep working.
+#============================================================================
+
+FILES_ROUTE = "/api/shimeji/files"
+
+def url_bases():
+    bases = [
+        f"{config.IMAGE_URL_PREFIX}{FILES_ROUTE}/",
+        f"{config.STORAGE_PUBLIC_URL.rstrip('/')}/",
+        f"{config.IMAGE_URL_PREFIX}/"
+    ]
+    # the longest base first, the API prefix is also a prefix of the files route
+    return sorted(set(bases), key=len, reverse=True)
+
+def file_url(key):
+    if config.STORAGE_URL_MODE == "presigned":
+        return f"{config.IMAGE_URL_PREFIX}{FILES_ROUTE}/{quote(key)}"
+    return f"{config.STORAGE_PUBLIC_URL.rstrip('/')}/{quote(key)}"
+
+def storage_key_from_url(url):
+    if not url:
+        return None
+    url = url.split("?", 1)[0]
+    for base in url_bases():
+        if url.startswith(base):
+            return unquote(url[len(base):])
+    return None
+
+def redirect_url(key):
+    """Where the files route sends a client, presigned when the backend supports it"""
+    return storage.presigned_url(key) or f"{config.STORAGE_PUBLIC_URL.rstrip('/')}/{quote(key)}"
@@ -0,0 +1,81 @@
+import hashlib
+from io import BytesIO
+
+from environment.config import (
+    ANIMATED_WEBP_QUALITY, IMAGE_WEBP_METHOD,
+    GIF_MIN_FRAME_DURATION_MS, GIF_DEFAULT_FRAME_DURATION_MS
+)
+from inits.executors import image_pool
+from storage.backends import storage
+
+#============================================================================
+# Animated thumbnails
+# GIFs are decoded to composited RGBA frames. Consecutive identical frames are
+# collapsed into one with their durations merged, and the frames are encoded
+# as an animated WebP. The libwebp animation encoder stores each frame as the
+# sub-rectangle that differs from its predecessor.
+#============================================================================
+
+def frame_duration(frame):
+    duration = frame.info.get("duration") or 0
+    if duration < GIF_MIN_FRAME_DURATION_MS:
+        return GIF_DEFAULT_FRAME_DURATION_MS
+    return duration
+
+def collapse_frames(image):
+    """Return [{"image", "duration"}] with repeated frames merged"""
+    import numpy as np
+    from PIL import ImageSequence
+
+    frames = []
+    previous = None
+    for frame in ImageSequence.Iterator(image):
+        rgba = frame.convert("RGBA")
+        pixels = np.asarray(rgba)
+        duration = frame_duration(frame)
+        if previous is not None and np.array_equal(pixels, previous):
+            frames[-1]["duration"] += duration
+            continue
+        frames.append({"image": rgba, "duration": duration})
+        previous = pixels
+    return frames
+
+def transcode_gif(content):
+    """Encode a GIF as an animated WebP, returns the WebP bytes and frame stats"""
+    from PIL import Image
+
+    with Image.open(BytesIO(content)) as image:
+        if image.format != "GIF":
+            raise ValueError("Thumbnail is not a GIF image")
+        source_frames = getattr(image, "n_frames", 1)
+        # without a NETSCAPE loop extension a gif plays once
+        loop = image.info.get("loop")
+        loop = 1 if loop is None else loop
+        frames = collapse_frames(image)
+
+    buffer = BytesIO()
+    first, rest = frames[0]["image"], [frame["image"] for frame in frames[1:]]
+    first.save(
+        buffer, "WEBP",
+        save_all=True,
+        append_images=rest,
+        duration=[frame["duration"] for frame in frames],
+        loop=loop,
+        quality=ANIMATED_WEBP_QUALITY,
+        method=IMAGE_WEBP_METHOD,
+        allow_mixed=True
+    )
+    data = buffer.getvalue()
+    return {
+        "data": data,
+        "sha256": hashlib.sha256(data).hexdigest(),
+        "source_frames": source_frames,
+        "frames": len(frames)
+    }
+
+def transcode_stored_gif(key):
+    # the GIF is read inside the worker, the event loop never holds it
+    return transcode_gif(storage.read_sync(key))
+
+async def transcode_gif_async(key):
+    return await image_pool.run(transcode_stored_gif, key)
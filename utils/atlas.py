@@ -0,0 +1,83 @@
+import json
+import math
+import hashlib
+from io import BytesIO
+
+from environment.config import IMAGE_FORMAT, IMAGE_WEBP_METHOD, ATLAS_PADDING, ATLAS_MAX_SIDE
+from storage.backends import storage
+
+def pack_rectangles(sizes, padding=ATLAS_PADDING):
+    """
+    Shelf packing, tallest rectangles first, on a strip about as wide as the
+    square root of the total area. Shimeji frames are mostly the same size so
+    shelves fill almost completely. Returns positions in input order and the atlas size.
+    """
+    total_area = sum((width + padding) * (height + padding) for width, height in sizes)
+    widest = max(width for width, _ in sizes) + padding
+    atlas_width = max(widest, math.ceil(math.sqrt(total_area)))
+
+    order = sorted(range(len(sizes)), key=lambda i: (sizes[i][1], sizes[i][0]), reverse=True)
+    positions = [None] * len(sizes)
+    x = y = shelf_height = used_width = 0
+    for i in order:
+        width, height = sizes[i]
+        if x > 0 and x + width + padding > atlas_width:
+            # start a new shelf
+            y += shelf_height
+            x = shelf_height = 0
+        positions[i] = (x, y)
+        x += width + padding
+        shelf_height = max(shelf_height, height + padding)
+        used_width = max(used_width, x)
+
+    return positions, (used_width - padding, y + shelf_height - padding)
+
+def build_atlas(frames):
+    """
+    Pack frames [(name, storage key)] into one lossless WebP image and a JSON frame map.
+    Identical frames are packed once and share their rectangle.
+    """
+    from PIL import Image
+
+    images = {}
+    frame_digests = []
+    for name, key in frames:
+        content = storage.read_sync(key)
+        digest = hashlib.sha256(content).hexdigest()
+        if digest not in images:
+            with Image.open(BytesIO(content)) as image:
+                images[digest] = image.convert("RGBA")
+        frame_digests.append((name, digest))
+
+    digests = list(images.keys())
+    positions, (width, height) = pack_rectangles([images[digest].size for digest in digests])
+    if max(width, height) > ATLAS_MAX_SIDE:
+        raise ValueError(f"Atlas of {width}x{height} exceeds {ATLAS_MAX_SIDE}px")
+
+    atlas = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+    rects = {}
+    for digest, (x, y) in zip(digests, positions):
+        image = images[digest]
+        atlas.paste(image, (x, y))
+        rects[digest] = {"x": x, "y": y, "w": image.width, "h": image.height}
+
+    buffer = BytesIO()
+    atlas.save(buffer, IMAGE_FORMAT, lossless=True, quality=100, exact=True, method=IMAGE_WEBP_METHOD)
+    image_data = buffer.getvalue()
+
+    frame_map = {
+        "width": width,
+        "height": height,
+        "frames": {name: rects[digest] for name, digest in frame_digests}
+    }
+    map_data = json.dumps(frame_map, separators=(",", ":")).encode()
+
+    return {
+        "image": image_data,
+        "image_sha256": hashlib.sha256(image_data).hexdigest(),
+        "map": map_data,
+        "map_sha256": hashlib.sha256(map_data).hexdigest(),
+        "width": width,
+        "height": height,
+        "frame_count": len(frame_digests)
+    }
@@ -0,0 +1,174 @@
+import os
+import time
+import uuid
+import asyncio
+from collections import Counter
+from datetime import datetime, timedelta
+
+from pymongo import UpdateOne
+
+from environment import config
+from database.database_config import get_assets_db
+from inits.executors import io_pool
+from utils.functions import stream_to_temp, remove_file, validate_upload_sizes
+from storage.backends import storage
+from storage.urls import file_url, storage_key_from_url
+
+#============================================================================
+# Content addressed blob store
+# Files are stored once under static/Blobs/<h[0:2]>/<h[2:4]>/<sha256><ext> of the
+# storage backend, the key is "<sha256><ext>". Every document referencing a blob holds
+# one reference in the blobs collection, blobs that drop to zero references are
+# removed by collect_garbage. Storing a blob first refreshes its document and
+# then claims the file, which refreshes its modification time. The GC deletes
+# the document only while it is still stale, and the file only while its
+# modification time is, so a blob claimed again during a GC pass is kept.
+#============================================================================
+
+def blob_key(sha256, filename):
+    ext = os.path.splitext(filename)[1].lower()
+    return f"{sha256}{ext}"
+
+def blob_path(key):
+    return os.path.join(config.SHIMEJI_BLOBS_DIR, key[0:2], key[2:4], key)
+
+def blob_url(key):
+    return file_url(blob_path(key))
+
+def key_from_url(url):
+    # blob urls end with the key, anything outside the blob dir is not a blob
+    path = storage_key_from_url(url)
+    if not path or not path.startswith(f"{config.SHIMEJI_BLOBS_DIR}/"):
+        return None
+    return path.rsplit("/", 1)[-1]
+
+async def touch_blob(key):
+    """Keep the GC away from a blob about to be stored or claimed, before its references are added"""
+    now = datetime.utcnow()
+    await get_assets_db()[config.BLOBS_COLLECTION_NAME].update_one(
+        {"_id": key},
+        {
+            "$set": {"path": blob_path(key), "updated_at": now},
+            "$setOnInsert": {"refs": 0, "created_at": now}
+        },
+        upsert=True
+    )
+
+async def store_blob(file):
+    """Stream an upload into the blob store, returns key, url, size and sha256"""
+    temp_path = os.path.join(config.SHIMEJI_BLOBS_TEMP_DIR, f"{uuid.uuid4().hex}.part")
+    size, sha256 = await stream_to_temp(file, temp_path)
+    key = blob_key(sha256, file.filename)
+    try:
+        await touch_blob(key)
+        created = await storage.put_file(temp_path, blob_path(key))
+    except BaseException:
+        await io_pool.run(remove_file, temp_path)
+        raise
+
+    return {
+        "key": key,
+        "url": blob_url(key),
+        "size": size,
+        "sha256": sha256,
+        "created": created
+    }
+
+async def store_blob_data(data, sha256, ext):
+    """Store bytes that were produced in memory, such as encoded renditions"""
+    key = f"{sha256}{ext}"
+    await touch_blob(key)
+    created = await storage.put_bytes(data, blob_path(key))
+
+    return {
+        "key": key,
+        "url": blob_url(key),
+        "size": len(data),
+        "sha256": sha256,
+        "created": created
+    }
+
+async def store_blobs(files, parallelism=None):
+    """Store uploads concurrently with at most `parallelism` in flight.
+    Blobs written before a failure stay unreferenced and are collected by the GC"""
+    validate_upload_sizes(files)
+    limit = asyncio.Semaphore(parallelism or config.UPLOAD_PARALLELISM)
+
+    async def store(file):
+        async with limit:
+            return await store_blob(file)
+
+    return await asyncio.gather(*[store(file) for file in files])
+
+async def add_blob_refs(keys):
+    """Add one reference per key occurrence"""
+    if not keys:
+        return
+    collection = get_assets_db()[config.BLOBS_COLLECTION_NAME]
+    now = datetime.utcnow()
+    await collection.bulk_write([
+        UpdateOne(
+            {"_id": key},
+            {
+                "$inc": {"refs": count},
+                "$set": {"path": blob_path(key), "updated_at": now},
+                "$setOnInsert": {"created_at": now}
+            },
+            upsert=True
+        )
+        for key, count in Counter(keys).items()
+    ], ordered=False)
+
+async def release_blob_refs(keys):
+    """Drop one reference per key occurrence"""
+    if not keys:
+        return
+    collection = get_assets_db()[config.BLOBS_COLLECTION_NAME]
+    now = datetime.utcnow()
+    await collection.bulk_write([
+        UpdateOne({"_id": key}, {"$inc": {"refs": -count}, "$set": {"updated_at": now}})
+        for key, count in Counter(keys).items()
+    ], ordered=False)
+
+async def list_blob_files():
+    blob_files = {}
+    for path, mtime in (await storage.list(config.SHIMEJI_BLOBS_DIR)).items():
+        # uploads still being written, their own request removes them
+        if path.startswith(f"{config.SHIMEJI_BLOBS_TEMP_DIR}/"):
+            continue
+        blob_files[path.rsplit("/", 1)[-1]] = (path, mtime)
+    return blob_files
+
+async def collect_garbage(grace_seconds=None):
+    """Remove blobs without references and blob files no document knows about,
+    both only once they are older than the grace period"""
+    grace_seconds = config.BLOB_GC_GRACE_SECONDS if grace_seconds is None else grace_seconds
+    collection = get_assets_db()[config.BLOBS_COLLECTION_NAME]
+    cutoff = datetime.utcnow() - timedelta(seconds=grace_seconds)
+    cutoff_ts = time.time() - grace_seconds
+
+    removed = []
+    stale = {"refs": {"$lte": 0}, "updated_at": {"$lt": cutoff}}
+    async for blob in collection.find(stale, {"_id": 1}):
+        # conditional delete, a concurrent upload may have claimed the blob again
+        result = await collection.delete_one({"_id": blob["_id"], **stale})
+        # an upload that claimed the file after the delete refreshed its modification time
+        if result.deleted_count and await storage.delete_if_older(blob_path(blob["_id"]), cutoff_ts):
+            removed.append(blob["_id"])
+
+    # files from failed uploads that never got a reference
+    orphans = []
+    blob_files = await list_blob_files()
+    known = set()
+    keys = list(blob_files.keys())
+    for i in range(0, len(keys), 1000):
+        async for blob in collection.find({"_id": {"$in": keys[i:i + 1000]}}, {"_id": 1}):
+            known.add(blob["_id"])
+    for key, (path, mtime) in blob_files.items():
+        if key not in known and mtime < cutoff_ts and await storage.delete_if_older(path, cutoff_ts):
+            orphans.append(key)
+
+    return {
+        "removed_blobs": len(removed),
+        "removed_orphans": len(orphans)
+    }
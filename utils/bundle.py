@@ -0,0 +1,102 @@
+import os
+import glob
+import json
+import uuid
+import hashlib
+import zipfile
+
+from environment import config
+from utils.functions import remove_file
+from storage.backends import storage
+from storage.urls import storage_key_from_url
+
+#============================================================================
+# Character bundles
+# A ZIP with every frame and both Shimeji XML files of a character. Frames are
+# already compressed so entries are stored, the archive is written straight to
+# the response and never held in memory.
+#============================================================================
+
+def bundle_entries(asset):
+    """(archive name, storage key) for every file of the character"""
+    more_fields = asset.get("moreFields") or {}
+    entries = []
+    for frame in more_fields.get("assets") or []:
+        key = storage_key_from_url(frame.get("url"))
+        if key:
+            entries.append((f"img/{frame['name']}{os.path.splitext(key)[1]}", key))
+    for arcname, field in (("conf/actions.xml", "actionFile"), ("conf/behaviors.xml", "behaviorFile")):
+        key = storage_key_from_url(more_fields.get(field))
+        if key:
+            entries.append((arcname, key))
+    return entries
+
+def bundle_version(entries):
+    # blob keys change with their content, so the entry list identifies the bundle
+    return hashlib.sha256(json.dumps(entries).encode()).hexdigest()[:16]
+
+def cached_bundle_path(asset_id, version):
+    return os.path.join(config.BUNDLE_CACHE_DIR, f"{asset_id}-{version}.zip")
+
+def missing_files(entries):
+    return [key for _, key in entries if not storage.exists_sync(key)]
+
+class ZipStreamBuffer:
+    """Write-only, non-seekable sink, zipfile falls back to data descriptors"""
+
+    def __init__(self):
+        self.chunks = []
+        self.offset = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.offset
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+def iter_zip(entries):
+    """Yield the ZIP archive in chunks of at most about BUNDLE_CHUNK_SIZE"""
+    buffer = ZipStreamBuffer()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as archive:
+        for arcname, key in entries:
+            # fixed timestamps keep streamed and cached bundles byte identical for resume
+            info = zipfile.ZipInfo(arcname, date_time=(1980, 1, 1, 0, 0, 0))
+            info.external_attr = 0o644 << 16
+            with storage.open_sync(key) as src, archive.open(info, "w") as dest:
+                while chunk := src.read(config.BUNDLE_CHUNK_SIZE):
+                    dest.write(chunk)
+                    yield buffer.pop()
+            yield buffer.pop()
+    yield buffer.pop()
+
+def build_cached_bundle(asset_id, version, entries):
+    """Write the bundle to the cache for range requests, older versions of the asset are removed"""
+    os.makedirs(config.BUNDLE_CACHE_DIR, exist_ok=True)
+    path = cached_bundle_path(asset_id, version)
+    if os.path.exists(path):
+        return path
+
+    temp_path = f"{path}.{uuid.uuid4().hex}.part"
+    try:
+        with open(temp_path, "wb") as f:
+            for chunk in iter_zip(entries):
+                f.write(chunk)
+        os.replace(temp_path, path)
+    except BaseException:
+        remove_file(temp_path)
+        raise
+
+    for old_path in glob.glob(os.path.join(config.BUNDLE_CACHE_DIR, f"{asset_id}-*.zip")):
+        if old_path != path:
+            remove_file(old_path)
+    return path
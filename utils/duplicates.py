@@ -0,0 +1,91 @@
+from collections import defaultdict
+
+from utils.phash import BKTree, hamming
+
+#============================================================================
+# Near duplicate report
+# Frames are indexed in a BK-tree on their pHash. A match needs both the pHash
+# and the dHash within max_distance. Matches are joined into groups with a
+# union-find, and characters sharing most of their frames are paired.
+#============================================================================
+
+def find_root(parents, i):
+    while parents[i] != i:
+        parents[i] = parents[parents[i]]
+        i = parents[i]
+    return i
+
+def find_near_duplicates(frames, max_distance, min_shared):
+    """
+    frames is a list of dicts with asset_id, asset_name, name, url, sha256, size, phash and dhash.
+    Returns the duplicate frame groups, the duplicate character pairs and the reclaimable bytes
+    """
+    tree = BKTree()
+    for i, frame in enumerate(frames):
+        tree.add(frame["phash"], i)
+
+    parents = list(range(len(frames)))
+    # matched[a][b] holds the frames of asset a that have a near duplicate in asset b
+    matched = defaultdict(lambda: defaultdict(set))
+    for i, frame in enumerate(frames):
+        for _, j in tree.search(frame["phash"], max_distance):
+            if j <= i or hamming(frame["dhash"], frames[j]["dhash"]) > max_distance:
+                continue
+            parents[find_root(parents, j)] = find_root(parents, i)
+            a, b = frame["asset_id"], frames[j]["asset_id"]
+            if a != b:
+                matched[a][b].add(i)
+                matched[b][a].add(j)
+
+    members = defaultdict(list)
+    for i in range(len(frames)):
+        members[find_root(parents, i)].append(i)
+
+    groups = []
+    reclaimable = 0
+    for indexes in members.values():
+        if len(indexes) < 2:
+            continue
+        # frames with the same sha256 already share one blob
+        blob_sizes = {frames[i]["sha256"]: frames[i]["size"] or 0 for i in indexes}
+        group_reclaimable = sum(blob_sizes.values()) - max(blob_sizes.values())
+        reclaimable += group_reclaimable
+        groups.append({
+            "frames": [
+                {key: frames[i][key] for key in ("asset_id", "asset_name", "name", "url", "size")}
+                for i in indexes
+            ],
+            "reclaimable_bytes": group_reclaimable
+        })
+    groups.sort(key=lambda group: group["reclaimable_bytes"], reverse=True)
+
+    frame_counts = defaultdict(int)
+    names = {}
+    for frame in frames:
+        frame_counts[frame["asset_id"]] += 1
+        names[frame["asset_id"]] = frame["asset_name"]
+
+    characters = []
+    for a, others in matched.items():
+        for b, shared_frames in others.items():
+            if a > b:
+                continue
+            smaller = a if frame_counts[a] <= frame_counts[b] else b
+            larger = b if smaller == a else a
+            shared = len(matched[smaller][larger]) / frame_counts[smaller]
+            if shared >= min_shared:
+                characters.append({
+                    "asset_id": smaller,
+                    "name": names[smaller],
+                    "duplicate_of": larger,
+                    "duplicate_of_name": names[larger],
+                    "shared_frames": round(shared, 3)
+                })
+    characters.sort(key=lambda pair: pair["shared_frames"], reverse=True)
+
+    return {
+        "frames_indexed": len(frames),
+        "groups": groups,
+        "characters": characters,
+        "reclaimable_bytes": reclaimable
+    }
@@ -1,26 +1,140 @@
 import os
+import uuid
+import asyncio
+import hashlib
 from environment import config
 from fastapi import HTTPException
+from inits.executors import io_pool
 
 def create_target_Assets_folders(name):
     os.makedirs(os.path.join(config.SHIMEJI_ASSETS_ORIGINAL_DIR, name.replace(" ","_").lower()), exist_ok=True)
     os.makedirs(os.path.join(config.SHIMEJI_ASSETS_THUMBNAIL_DIR, name.replace(" ","_").lower()), exist_ok=True)
 
 
+def validate_upload_sizes(files):
+    # reject on the declared sizes before anything is read or written
+    total = 0
+    for file in files:
+        if file.size is None:
+            continue
+        if file.size > config.MAX_UPLOAD_FILE_SIZE:
+            raise HTTPException(
+                status_code=413,
+                detail=f"File {file.filename} exceeds {config.MAX_UPLOAD_FILE_SIZE} bytes"
+            )
+        total += file.size
+    if total > config.MAX_UPLOAD_REQUEST_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Upload exceeds {config.MAX_UPLOAD_REQUEST_SIZE} bytes"
+        )
+
+def write_chunk(f, hasher, chunk):
+    hasher.update(chunk)
+    f.write(chunk)
+
+def remove_file(file_path):
+    try:
+        os.remove(file_path)
+    except FileNotFoundError:
+        pass
+
+async def stream_to_temp(file, temp_path):
+    """Stream an upload to temp_path in chunks, hashing while writing.
+    Disk I/O and hashing run in the I/O worker pool, returns size and sha256"""
+    hasher = hashlib.sha256()
+    size = 0
+
+    f = await io_pool.run(open, temp_path, "wb")
+    try:
+        while chunk := await file.read(config.UPLOAD_CHUNK_SIZE):
+            size += len(chunk)
+            if size > config.MAX_UPLOAD_FILE_SIZE:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"File {file.filename} exceeds {config.MAX_UPLOAD_FILE_SIZE} bytes"
+                )
+            await io_pool.run(write_chunk, f, hasher, chunk)
+        await io_pool.run(f.close)
+    except BaseException:
+        await io_pool.run(f.close)
+        await io_pool.run(remove_file, temp_path)
+        raise
+
+    return size, hasher.hexdigest()
+
+def fingerprinted_name(filename, sha256, ext=None):
+    stem, original_ext = os.path.splitext(os.path.basename(filename))
+    return f"{stem}-{sha256[:config.FINGERPRINT_LENGTH]}{ext or original_ext}"
+
+async def save_file(folder_path, file, fingerprint=False):
+    """Stream an upload to disk through a temp file that is renamed into place.
+    With fingerprint the content hash is embedded in the file name so the URL can be cached forever.
+    Returns path, size, sha256 and whether the file is new"""
+    temp_path = os.path.join(folder_path, f".{uuid.uuid4().hex}.part")
+
+    size, sha256 = await stream_to_temp(file, temp_path)
+    file_name = fingerprinted_name(file.filename, sha256) if fingerprint else os.path.basename(file.filename)
+    file_path = os.path.join(folder_path, file_name)
+    try:
+        created = not await io_pool.run(os.path.exists, file_path)
+        await io_pool.run(os.replace, temp_path, file_path)
+    except BaseException:
+        await io_pool.run(remove_file, temp_path)
+        raise
+
+    return {
+        "path": file_path,
+        "size": size,
+        "sha256": sha256,
+        "created": created
+    }
+
+async def remove_saved_files(saved_files):
+    # files that replaced an existing file are kept, the previous content is already gone
+    await asyncio.gather(*[
+        io_pool.run(remove_file, saved["path"]) for saved in saved_files if saved["created"]
+    ])
+
+async def save_files_with_rollback(jobs, parallelism=None, fingerprint=False):
+    """Save (folder_path, file) pairs concurrently with at most `parallelism` in flight.
+    If any file fails, every file created by this call is removed before raising"""
+    validate_upload_sizes([file for _, file in jobs])
+    limit = asyncio.Semaphore(parallelism or config.UPLOAD_PARALLELISM)
+
+    async def save(folder_path, file):
+        async with limit:
+            return await save_file(folder_path, file, fingerprint)
+
+    results = await asyncio.gather(
+        *[save(folder_path, file) for folder_path, file in jobs],
+        return_exceptions=True
+    )
+    errors = [result for result in results if isinstance(result, BaseException)]
+    if errors:
+        await remove_saved_files([result for result in results if not isinstance(result, BaseException)])
+        if isinstance(errors[0], HTTPException):
+            raise errors[0]
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to save files: {errors[0]}"
+        )
+    return results
 
 async def save_files_by_folder(
     folder_path,
-    files
+    files,
+    fingerprint=False
 ):
     try:
-        for file in files:
-            file_name = file.filename
-            file_path = os.path.join(folder_path, file_name)
-            with open(file_path, "wb") as f:
-                f.write(await file.read())
+        # save all files of the request concurrently
+        saved = await save_files_with_rollback([(folder_path, file) for file in files], fingerprint=fingerprint)
         return {
-            "message": f"{len(files)} files saved successfully"
+            "message": f"{len(files)} files saved successfully",
+            "files": saved
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -32,17 +146,16 @@ async def save_single_file_by_folder(
     file
 ):
     try:
-        
-        file_name = file.filename
-        file_path = os.path.join(folder_path, file_name)
-        with open(file_path, "wb") as f:
-            f.write(await file.read())
+        validate_upload_sizes([file])
+        saved = await save_file(folder_path, file)
         return {
-            "message": f"File saved successfully"
+            "message": f"File saved successfully",
+            "file": saved
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Failed to save file: {e}"
         )
-
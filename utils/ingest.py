@@ -0,0 +1,134 @@
+import asyncio
+from fastapi import HTTPException
+
+from environment import config
+from inits.executors import image_pool, io_pool
+from utils.atlas import build_atlas
+from storage.urls import storage_key_from_url
+from utils.preprocess_image import encode_frame_async
+from utils.blob_store import store_blob_data
+from utils.shimeji_config import parse_config, compile_config, ConfigError, COMPILED_VERSION
+
+#============================================================================
+# Frame ingest
+# Every uploaded frame is decoded once in the image worker pool, stored as a
+# lossless WebP original plus downscaled renditions in the blob store.
+#============================================================================
+
+async def ingest_frame(file):
+    """Returns the moreFields.assets entry for one frame and the blob keys it uses"""
+    try:
+        outputs = await encode_frame_async(file)
+    # PIL's UnidentifiedImageError is an OSError
+    except OSError as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid image {file.filename}: {e}"
+        )
+
+    stored = await asyncio.gather(*[
+        store_blob_data(output["data"], output["sha256"], f".{config.IMAGE_FORMAT}")
+        for output in outputs
+    ])
+
+    original, original_blob = outputs[0], stored[0]
+    entry = {
+        "name": file.filename.rsplit(".", 1)[0],
+        "url": original_blob["url"],
+        "sha256": original_blob["sha256"],
+        "size": original_blob["size"],
+        "width": original["width"],
+        "height": original["height"],
+        "format": config.IMAGE_FORMAT,
+        "phash": original["phash"],
+        "dhash": original["dhash"],
+        "renditions": {
+            output["label"]: {
+                "url": blob["url"],
+                "size": blob["size"],
+                "width": output["width"],
+                "height": output["height"]
+            }
+            for output, blob in zip(outputs[1:], stored[1:])
+        }
+    }
+    return entry, [blob["key"] for blob in stored]
+
+async def ingest_frames(images, parallelism=None):
+    """
+    Ingest the frames of a request with at most `parallelism` in flight. The first
+    failure cancels the frames still running, blobs the finished ones stored stay
+    unreferenced and are collected by the GC
+    """
+    limit = asyncio.Semaphore(parallelism or config.INGEST_PARALLELISM)
+
+    async def ingest(image):
+        async with limit:
+            return await ingest_frame(image)
+
+    tasks = [asyncio.create_task(ingest(image)) for image in images]
+    try:
+        results = await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    entries = [entry for entry, _ in results]
+    blob_keys = [key for _, keys in results for key in keys]
+    return entries, blob_keys
+
+async def build_character_atlas(entries):
+    """
+    Pack the original frames of moreFields.assets into a sprite atlas stored in the blob store.
+    Returns the moreFields.atlas value and its blob keys, (None, []) when no atlas can be built
+    """
+    frames = [(entry["name"], storage_key_from_url(entry.get("url"))) for entry in entries]
+    if not frames or any(key is None for _, key in frames):
+        return None, []
+
+    try:
+        atlas = await image_pool.run(build_atlas, frames)
+    except (ValueError, OSError) as e:
+        print(f"Could not build atlas: {e}")
+        return None, []
+
+    image_blob, map_blob = await asyncio.gather(
+        store_blob_data(atlas["image"], atlas["image_sha256"], f".{config.IMAGE_FORMAT}"),
+        store_blob_data(atlas["map"], atlas["map_sha256"], ".json")
+    )
+    return {
+        "url": image_blob["url"],
+        "map_url": map_blob["url"],
+        "size": image_blob["size"],
+        "width": atlas["width"],
+        "height": atlas["height"],
+        "frame_count": atlas["frame_count"]
+    }, [image_blob["key"], map_blob["key"]]
+
+async def parse_pack_configs(action_file, behavior_file):
+    """Validate the action and behavior XML of a pack before anything is stored"""
+    try:
+        return await asyncio.gather(
+            io_pool.run(parse_config, action_file.file, "actions"),
+            io_pool.run(parse_config, behavior_file.file, "behaviors")
+        )
+    except ConfigError as e:
+        raise HTTPException(
+            status_code=400,
+            detail=str(e)
+        )
+
+async def compile_pack_configs(parsed_configs, entries):
+    """
+    Compile parsed configs against the stored frames into compact JSON blobs.
+    Returns the moreFields.compiledConfig value and its blob keys
+    """
+    compiled = {"format": "json", "version": COMPILED_VERSION}
+    keys = []
+    for parsed in parsed_configs:
+        data, sha256 = await image_pool.run(compile_config, parsed, entries)
+        blob = await store_blob_data(data, sha256, ".json")
+        compiled[parsed["kind"]] = {"url": blob["url"], "size": blob["size"]}
+        keys.append(blob["key"])
+    return compiled, keys
@@ -0,0 +1,108 @@
+import functools
+from io import BytesIO
+
+from storage.backends import storage
+
+#============================================================================
+# Perceptual hashes
+# 64 bit pHash (low frequency DCT signs) and dHash (horizontal gradient signs)
+# stored as hex strings. Transparent pixels are composited on grey so the
+# hidden colour of transparent areas does not change the hash.
+#============================================================================
+
+HASH_SIZE = 8
+PHASH_SAMPLE = 32
+
+@functools.cache
+def dct_matrix(n):
+    import numpy as np
+    k = np.arange(n)
+    matrix = np.cos(np.pi * (2 * k[None, :] + 1) * k[:, None] / (2 * n))
+    matrix[0] /= np.sqrt(2)
+    return matrix * np.sqrt(2 / n)
+
+def bits_to_hex(bits):
+    import numpy as np
+    return int.from_bytes(np.packbits(bits.flatten()).tobytes(), "big").to_bytes(8, "big").hex()
+
+def grey_sample(image, size):
+    """Downsample first, then flatten transparency and convert, so no full size copy is made"""
+    from PIL import Image
+    if image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info):
+        rgba = image if image.mode == "RGBA" else image.convert("RGBA")
+        background = Image.new("RGBA", size, (128, 128, 128, 255))
+        return Image.alpha_composite(background, rgba.resize(size, Image.Resampling.BOX)).convert("L")
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    return image.resize(size, Image.Resampling.BOX).convert("L")
+
+def phash(image):
+    import numpy as np
+    dct = dct_matrix(PHASH_SAMPLE)
+    pixels = np.asarray(grey_sample(image, (PHASH_SAMPLE, PHASH_SAMPLE)), dtype=np.float64)
+    low = (dct @ pixels @ dct.T)[:HASH_SIZE, :HASH_SIZE]
+    return bits_to_hex(low > np.median(low))
+
+def dhash(image):
+    import numpy as np
+    pixels = np.asarray(grey_sample(image, (HASH_SIZE + 1, HASH_SIZE)), dtype=np.int16)
+    return bits_to_hex(pixels[:, 1:] > pixels[:, :-1])
+
+def perceptual_hashes(image):
+    return {"phash": phash(image), "dhash": dhash(image)}
+
+def hash_stored_image(key):
+    from PIL import Image
+    with Image.open(BytesIO(storage.read_sync(key))) as image:
+        return perceptual_hashes(image)
+
+def hamming(a, b):
+    return (int(a, 16) ^ int(b, 16)).bit_count()
+
+#============================================================================
+# BK-tree over Hamming distance
+# Children are keyed by their distance to the parent, the triangle inequality
+# limits a search to the children within max_distance of the query distance.
+#============================================================================
+
+class BKTree:
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, value, item):
+        """Index item under the 16 hex digit hash value"""
+        self.size += 1
+        value = int(value, 16)
+        if self.root is None:
+            self.root = [value, [item], {}]
+            return
+
+        node = self.root
+        while True:
+            distance = (node[0] ^ value).bit_count()
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [item], {}]
+                return
+            node = child
+
+    def search(self, value, max_distance):
+        """Returns [(distance, item)] for all items within max_distance"""
+        if self.root is None:
+            return []
+        value = int(value, 16)
+        found = []
+        stack = [self.root]
+        while stack:
+            node_value, items, children = stack.pop()
+            distance = (node_value ^ value).bit_count()
+            if distance <= max_distance:
+                found.extend((distance, item) for item in items)
+            for child_distance, child in children.items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        return found
@@ -1,11 +1,12 @@
-import cv2
 from environment.config import IMAGE_URL_PREFIX, STATIC_URL_PREFIX
+from inits.executors import image_pool
 
 def save_img_with_url(
     output_file,
     output_filename,
     output_filepath
 ):
+    import cv2
 
     save_success = cv2.imwrite(
         output_filepath,
@@ -19,4 +20,12 @@ def save_img_with_url(
 
     image_url = f"{IMAGE_URL_PREFIX}/{output_filename}"
 
-    return image_url
\ No newline at end of file
+    return image_url
+
+async def save_img_with_url_async(
+    output_file,
+    output_filename,
+    output_filepath
+):
+    # encoding and writing run in the image worker pool
+    return await image_pool.run(save_img_with_url, output_file, output_filename, output_filepath)
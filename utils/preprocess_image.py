@@ -1,26 +1,147 @@
+import os
 import uuid
-import cv2
-import numpy as np
+import asyncio
+import hashlib
 from io import BytesIO
+from typing import NamedTuple
+from contextlib import contextmanager
 from datetime import datetime
-from PIL import Image, ImageOps
 
-from environment.config import IMAGE_FORMAT
+from environment.config import IMAGE_FORMAT, IMAGE_RENDITIONS, IMAGE_RENDITION_QUALITY, IMAGE_WEBP_METHOD, IMAGE_UPLOAD_BUFFERS
+from inits.executors import image_pool
+from utils.phash import perceptual_hashes
 
-async def read_image(file):
-    content = await file.read()
+#============================================================================
+# Decoding
+# An upload is read once with readinto, into a shared memory block that process
+# workers map by name or into a bytearray that thread workers use directly, so
+# the compressed bytes are never pickled or copied again. Only
+# IMAGE_UPLOAD_BUFFERS uploads are buffered at a time, the others wait before
+# they are copied, so a large pack does not fill /dev/shm with queued frames.
+# PNG, JPEG and WebP are decoded by cv2.imdecode into a single array, whose BGR
+# channels are swapped in place. PIL then wraps that array without copying.
+# Other formats go through PIL.
+# cv2, NumPy and Pillow are imported where they are used, so they only load
+# in processes that decode or encode images.
+#============================================================================
+
+CV2_SIGNATURES = (b"\x89PNG\r\n\x1a\n", b"\xff\xd8\xff")
+
+def decoded_by_cv2(buffer):
+    head = bytes(buffer[:12])
+    return head.startswith(CV2_SIGNATURES) or (head[:4] == b"RIFF" and head[8:12] == b"WEBP")
+
+class SharedUpload(NamedTuple):
+    """Upload bytes in a shared memory block, sent to process workers instead of the bytes"""
+    name: str
+    size: int
+
+def read_upload(file, buffer):
+    """Fill buffer from the start of the upload, returns the number of bytes read"""
+    f = file.file
+    f.seek(0)
+    filled = 0
+    with memoryview(buffer) as view:
+        while filled < len(view):
+            count = f.readinto(view[filled:])
+            if not count:
+                break
+            filled += count
+    return filled
+
+@contextmanager
+def upload_buffer(file):
+    """Yield the contents of an upload in the form the image pool can take without another copy"""
+    f = file.file
+    size = f.seek(0, os.SEEK_END)
+    if image_pool.kind != "process":
+        buffer = bytearray(size)
+        yield memoryview(buffer)[:read_upload(file, buffer)]
+        return
+
+    from multiprocessing import shared_memory
+    # a block cannot be empty
+    block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    try:
+        yield SharedUpload(block.name, read_upload(file, block.buf[:size]))
+    finally:
+        block.close()
+        block.unlink()
+
+# (event loop, semaphore), created on first use after the fork of the worker process.
+# A semaphore belongs to one loop, a restarted app gets fresh slots
+buffer_slots = None
+
+def get_buffer_slots():
+    global buffer_slots
+    loop = asyncio.get_running_loop()
+    if buffer_slots is None or buffer_slots[0] is not loop:
+        buffer_slots = (loop, asyncio.Semaphore(IMAGE_UPLOAD_BUFFERS or image_pool.max_workers))
+    return buffer_slots[1]
+
+async def run_on_upload(func, file):
+    """Run func on the contents of an upload in the image pool"""
+    async with get_buffer_slots():
+        with upload_buffer(file) as upload:
+            return await image_pool.run(with_upload, func, upload)
+
+def with_upload(func, upload):
+    """Run func on the bytes of an upload, maps the shared memory block inside a process worker"""
+    if not isinstance(upload, SharedUpload):
+        return func(upload)
+
+    from multiprocessing import shared_memory
+    block = shared_memory.SharedMemory(name=upload.name)
+    try:
+        with block.buf[:upload.size] as view:
+            return func(view)
+    finally:
+        block.close()
 
-    image = Image.open(BytesIO(content))
-    image = ImageOps.exif_transpose(image)
-    imgae = image.convert("RGB")
+def decode_array(buffer):
+    """Decode to one writable RGB or RGBA uint8 array, alpha and EXIF orientation are kept"""
+    import cv2
+    import numpy as np
+    from PIL import Image, ImageOps, UnidentifiedImageError
 
-    return image
+    if decoded_by_cv2(buffer):
+        data = np.frombuffer(buffer, dtype=np.uint8)
+        # IMREAD_COLOR applies the EXIF orientation of JPEGs, PNG and WebP keep their alpha
+        flags = cv2.IMREAD_COLOR if bytes(buffer[:3]) == b"\xff\xd8\xff" else cv2.IMREAD_UNCHANGED
+        pixels = cv2.imdecode(data, flags)
+        del data
+        if pixels is None:
+            raise UnidentifiedImageError("cannot identify image file")
+        if pixels.dtype != np.uint8:
+            pixels = (pixels // 257).astype(np.uint8)
+        if pixels.ndim == 2:
+            return cv2.cvtColor(pixels, cv2.COLOR_GRAY2RGB)
+        if pixels.shape[2] == 4:
+            return cv2.cvtColor(pixels, cv2.COLOR_BGRA2RGBA, dst=pixels)
+        return cv2.cvtColor(pixels, cv2.COLOR_BGR2RGB, dst=pixels)
+
+    with Image.open(BytesIO(buffer)) as image:
+        image = ImageOps.exif_transpose(image)
+        return np.array(image.convert("RGBA" if has_alpha(image) else "RGB"))
+
+def decode_image(buffer):
+    from PIL import Image
+    return Image.fromarray(decode_array(buffer))
+
+async def read_image(file):
+    # decoding is CPU bound, run it in the image worker pool
+    return await run_on_upload(decode_image, file)
 
 def convert_to_cv2Image(image):
+    import cv2
+    import numpy as np
     image_array = np.array(image)
-    new_image = cv2.cvtColor(image_array, cv2.COLOR_RGB2BGR)
+    # swap the channels in place instead of allocating a second array
+    code = cv2.COLOR_RGBA2BGRA if image_array.ndim == 3 and image_array.shape[2] == 4 else cv2.COLOR_RGB2BGR
+    return cv2.cvtColor(image_array, code, dst=image_array)
 
-    return new_image
+async def convert_to_cv2Image_async(image):
+    return await image_pool.run(convert_to_cv2Image, image)
 
 def generate_unique_path(filename):
     unique_id = str(uuid.uuid4())
@@ -31,6 +152,7 @@ def generate_unique_path(filename):
     return output_file_path
 
 def create_thumbnail(image_path, output_path):
+    from PIL import Image
     with Image.open(image_path) as img:
         #1. Calculate new dimensions
         original_width, original_height = img.size
@@ -41,3 +163,46 @@ def create_thumbnail(image_path, output_path):
 
         #3. Save with compression
         img.save(output_path, IMAGE_FORMAT, optimize=True, quality=70)
+
+async def create_thumbnail_async(image_path, output_path):
+    return await image_pool.run(create_thumbnail, image_path, output_path)
+
+def has_alpha(image):
+    return image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info)
+
+def encode_webp(label, image, **options):
+    buffer = BytesIO()
+    image.save(buffer, IMAGE_FORMAT, method=IMAGE_WEBP_METHOD, **options)
+    data = buffer.getvalue()
+    return {
+        "label": label,
+        "data": data,
+        "sha256": hashlib.sha256(data).hexdigest(),
+        "width": image.width,
+        "height": image.height
+    }
+
+def encode_frame(buffer):
+    """Decode an uploaded frame once and encode a lossless WebP original plus
+    the configured downscaled renditions. Renditions not smaller than the frame are skipped.
+    The original also carries the perceptual hashes of the frame"""
+    import cv2
+    from PIL import Image
+
+    pixels = decode_array(buffer)
+    image = Image.fromarray(pixels)
+
+    outputs = [encode_webp("original", image, lossless=True, quality=100, exact=True)]
+    outputs[0].update(perceptual_hashes(image))
+    height, width = pixels.shape[:2]
+    for label, max_side in IMAGE_RENDITIONS.items():
+        if max(width, height) <= max_side:
+            continue
+        scale = max_side / max(width, height)
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        rendition = Image.fromarray(cv2.resize(pixels, size, interpolation=cv2.INTER_AREA))
+        outputs.append(encode_webp(label, rendition, quality=IMAGE_RENDITION_QUALITY))
+    return outputs
+
+async def encode_frame_async(file):
+    return await run_on_upload(encode_frame, file)
@@ -0,0 +1,153 @@
+import re
+import json
+import hashlib
+import xml.etree.ElementTree as ET
+from io import BytesIO
+
+from storage.backends import storage
+
+#============================================================================
+# Shimeji configuration compiler
+# actions.xml and behaviors.xml are parsed with a streaming iterparse into a
+# nested tree of elements. After the frames of a pack are stored, Pose image
+# references are resolved to a table of frame URLs. The tree is then written
+# as compact JSON, which clients load instead of parsing the XML.
+#============================================================================
+
+COMPILED_VERSION = 1
+ROOT_TAG = "Mascot"
+POSE_IMAGE_ATTRIBUTES = ("Image", "ImageRight")
+NUMBER = re.compile(r"^\s*-?\d+(\.\d+)?\s*$")
+XML_DECLARATION = re.compile(rb"^\s*<\?xml[^>]*encoding=[\"']([A-Za-z0-9_.-]+)[\"'][^>]*\?>")
+EXPAT_ENCODINGS = {"utf-8", "utf8", "utf-16", "utf16", "iso-8859-1", "latin-1", "latin1", "us-ascii", "ascii"}
+
+class ConfigError(ValueError):
+    pass
+
+def local_name(tag):
+    return tag.rsplit("}", 1)[-1]
+
+def parse_value(value):
+    """Numbers and "x,y" pairs become numbers, everything else stays a string"""
+    parts = value.split(",")
+    if len(parts) > 2:
+        return value
+    if not all(NUMBER.match(part) for part in parts):
+        return value
+    numbers = [float(part) if "." in part else int(part) for part in parts]
+    return numbers[0] if len(numbers) == 1 else numbers
+
+def declared_encoding(f):
+    match = XML_DECLARATION.match(f.read(256))
+    f.seek(0)
+    return match.group(1).decode("ascii").lower() if match else None
+
+def transcoded_source(f, encoding):
+    """
+    expat only knows a few encodings, old packs are often Shift_JIS. Decode with
+    the declared codec and hand the parser UTF-8 without the declaration
+    """
+    data = f.read()
+    try:
+        text = data.decode(encoding)
+    except (LookupError, UnicodeDecodeError) as e:
+        raise ConfigError(f"Cannot decode XML as {encoding}: {e}")
+    return BytesIO(XML_DECLARATION.sub(b"", text.encode("utf-8"), count=1))
+
+def build_tree(source):
+    stack = [{"children": []}]
+    for event, element in ET.iterparse(source, events=("start", "end")):
+        if event == "start":
+            node = {"tag": local_name(element.tag)}
+            if element.attrib:
+                node["attrs"] = {local_name(key): value for key, value in element.attrib.items()}
+            stack[-1].setdefault("children", []).append(node)
+            stack.append(node)
+            continue
+
+        node = stack.pop()
+        text = (element.text or "").strip()
+        if text:
+            node["text"] = text
+        # the tree keeps its own copy, free the parsed element as we go
+        element.clear()
+    return stack[0]["children"]
+
+def parse_config(f, kind):
+    """
+    Parse an actions or behaviors XML file object into {"kind", "root"}.
+    Raises ConfigError for malformed XML or a root element other than Mascot.
+    The file is rewound afterwards so it can still be stored as uploaded
+    """
+    try:
+        f.seek(0)
+        encoding = declared_encoding(f)
+        if encoding and encoding not in EXPAT_ENCODINGS:
+            roots = build_tree(transcoded_source(f, encoding))
+        else:
+            roots = build_tree(f)
+    except ET.ParseError as e:
+        raise ConfigError(f"Malformed {kind} XML: {e}")
+    finally:
+        f.seek(0)
+
+    if not roots or roots[0]["tag"] != ROOT_TAG:
+        raise ConfigError(f"{kind} XML root element must be {ROOT_TAG}")
+    return {"kind": kind, "root": roots[0]}
+
+def frame_name(image):
+    return image.rsplit("/", 1)[-1].rsplit(".", 1)[0]
+
+def compile_node(node, frame_urls, frames, frame_indexes, missing):
+    compiled = {"tag": node["tag"]}
+    attrs = {}
+    for key, value in node.get("attrs", {}).items():
+        if node["tag"] == "Pose" and key in POSE_IMAGE_ATTRIBUTES:
+            name = frame_name(value)
+            if name not in frame_urls:
+                missing.add(value)
+                attrs[key] = value
+                continue
+            if name not in frame_indexes:
+                frame_indexes[name] = len(frames)
+                frames.append(frame_urls[name])
+            attrs[key] = frame_indexes[name]
+        else:
+            attrs[key] = parse_value(value)
+    if attrs:
+        compiled["attrs"] = attrs
+    if "text" in node:
+        compiled["text"] = node["text"]
+    if node.get("children"):
+        compiled["children"] = [
+            compile_node(child, frame_urls, frames, frame_indexes, missing) for child in node["children"]
+        ]
+    return compiled
+
+def compile_config(parsed, entries):
+    """
+    Resolve Pose images of a parsed config against the moreFields.assets entries.
+    Resolved images become indexes into "frames", which lists the referenced frame URLs.
+    Unresolved ones keep their path and are listed in "missing_frames".
+    Returns the compact JSON bytes and their sha256
+    """
+    frame_urls = {}
+    for entry in entries:
+        if isinstance(entry, dict) and entry.get("name") and entry.get("url"):
+            frame_urls.setdefault(entry["name"], entry["url"])
+
+    frames = []
+    missing = set()
+    root = compile_node(parsed["root"], frame_urls, frames, {}, missing)
+    document = {
+        "version": COMPILED_VERSION,
+        "kind": parsed["kind"],
+        "frames": frames,
+        "missing_frames": sorted(missing),
+        "root": root
+    }
+    data = json.dumps(document, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    return data, hashlib.sha256(data).hexdigest()
+
+def parse_stored_config(key, kind):
+    return parse_config(BytesIO(storage.read_sync(key)), kind)
@@ -0,0 +1,94 @@
+import asyncio
+
+from environment.config import THUMBNAIL_QUALITY
+from inits.executors import image_pool
+
+#============================================================================
+# Thumbnail engine
+# Decodes each image once at reduced resolution (libjpeg draft scaling, then an
+# integer box reduce, both stopping at no less than the largest target) and
+# resizes the NumPy array with OpenCV INTER_AREA to every requested size. Batches keep the number of worker round trips low.
+#============================================================================
+
+def target_size(size, scale):
+    return (max(1, int(size[0] * scale)), max(1, int(size[1] * scale)))
+
+def decode_reduced(image_path, largest_scale):
+    """
+    Open an image decoded at no less than the largest target size.
+    Returns the image and its full size, both in display orientation
+    """
+    from PIL import Image, ImageOps
+
+    image = Image.open(image_path)
+    try:
+        full_size = image.size
+        largest = target_size(full_size, largest_scale)
+        # JPEG only: the decoder scales by 1/2, 1/4 or 1/8 and keeps at least the requested size
+        image.draft("RGB", largest)
+        # EXIF orientations 5 to 8 rotate by 90 degrees and swap width and height
+        if image.getexif().get(0x0112) in (5, 6, 7, 8):
+            full_size, largest = full_size[::-1], largest[::-1]
+        # in place, no second full size copy of the decoded pixels
+        ImageOps.exif_transpose(image, in_place=True)
+
+        # box reduce to no less than the largest target, INTER_AREA does the rest
+        factor = min(image.width // largest[0], image.height // largest[1])
+        if factor > 1:
+            reduced = image.reduce(factor)
+            image.close()
+            image = reduced
+    except BaseException:
+        image.close()
+        raise
+    return image, full_size
+
+def to_bgr_array(image):
+    import cv2
+    import numpy as np
+
+    if image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info):
+        return cv2.cvtColor(np.asarray(image.convert("RGBA")), cv2.COLOR_RGBA2BGRA)
+    return cv2.cvtColor(np.asarray(image.convert("RGB")), cv2.COLOR_RGB2BGR)
+
+def create_thumbnails(image_path, targets, quality=THUMBNAIL_QUALITY):
+    """
+    Write several thumbnails of one image from a single decode.
+    targets is a list of (output_path, scale) with scale relative to the original size.
+    Returns [(output_path, width, height)]
+    """
+    import cv2
+
+    image, full_size = decode_reduced(image_path, max(scale for _, scale in targets))
+    array = to_bgr_array(image)
+    image.close()
+
+    written = []
+    for output_path, scale in targets:
+        width, height = target_size(full_size, scale)
+        resized = cv2.resize(array, (width, height), interpolation=cv2.INTER_AREA)
+        ok, encoded = cv2.imencode(".webp", resized, [cv2.IMWRITE_WEBP_QUALITY, quality])
+        if not ok:
+            raise ValueError(f"Failed to encode thumbnail {output_path}")
+        with open(output_path, "wb") as f:
+            f.write(encoded.tobytes())
+        written.append((output_path, width, height))
+    return written
+
+def create_thumbnail_batch(jobs, quality=THUMBNAIL_QUALITY):
+    """Run create_thumbnails for [(image_path, targets)], errors are returned per image"""
+    results = []
+    for image_path, targets in jobs:
+        try:
+            results.append(create_thumbnails(image_path, targets, quality))
+        except Exception as e:
+            results.append(e)
+    return results
+
+async def create_thumbnail_batches(jobs, batch_size, quality=THUMBNAIL_QUALITY):
+    """Split jobs into batches for the image worker pool, results keep the job order"""
+    batches = [jobs[i:i + batch_size] for i in range(0, len(jobs), batch_size)]
+    batch_results = await asyncio.gather(*[
+        image_pool.run(create_thumbnail_batch, batch, quality) for batch in batches
+    ])
+    return [result for results in batch_results for result in results]
@@ -0,0 +1,25 @@
+import time
+import functools
+import inspect
+
+from fastapi.routing import APIRoute
+
+from utils.tracing import current_stages
+
+class TimedRoute(APIRoute):
+    """Marks when the endpoint returns, the time until the response starts is the encode stage"""
+
+    def __init__(self, path, endpoint, **kwargs):
+        if inspect.iscoroutinefunction(endpoint):
+            original = endpoint
+
+            @functools.wraps(original)
+            async def endpoint(*args, **kwargs):
+                try:
+                    return await original(*args, **kwargs)
+                finally:
+                    stages = current_stages.get()
+                    if stages is not None:
+                        stages.endpoint_done = time.perf_counter()
+
+        super().__init__(path, endpoint, **kwargs)
@@ -0,0 +1,81 @@
+import time
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# stage timings of the current job or request, None when nothing collects them
+current_spans = ContextVar("current_spans", default=None)
+# time per kind of work of the current request, None when nothing collects it
+current_stages = ContextVar("current_stages", default=None)
+
+# db: MongoDB commands, io and image: the worker pools, encode: response serialization
+STAGES = ("db", "io", "image", "encode")
+
+@contextmanager
+def collect_spans():
+    """Collect the spans recorded in this context, tasks started inside share the list"""
+    spans = []
+    token = current_spans.set(spans)
+    try:
+        yield spans
+    finally:
+        current_spans.reset(token)
+
+@contextmanager
+def span(name):
+    spans = current_spans.get()
+    if spans is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        spans.append({"name": name, "duration_ms": round((time.perf_counter() - start) * 1000, 2)})
+
+class StageTimes:
+    """
+    Milliseconds per stage. Concurrent work of one stage adds up, so a stage
+    can exceed the request time. MongoDB command events arrive on Motor's
+    executor threads, hence the lock
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.totals = {}
+        self.endpoint_done = None
+
+    def add(self, stage, seconds):
+        with self.lock:
+            self.totals[stage] = self.totals.get(stage, 0.0) + seconds * 1000
+
+    def finish_encode(self):
+        # everything between the endpoint returning and the response headers is serialization
+        if self.endpoint_done is not None:
+            self.add("encode", time.perf_counter() - self.endpoint_done)
+            self.endpoint_done = None
+
+    def rounded(self):
+        return {stage: round(ms, 2) for stage, ms in self.totals.items()}
+
+@contextmanager
+def collect_stages():
+    stages = StageTimes()
+    token = current_stages.set(stages)
+    try:
+        yield stages
+    finally:
+        current_stages.reset(token)
+
+def add_stage_time(stage, seconds):
+    stages = current_stages.get()
+    if stages is not None:
+        stages.add(stage, seconds)
+
+def server_timing(stages, spans, total_ms):
+    """Server-Timing header value, stages first, then the named spans of the endpoint"""
+    entries = {stage: ms for stage, ms in stages.rounded().items()}
+    for recorded in spans:
+        entries[recorded["name"]] = round(entries.get(recorded["name"], 0.0) + recorded["duration_ms"], 2)
+    entries["total"] = round(total_ms, 2)
+    return ", ".join(f"{name};dur={ms}" for name, ms in entries.items())
@@ -0,0 +1,334 @@
+import os
+import re
+import json
+import time
+import uuid
+import shutil
+import asyncio
+import hashlib
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from fastapi import HTTPException
+from pymongo import ReturnDocument
+
+from environment import config
+from database.database_config import get_assets_db
+from inits.executors import io_pool
+from utils.functions import write_chunk, remove_file
+
+#============================================================================
+# Resumable upload sessions
+# uploads/<upload_id>/manifest.json describes the pack, every file is received
+# into uploads/<upload_id>/<file_id>.part. The size of a part on disk is the
+# offset the client resumes from, so sessions survive restarts.
+# A state document in MongoDB coordinates the workers: a chunk claims its part
+# while the session is open, finalize claims the session once no part is being
+# written, and a finalized session keeps its result for repeated calls.
+#============================================================================
+
+UPLOAD_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+def session_dir(upload_id):
+    if not UPLOAD_ID_PATTERN.match(upload_id):
+        raise HTTPException(
+            status_code=404,
+            detail="Upload session not found"
+        )
+    return os.path.join(config.UPLOAD_SESSIONS_DIR, upload_id)
+
+def part_path(upload_id, file_id):
+    return os.path.join(session_dir(upload_id), f"{file_id}.part")
+
+def get_size(path):
+    try:
+        return os.path.getsize(path)
+    except FileNotFoundError:
+        return 0
+
+def write_manifest(upload_id, manifest):
+    directory = session_dir(upload_id)
+    os.makedirs(directory, exist_ok=True)
+    temp_path = os.path.join(directory, "manifest.json.part")
+    with open(temp_path, "w") as f:
+        json.dump(manifest, f)
+    os.replace(temp_path, os.path.join(directory, "manifest.json"))
+
+def read_manifest(upload_id):
+    try:
+        with open(os.path.join(session_dir(upload_id), "manifest.json")) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    for file_id, file in enumerate(manifest["files"]):
+        file["file_id"] = str(file_id)
+        file["received"] = get_size(part_path(upload_id, file_id))
+    return manifest
+
+def remove_session(upload_id):
+    shutil.rmtree(session_dir(upload_id), ignore_errors=True)
+
+def expire_sessions():
+    if not os.path.isdir(config.UPLOAD_SESSIONS_DIR):
+        return 0
+    cutoff = time.time() - config.UPLOAD_SESSION_TTL_SECONDS
+    expired = 0
+    for upload_id in os.listdir(config.UPLOAD_SESSIONS_DIR):
+        if not UPLOAD_ID_PATTERN.match(upload_id):
+            continue
+        manifest = read_manifest(upload_id)
+        if manifest is None or manifest["created_at"] < cutoff:
+            remove_session(upload_id)
+            expired += 1
+    return expired
+
+def hash_file(path):
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(config.UPLOAD_CHUNK_SIZE):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+async def create_session(session):
+    files = [file.model_dump() for file in session.files]
+    if not any(file["field"] == "images" for file in files):
+        raise HTTPException(
+            status_code=400,
+            detail="At least one image is required"
+        )
+    for field in ("thumbnail", "actionFile", "behaviorFile"):
+        if sum(1 for file in files if file["field"] == field) != 1:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Exactly one {field} is required"
+            )
+    for file in files:
+        if file["size"] > config.MAX_UPLOAD_FILE_SIZE:
+            raise HTTPException(
+                status_code=413,
+                detail=f"File {file['filename']} exceeds {config.MAX_UPLOAD_FILE_SIZE} bytes"
+            )
+    if sum(file["size"] for file in files) > config.MAX_UPLOAD_SESSION_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Upload exceeds {config.MAX_UPLOAD_SESSION_SIZE} bytes"
+        )
+
+    await io_pool.run(expire_sessions)
+
+    upload_id = uuid.uuid4().hex
+    manifest = {
+        "upload_id": upload_id,
+        "categoryId": session.categoryId,
+        "categoryName": session.categoryName,
+        "characterName": session.characterName,
+        "created_at": time.time(),
+        "files": files
+    }
+    await io_pool.run(write_manifest, upload_id, manifest)
+    await ensure_session_state(upload_id)
+    return await get_session(upload_id)
+
+async def get_session(upload_id):
+    manifest = await io_pool.run(read_manifest, upload_id)
+    if manifest is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Upload session not found"
+        )
+    return manifest
+
+async def receive_chunk(upload_id, file_id, offset, stream, chunk_sha256=None):
+    """Append a request body to a part at `offset`, which must be the bytes received so far.
+    An optional chunk checksum is verified and a failed chunk is truncated away again"""
+    manifest = await get_session(upload_id)
+    if not file_id.isdigit() or int(file_id) >= len(manifest["files"]):
+        raise HTTPException(
+            status_code=404,
+            detail="File not found in upload session"
+        )
+    file = manifest["files"][int(file_id)]
+    path = part_path(upload_id, file_id)
+
+    await claim_part(upload_id, file_id)
+    try:
+        current = await io_pool.run(get_size, path)
+        if offset != current:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Offset mismatch, {current} bytes received so far"
+            )
+
+        hasher = hashlib.sha256()
+        received = current
+        f = await io_pool.run(open, path, "ab")
+        try:
+            async for chunk in stream:
+                if not chunk:
+                    continue
+                received += len(chunk)
+                if received > file["size"]:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"Chunk exceeds the declared size of {file['filename']}"
+                    )
+                await io_pool.run(write_chunk, f, hasher, chunk)
+            if chunk_sha256 and hasher.hexdigest() != chunk_sha256.lower():
+                raise HTTPException(
+                    status_code=400,
+                    detail="Chunk checksum mismatch"
+                )
+            await io_pool.run(f.close)
+        except BaseException:
+            await io_pool.run(f.close)
+            await io_pool.run(os.truncate, path, current)
+            raise
+    finally:
+        await release_part(upload_id, file_id)
+
+    return {
+        "file_id": file_id,
+        "offset": received,
+        "complete": received == file["size"]
+    }
+
+async def verify_session(manifest):
+    """All parts complete and matching their declared checksums, corrupt parts are reset"""
+    incomplete = [file["file_id"] for file in manifest["files"] if file["received"] != file["size"]]
+    if incomplete:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Files not complete: {', '.join(incomplete)}"
+        )
+
+    upload_id = manifest["upload_id"]
+    files = [file for file in manifest["files"] if file.get("sha256")]
+    digests = await asyncio.gather(*[
+        io_pool.run(hash_file, part_path(upload_id, file["file_id"])) for file in files
+    ])
+    corrupt = [file["file_id"] for file, digest in zip(files, digests) if digest != file["sha256"]]
+    if corrupt:
+        for file_id in corrupt:
+            await io_pool.run(remove_file, part_path(upload_id, file_id))
+        raise HTTPException(
+            status_code=400,
+            detail=f"Checksum mismatch, upload again: {', '.join(corrupt)}"
+        )
+
+#============================================================================
+# Session state
+#============================================================================
+
+def sessions_collection():
+    return get_assets_db()[config.UPLOAD_SESSIONS_COLLECTION_NAME]
+
+async def ensure_session_state(upload_id):
+    # sessions created before the state document existed get one on first use
+    await sessions_collection().update_one(
+        {"_id": upload_id},
+        {
+            "$setOnInsert": {
+                "state": "open",
+                "writing": {},
+                "finalizing_until": None,
+                # add_assets inserts under this id, a finalize that is taken over cannot add a second asset
+                "asset_id": ObjectId(),
+                "result": None,
+                "created_at": datetime.utcnow()
+            }
+        },
+        upsert=True
+    )
+
+async def claim_part(upload_id, file_id):
+    """Mark a part as being written, only while the session is open and nobody else writes it"""
+    await ensure_session_state(upload_id)
+    now = datetime.utcnow()
+    field = f"writing.{file_id}"
+    claimed = await sessions_collection().find_one_and_update(
+        {
+            "_id": upload_id,
+            "state": "open",
+            "$or": [
+                {field: {"$exists": False}},
+                {field: {"$lt": now - timedelta(seconds=config.UPLOAD_WRITER_TIMEOUT_SECONDS)}}
+            ]
+        },
+        {"$set": {field: now}}
+    )
+    if claimed is None:
+        session = await sessions_collection().find_one({"_id": upload_id}, {"state": 1})
+        if session is not None and session["state"] != "open":
+            raise HTTPException(
+                status_code=409,
+                detail=f"Upload session is {session['state']}"
+            )
+        raise HTTPException(
+            status_code=409,
+            detail="File is being written by another request"
+        )
+
+async def release_part(upload_id, file_id):
+    await sessions_collection().update_one(
+        {"_id": upload_id},
+        {"$unset": {f"writing.{file_id}": ""}}
+    )
+
+async def claim_finalize(upload_id):
+    """
+    Move an open session without active writers to finalizing and return its
+    state document. A finalized session is returned as is
+    """
+    session_dir(upload_id)
+    await ensure_session_state(upload_id)
+    now = datetime.utcnow()
+    session = await sessions_collection().find_one({"_id": upload_id})
+    if session["state"] == "finalized":
+        return session
+    if session["state"] == "finalizing" and session["finalizing_until"] > now:
+        raise HTTPException(
+            status_code=409,
+            detail="Upload session is being finalized"
+        )
+    writer_cutoff = now - timedelta(seconds=config.UPLOAD_WRITER_TIMEOUT_SECONDS)
+    if any(claimed_at > writer_cutoff for claimed_at in session["writing"].values()):
+        raise HTTPException(
+            status_code=409,
+            detail="Files are still being uploaded"
+        )
+
+    # the claim only succeeds if no chunk claimed a part since the read above
+    claimed = await sessions_collection().find_one_and_update(
+        {
+            "_id": upload_id,
+            "state": session["state"],
+            "writing": session["writing"],
+            "finalizing_until": session["finalizing_until"]
+        },
+        {
+            "$set": {
+                "state": "finalizing",
+                "finalizing_until": now + timedelta(seconds=config.UPLOAD_FINALIZE_TIMEOUT_SECONDS)
+            }
+        },
+        return_document=ReturnDocument.AFTER
+    )
+    if claimed is None:
+        raise HTTPException(
+            status_code=409,
+            detail="Upload session changed during finalize, retry"
+        )
+    return claimed
+
+async def release_finalize(upload_id):
+    # a failed finalize leaves the session open so missing or corrupt parts can be sent again
+    await sessions_collection().update_one(
+        {"_id": upload_id, "state": "finalizing"},
+        {"$set": {"state": "open", "finalizing_until": None}}
+    )
+
+async def complete_finalize(upload_id, result):
+    await sessions_collection().update_one(
+        {"_id": upload_id},
+        {"$set": {"state": "finalized", "finalizing_until": None, "result": result}}
+    )